@@ -0,0 +1,354 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+# Presupuesto de tamaño por defecto para la caché en disco (1 GB)
+DEFAULT_BUDGET_MB = 1024
+
+# Al superar el presupuesto se desalojan entradas hasta quedar en este porcentaje
+EVICTION_TARGET = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_key TEXT PRIMARY KEY,
+    has_signature INTEGER NOT NULL,
+    thumbnail BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used);
+CREATE TABLE IF NOT EXISTS documents (
+    doc_key TEXT PRIMARY KEY,
+    page_keys TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    doc_key TEXT PRIMARY KEY,
+    page_keys TEXT NOT NULL,
+    completed BLOB NOT NULL,
+    verdicts BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache_dir():
+    """Directory of the persistent cache (PDF_ANALYSIS_CACHE_DIR or ~/.cache/divisor_pdf)"""
+    return os.environ.get(
+        "PDF_ANALYSIS_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "divisor_pdf"),
+    )
+
+
+def feature_path(doc_key, cache_dir=None):
+    """
+    Location of the feature records of a document (see feature_store.py)
+
+    The file lives next to the analysis cache and is named after the
+    document key, so it is tied to the detector version and render zoom,
+    and it is deleted when the document is evicted from the cache.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    name = doc_key.replace(":", "_") + ".npy"
+    return os.path.join(cache_dir, "features", name)
+
+
+def get_default_cache():
+    """
+    Return the process-wide analysis cache, creating it on first use
+
+    The size budget is read from PDF_ANALYSIS_CACHE_MB.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            budget_mb = DEFAULT_BUDGET_MB
+            configured = os.environ.get("PDF_ANALYSIS_CACHE_MB")
+            if configured:
+                try:
+                    budget_mb = int(configured)
+                except ValueError:
+                    print(f"Valor inválido en PDF_ANALYSIS_CACHE_MB: {configured}")
+            _default_cache = AnalysisCache(default_cache_dir(), budget_bytes=budget_mb * 1024 * 1024)
+        return _default_cache
+
+
+class AnalysisCache:
+    """
+    Persistent, content-addressed cache of page analysis results
+
+    Each page is stored under a key made from the detector version, the
+    render zoom and a hash of the page content, together with its
+    ``detect_split_points`` verdict and the encoded thumbnail. A
+    document-level entry, keyed by the hash of the whole file, lists the
+    page keys so that a repeated upload is answered without touching the
+    PDF at all. Entries are evicted least-recently-used first when the
+    total size of the thumbnails and of the documents' feature files
+    exceeds the budget; a feature file is deleted with its document.
+    Documents being analyzed (see ``hold_document``) keep their checkpoint
+    and feature file until the analysis ends.
+    """
+
+    def __init__(self, cache_dir, budget_bytes=DEFAULT_BUDGET_MB * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Directory holding the SQLite database
+            budget_bytes: Maximum total size of the stored thumbnails and
+                feature files
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, "analysis_cache.sqlite3")
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._held = Counter()  # documentos en análisis: no se desalojan
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def page_key(page_hash, detector_version, zoom):
+        """Build the cache key of a page from its content hash and the analysis settings"""
+        return f"{detector_version}:{zoom}:{page_hash}"
+
+    @staticmethod
+    def document_key(doc_hash, detector_version, zoom):
+        """Build the cache key of a whole document from its file hash and the analysis settings"""
+        return f"{detector_version}:{zoom}:{doc_hash}"
+
+    def get_document(self, doc_key):
+        """
+        Look up a whole document
+
+        Returns:
+            List of page keys in page order, or None if the document is unknown
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_keys FROM documents WHERE doc_key = ?", (doc_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE documents SET last_used = ? WHERE doc_key = ?", (time.time(), doc_key)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put_document(self, doc_key, page_keys):
+        """Record the page keys of a fully analyzed document"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_key, page_keys, last_used) VALUES (?, ?, ?)",
+                (doc_key, json.dumps(page_keys), time.time()),
+            )
+            self._conn.commit()
+
+    def get_checkpoint(self, doc_key):
+        """
+        Look up the checkpoint of a partially analyzed document
+
+        Returns:
+            Dict with ``page_keys`` (list), ``completed`` and ``verdicts``
+            (NumPy boolean arrays, one entry per page), or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_keys, completed, verdicts FROM checkpoints WHERE doc_key = ?", (doc_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        page_keys = json.loads(row[0])
+        total_pages = len(page_keys)
+        return {
+            "page_keys": page_keys,
+            "completed": np.unpackbits(np.frombuffer(row[1], dtype=np.uint8), count=total_pages).astype(bool),
+            "verdicts": np.unpackbits(np.frombuffer(row[2], dtype=np.uint8), count=total_pages).astype(bool),
+        }
+
+    def put_checkpoint(self, doc_key, page_keys, completed, verdicts):
+        """
+        Record the progress of a document that is still being analyzed
+
+        The page keys are only written the first time; later checkpoints
+        just replace the two bit arrays (one bit per page).
+
+        Args:
+            doc_key: Key of the document
+            page_keys: List of page keys in page order
+            completed: NumPy boolean array, True for the pages already analyzed
+            verdicts: NumPy boolean array with the split verdict of each page
+        """
+        completed_bits = np.packbits(completed).tobytes()
+        verdict_bits = np.packbits(verdicts).tobytes()
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE checkpoints SET completed = ?, verdicts = ?, last_used = ? WHERE doc_key = ?",
+                (completed_bits, verdict_bits, now, doc_key),
+            ).rowcount
+            if not updated:
+                self._conn.execute(
+                    "INSERT INTO checkpoints (doc_key, page_keys, completed, verdicts, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (doc_key, json.dumps(page_keys), completed_bits, verdict_bits, now),
+                )
+            self._conn.commit()
+
+    def hold_document(self, doc_key):
+        """
+        Protect a document from eviction while it is being analyzed
+
+        Its checkpoint and feature file (open as a memmap by the analysis)
+        are kept until ``release_document`` is called as many times.
+        """
+        with self._lock:
+            self._held[doc_key] += 1
+
+    def release_document(self, doc_key):
+        """End a ``hold_document``; the document can be evicted again"""
+        with self._lock:
+            self._held[doc_key] -= 1
+            if self._held[doc_key] <= 0:
+                del self._held[doc_key]
+
+    def delete_checkpoint(self, doc_key):
+        """Forget the checkpoint of a document (once it is fully analyzed)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE doc_key = ?", (doc_key,))
+            self._conn.commit()
+
+    def get_pages(self, page_keys):
+        """
+        Look up several pages at once
+
+        Args:
+            page_keys: Iterable of page keys
+
+        Returns:
+            Dict {page_key: (has_signature, thumbnail_bytes)} with the keys found
+        """
+        page_keys = list(dict.fromkeys(page_keys))
+        found = {}
+        with self._lock:
+            # SQLite limita el número de parámetros por consulta
+            for i in range(0, len(page_keys), 500):
+                batch = page_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT page_key, has_signature, thumbnail FROM pages WHERE page_key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for page_key, has_signature, thumbnail in rows:
+                    found[page_key] = (bool(has_signature), thumbnail)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE pages SET last_used = ? WHERE page_key = ?",
+                    [(now, page_key) for page_key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_pages(self, entries):
+        """
+        Store analysis results for several pages
+
+        Args:
+            entries: List of tuples (page_key, has_signature, thumbnail_bytes)
+        """
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (page_key, has_signature, thumbnail, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (page_key, int(bool(has_signature)), thumbnail, len(thumbnail), now)
+                    for page_key, has_signature, thumbnail in entries
+                ],
+            )
+            self._conn.commit()
+            self._evict()
+
+    def feature_path(self, doc_key):
+        """Location of the feature records of a document in this cache"""
+        return feature_path(doc_key, self.cache_dir)
+
+    def _feature_bytes(self):
+        """Total size of the feature files"""
+        try:
+            entries = list(os.scandir(os.path.join(self.cache_dir, "features")))
+        except FileNotFoundError:
+            return 0
+        total = 0
+        for entry in entries:
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def total_bytes(self):
+        """Total size counted against the budget (thumbnails and feature files)"""
+        with self._lock:
+            thumbnails = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        return thumbnails + self._feature_bytes()
+
+    def _evict(self):
+        """Delete least recently used pages until the cache is below its budget"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        total += self._feature_bytes()
+        if total <= self.budget_bytes:
+            return
+        target = self.budget_bytes * EVICTION_TARGET
+        to_delete = []
+        for page_key, size in self._conn.execute("SELECT page_key, size FROM pages ORDER BY last_used"):
+            if total <= target:
+                break
+            to_delete.append((page_key,))
+            total -= size
+        self._conn.executemany("DELETE FROM pages WHERE page_key = ?", to_delete)
+        # Los documentos con páginas desalojadas se resuelven página a página
+        # (si no queda ninguna página, se desalojan todos salvo los que se
+        # están analizando)
+        oldest = self._conn.execute("SELECT MIN(last_used) FROM pages").fetchone()[0]
+        if oldest is None:
+            oldest = float("inf")
+        evicted = [
+            (doc_key,) for (doc_key,) in self._conn.execute(
+                "SELECT doc_key FROM documents WHERE last_used < ? "
+                "UNION SELECT doc_key FROM checkpoints WHERE last_used < ?",
+                (oldest, oldest),
+            )
+            if doc_key not in self._held
+        ]
+        self._conn.executemany("DELETE FROM documents WHERE doc_key = ?", evicted)
+        self._conn.executemany("DELETE FROM checkpoints WHERE doc_key = ?", evicted)
+        self._conn.commit()
+        # Sus características se recalculan si el documento vuelve a analizarse
+        for (doc_key,) in evicted:
+            try:
+                os.remove(self.feature_path(doc_key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Remove every entry from the cache"""
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM checkpoints")
+            self._conn.commit()
+        # Registros de características de los documentos (ver feature_store.py)
+        shutil.rmtree(os.path.join(self.cache_dir, "features"), ignore_errors=True)
@@ -0,0 +1,560 @@
+import heapq
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import fitz
+import numpy as np
+
+from pdf_processor import PDFProcessor, pixmap_as_array
+from image_analyzer import (
+    extract_page_features,
+    suggest_from_features,
+    analysis_clip_row,
+    classify_text_layer,
+    page_fingerprint,
+    DETECTOR_VERSION,
+    FEATURE_SOURCE_FIXED,
+    FEATURE_SOURCE_NONE,
+)
+from feature_store import open_features
+from thumbnail_store import THUMBNAIL_QUALITY
+import metrics
+
+# Número de páginas que cada proceso analiza por tarea
+DEFAULT_CHUNK_SIZE = 8
+
+# Por debajo de este número de páginas no compensa arrancar procesos
+MIN_PAGES_FOR_POOL = 16
+
+# Resultados que se acumulan antes de escribirlos en la caché persistente
+CACHE_WRITE_BATCH = 64
+
+# Tiempo máximo entre dos checkpoints del análisis en curso (segundos)
+CHECKPOINT_SECONDS = 5.0
+
+# Zoom del renderizado del que sale la huella de cada página: el dHash
+# cambia con el zoom, así que todas las páginas (por imagen, por capa de
+# texto o de la caché) usan el mismo, y uno bajo para que sea barato
+FINGERPRINT_ZOOM = 0.1
+
+# Los procesos del pool no se crean con fork: el análisis se lanza desde
+# hilos (Streamlit, planificador) y el proceso hijo heredaría cerrojos
+# tomados por otros hilos en el momento de la copia
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# Documento abierto por cada proceso del pool (uno por proceso)
+_worker_processor = None
+
+# Registros de características del documento, compartidos por todos los procesos
+_worker_features = None
+
+
+def default_worker_count():
+    """
+    Number of analysis processes to use when none is configured
+
+    Reads the PDF_ANALYSIS_WORKERS environment variable and falls back to
+    the number of available CPU cores.
+    """
+    configured = os.environ.get("PDF_ANALYSIS_WORKERS")
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            print(f"Valor inválido en PDF_ANALYSIS_WORKERS: {configured}")
+    return os.cpu_count() or 1
+
+
+def render_page_fingerprint(processor, page_idx):
+    """
+    Fingerprint of one page (see ``page_fingerprint``) from a render at
+    FINGERPRINT_ZOOM, so every page of every document is comparable
+
+    Args:
+        processor: PDFProcessor with the document open
+        page_idx: Page index (0-based)
+
+    Returns:
+        NumPy uint64
+    """
+    with metrics.timed("pdf_detector_stage_seconds", detector="features", stage="fingerprint"):
+        pix, gray = processor.get_page_gray(page_idx, FINGERPRINT_ZOOM)
+        return page_fingerprint(gray)
+
+
+def render_page_features(processor, page_idx, zoom=0.5, params=None, check_stamps=False):
+    """
+    Render one page, encode its thumbnail and measure its detector features
+
+    The page is rendered once at the thumbnail zoom (see
+    ``PDFProcessor.get_render_zoom``) for the JPEG thumbnail. Every
+    detector stage reads only the lower part of the page (from
+    ``analysis_clip_row``): when the thumbnail zoom is the detection zoom
+    the features come from the same render; otherwise (large documents,
+    whose thumbnails use a lower zoom) only that part is rendered again at
+    the detection zoom. Either way the record is the same as for a
+    whole-page render at the detection zoom. The fingerprint comes from
+    ``render_page_fingerprint``.
+
+    Args:
+        processor: PDFProcessor with the document open
+        page_idx: Page index (0-based)
+        zoom: Zoom factor for detection
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS
+        check_stamps: Always run the stamp stage
+
+    Returns:
+        Tuple (record, thumbnail_bytes): NumPy record of dtype
+        FEATURE_DTYPE and the JPEG thumbnail
+    """
+    pix = processor.get_page_pixmap(page_idx, zoom)
+    thumbnail = pix.tobytes("jpg", jpg_quality=THUMBNAIL_QUALITY)
+    metrics.inc("pdf_thumbnail_bytes_total", len(thumbnail))
+
+    if processor.get_render_zoom(zoom) == zoom:
+        gray_pix = fitz.Pixmap(fitz.csGRAY, pix)
+        del pix
+        record = extract_page_features(pixmap_as_array(gray_pix), params, check_stamps=check_stamps)
+    else:
+        del pix
+        width, height = processor.get_page_pixel_size(page_idx, zoom)
+        # Una fila antes del borde de tesela: el redondeo del recorte nunca
+        # deja fuera filas necesarias
+        top = max(0, analysis_clip_row(height, width, params) - 1) / height
+        region_pix, region, offset, page_height = processor.get_page_region_gray(page_idx, top=top,
+                                                                                 zoom=zoom)
+        record = extract_page_features(region, params, check_stamps=check_stamps, offset=offset,
+                                       page_height=page_height)
+    record["fingerprint"] = render_page_fingerprint(processor, page_idx)
+    record["has_fingerprint"] = True
+    return record, thumbnail
+
+
+def analyze_page(processor, page_idx, zoom=0.5, text_first=True, features=None, params=None):
+    """
+    Decide whether one page is a suggested split point
+
+    The text layer is checked first; the page is only rasterized and run
+    through the image detector when the text stage cannot decide. Pages
+    decided by their text layer get no thumbnail here: the viewer renders
+    them when they are shown. Their record still gets the page
+    fingerprint, from a render at FINGERPRINT_ZOOM.
+
+    Args:
+        processor: PDFProcessor with the document open
+        page_idx: Page index (0-based)
+        zoom: Zoom factor for detection (see ``render_page_features``)
+        text_first: Try the text-layer stage before rasterizing
+        features: Optional FEATURE_DTYPE array (e.g. a FeatureStore memmap)
+            where the page's feature record is written
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS
+
+    Returns:
+        Tuple (thumbnail_bytes, has_signature, stage): the JPEG thumbnail
+        (None if the page was not rasterized) and the stage that decided,
+        ``"text"`` or ``"raster"``
+    """
+    if text_first:
+        with metrics.timed("pdf_page_analysis_seconds", stage="text"):
+            verdict = classify_text_layer(processor.get_page_layout(page_idx))
+        if verdict is not None:
+            metrics.inc("pdf_pages_analyzed_total", stage="text")
+            if features is not None:
+                features["source"][page_idx] = FEATURE_SOURCE_FIXED
+                features["fixed_verdict"][page_idx] = verdict
+                features["fingerprint"][page_idx] = render_page_fingerprint(processor, page_idx)
+                features["has_fingerprint"][page_idx] = True
+            return None, verdict, "text"
+
+    started = time.perf_counter()
+    try:
+        # Se guardan las medidas del detector para poder reajustar los
+        # umbrales después sin volver a renderizar
+        record, thumbnail = render_page_features(processor, page_idx, zoom, params)
+        has_signature = suggest_from_features(record, params)
+        if features is not None:
+            features[page_idx] = record
+    except Exception as e:
+        print(f"Error al analizar página {page_idx}: {str(e)}")
+        metrics.inc("pdf_pages_analyzed_total", stage="error")
+        return None, False, "raster"
+    metrics.observe("pdf_page_analysis_seconds", time.perf_counter() - started, stage="raster")
+    metrics.inc("pdf_pages_analyzed_total", stage="raster")
+    return thumbnail, bool(has_signature), "raster"
+
+
+def _init_worker(pdf_path, feature_path=None):
+    """Open a private copy of the document (and the feature file) in each worker process"""
+    global _worker_processor, _worker_features
+    _worker_processor = PDFProcessor(pdf_path, use_mmap=True)
+    # Cada proceso escribe filas distintas del mismo archivo proyectado
+    _worker_features = open_features(feature_path) if feature_path else None
+
+
+def _analyze_pages(task):
+    """
+    Analyze a group of pages inside a worker process
+
+    Returns:
+        Tuple (results, metrics_snapshot); the metrics recorded by the
+        worker are handed to the parent process and reset
+    """
+    page_indices, zoom = task
+    results = []
+    for page_idx in page_indices:
+        thumbnail, has_signature, stage = analyze_page(_worker_processor, page_idx, zoom,
+                                                       features=_worker_features)
+        results.append((page_idx, has_signature, thumbnail, stage))
+    if _worker_features is not None:
+        _worker_features.flush()
+    return results, metrics.collect(reset=True)
+
+
+def iter_page_analysis(pdf_path, total_pages, workers=None, zoom=0.5,
+                       chunk_size=DEFAULT_CHUNK_SIZE, pages=None, feature_path=None):
+    """
+    Analyze the pages of a PDF using a pool of processes
+
+    Each worker opens its own fitz document and processes groups of
+    ``chunk_size`` pages. Results are yielded in page order as soon as
+    they are available, so callers can update a progress bar per page.
+
+    Args:
+        pdf_path: Path to the PDF file on disk
+        total_pages: Number of pages in the document
+        workers: Number of processes (None = PDF_ANALYSIS_WORKERS or all cores)
+        zoom: Zoom factor for detection
+        chunk_size: Pages per task sent to a worker
+        pages: Ascending list of page indices to analyze (None = all pages)
+        feature_path: Optional feature file (see FeatureStore) where each
+            page's detector features are written
+
+    Yields:
+        Tuples (page_idx, has_signature, thumbnail_bytes, stage) in ascending
+        page order (see ``analyze_page``)
+    """
+    if pages is None:
+        pages = list(range(total_pages))
+    if not pages:
+        return
+    if workers is None:
+        workers = default_worker_count()
+    workers = max(1, min(workers, len(pages)))
+
+    # Pocas páginas o un solo proceso: análisis secuencial en este proceso
+    if workers == 1 or len(pages) < MIN_PAGES_FOR_POOL:
+        processor = PDFProcessor(pdf_path, use_mmap=True)
+        features = open_features(feature_path) if feature_path else None
+        try:
+            for page_idx in pages:
+                thumbnail, has_signature, stage = analyze_page(processor, page_idx, zoom,
+                                                               features=features)
+                yield page_idx, has_signature, thumbnail, stage
+        finally:
+            processor.close()
+            if features is not None:
+                features.flush()
+        return
+
+    tasks = [
+        (pages[start:start + chunk_size], zoom)
+        for start in range(0, len(pages), chunk_size)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=_init_worker,
+                             initargs=(pdf_path, feature_path)) as executor:
+        # map() conserva el orden y entrega cada grupo en cuanto termina
+        for results, worker_metrics in executor.map(_analyze_pages, tasks):
+            metrics.merge(worker_metrics)
+            for result in results:
+                yield result
+
+
+def _nearest_chunk(remaining, focus, chunk_size):
+    """
+    Take the ``chunk_size`` pages closest to ``focus`` out of ``remaining``
+
+    Args:
+        remaining: Sorted list of page indices not yet scheduled (modified)
+        focus: Page index the reviewer is looking at
+        chunk_size: Maximum number of pages to take
+
+    Returns:
+        Sorted list of page indices
+    """
+    nearest = heapq.nsmallest(chunk_size, remaining, key=lambda page_idx: (abs(page_idx - focus), page_idx))
+    taken = set(nearest)
+    remaining[:] = [page_idx for page_idx in remaining if page_idx not in taken]
+    return sorted(nearest)
+
+
+def iter_prioritized_page_analysis(pdf_path, pages, get_focus, workers=None, zoom=0.5,
+                                   chunk_size=DEFAULT_CHUNK_SIZE, should_stop=None,
+                                   feature_path=None):
+    """
+    Analyze pages closest to a moving focus page first
+
+    Work is handed out one group at a time: whenever a group finishes, the
+    next one is chosen among the remaining pages by its distance to the
+    current value of ``get_focus()``, so navigating the viewer reorders
+    the pages still pending.
+
+    Args:
+        pdf_path: Path to the PDF file on disk
+        pages: Page indices to analyze
+        get_focus: Callable returning the page index (0-based) to favour
+        workers: Number of processes (None = PDF_ANALYSIS_WORKERS or all cores)
+        zoom: Zoom factor for detection
+        chunk_size: Pages per task sent to a worker
+        should_stop: Optional callable; analysis stops as soon as it returns True
+        feature_path: Optional feature file (see FeatureStore) where each
+            page's detector features are written
+
+    Yields:
+        Tuples (page_idx, has_signature, thumbnail_bytes, stage) in
+        completion order (see ``analyze_page``)
+    """
+    remaining = sorted(pages)
+    if not remaining:
+        return
+    if workers is None:
+        workers = default_worker_count()
+    workers = max(1, min(workers, len(remaining)))
+    if should_stop is None:
+        should_stop = lambda: False
+
+    # Un solo proceso: página a página, siempre la más cercana al foco
+    if workers == 1 or len(remaining) < MIN_PAGES_FOR_POOL:
+        processor = PDFProcessor(pdf_path, use_mmap=True)
+        features = open_features(feature_path) if feature_path else None
+        try:
+            while remaining and not should_stop():
+                page_idx = _nearest_chunk(remaining, get_focus(), 1)[0]
+                thumbnail, has_signature, stage = analyze_page(processor, page_idx, zoom,
+                                                               features=features)
+                yield page_idx, has_signature, thumbnail, stage
+        finally:
+            processor.close()
+            if features is not None:
+                features.flush()
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT,
+                                   initializer=_init_worker, initargs=(pdf_path, feature_path))
+    try:
+        running = set()
+        while remaining or running:
+            # Mantener un grupo en curso por proceso, elegido según el foco actual
+            while remaining and len(running) < workers and not should_stop():
+                chunk = _nearest_chunk(remaining, get_focus(), chunk_size)
+                running.add(executor.submit(_analyze_pages, (chunk, zoom)))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results, worker_metrics = future.result()
+                metrics.merge(worker_metrics)
+                yield from results
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class AnalysisCheckpointer:
+    """
+    Write analysis results to the persistent cache while a document is analyzed
+
+    Results are written in batches together with a compact checkpoint of
+    the document (one bit per page for "analyzed" and one for the
+    verdict), so an interrupted run resumes from the pages already done.
+    A checkpoint is written every ``CACHE_WRITE_BATCH`` pages or every
+    ``interval`` seconds, whichever comes first, and the time spent
+    writing is accumulated in ``seconds``. The document is held in the
+    cache (see ``AnalysisCache.hold_document``) until ``finish``, so its
+    checkpoint and feature file are not evicted while it is analyzed.
+    """
+
+    def __init__(self, cache, doc_key, page_keys, cached, interval=CHECKPOINT_SECONDS):
+        """
+        Args:
+            cache: AnalysisCache
+            doc_key: Key of the document
+            page_keys: List of page keys in page order
+            cached: Dict {page_key: (has_signature, thumbnail)} of the
+                pages already known (see ``lookup_cached_pages``)
+            interval: Maximum seconds between two checkpoints
+        """
+        self.cache = cache
+        self.doc_key = doc_key
+        self.page_keys = page_keys
+        self.interval = interval
+        self.completed = np.array([page_key in cached for page_key in page_keys], dtype=bool)
+        self.verdicts = np.array(
+            [bool(cached[page_key][0]) if page_key in cached else False for page_key in page_keys],
+            dtype=bool,
+        )
+        self.seconds = 0.0
+        self.writes = 0
+        self._pending = []
+        self._last_write = time.perf_counter()
+        self._held = True
+        cache.hold_document(doc_key)
+
+    def record(self, page_idx, has_signature, thumbnail):
+        """Add the result of one analyzed page, writing a checkpoint when due"""
+        self._pending.append((self.page_keys[page_idx], has_signature, thumbnail or b""))
+        self.completed[page_idx] = True
+        self.verdicts[page_idx] = bool(has_signature)
+        if (len(self._pending) >= CACHE_WRITE_BATCH
+                or time.perf_counter() - self._last_write >= self.interval):
+            self.flush()
+
+    def flush(self):
+        """Write the pending results and the current checkpoint"""
+        started = time.perf_counter()
+        self.cache.put_pages(self._pending)
+        self._pending = []
+        self.cache.put_checkpoint(self.doc_key, self.page_keys, self.completed, self.verdicts)
+        self._last_write = time.perf_counter()
+        self.seconds += self._last_write - started
+        self.writes += 1
+        metrics.observe("pdf_checkpoint_write_seconds", self._last_write - started)
+
+    def finish(self):
+        """
+        Write the remaining results
+
+        A fully analyzed document is registered as such and its checkpoint
+        is dropped; otherwise (e.g. the analysis was cancelled) the
+        checkpoint is kept so the next run resumes from it.
+        """
+        try:
+            if not self.completed.all():
+                self.flush()
+                return
+            started = time.perf_counter()
+            self.cache.put_pages(self._pending)
+            self._pending = []
+            self.cache.put_document(self.doc_key, self.page_keys)
+            self.cache.delete_checkpoint(self.doc_key)
+            self.seconds += time.perf_counter() - started
+        finally:
+            if self._held:
+                self._held = False
+                self.cache.release_document(self.doc_key)
+
+
+def lookup_cached_pages(processor, doc_hash, cache, zoom=0.5):
+    """
+    Resolve the cache keys of every page and fetch the known results
+
+    Args:
+        processor: PDFProcessor with the document open
+        doc_hash: Content hash of the whole PDF file
+        cache: AnalysisCache
+        zoom: Zoom factor for detection
+
+    Returns:
+        Tuple (doc_key, page_keys, cached) where ``page_keys`` lists the key
+        of each page in page order and ``cached`` maps the keys found to
+        ``(has_signature, thumbnail_bytes)``
+    """
+    total_pages = processor.get_total_pages()
+    doc_key = cache.document_key(doc_hash, DETECTOR_VERSION, zoom)
+
+    # 1. Documento completo ya analizado: no hace falta leer las páginas
+    page_keys = cache.get_document(doc_key)
+    checkpoint = None
+    if page_keys is None or len(page_keys) != total_pages:
+        # 2. Análisis interrumpido: el checkpoint guarda las claves y los veredictos
+        checkpoint = cache.get_checkpoint(doc_key)
+        if checkpoint is not None and len(checkpoint["page_keys"]) == total_pages:
+            page_keys = checkpoint["page_keys"]
+        else:
+            checkpoint = None
+            page_keys = [
+                cache.page_key(processor.get_page_content_hash(page_idx), DETECTOR_VERSION, zoom)
+                for page_idx in range(total_pages)
+            ]
+
+    # 3. Páginas conocidas (también las que aparecen en otros documentos)
+    cached = cache.get_pages(page_keys)
+    hits = sum(1 for page_key in page_keys if page_key in cached)
+    metrics.inc("pdf_analysis_cache_pages_total", hits, result="hit")
+    metrics.inc("pdf_analysis_cache_pages_total", total_pages - hits, result="miss")
+
+    # Las páginas del checkpoint cuya miniatura ya se desalojó conservan el
+    # veredicto; la miniatura se genera al mostrarla
+    if checkpoint is not None:
+        for page_idx in np.flatnonzero(checkpoint["completed"]):
+            page_key = page_keys[page_idx]
+            if page_key not in cached:
+                cached[page_key] = (bool(checkpoint["verdicts"][page_idx]), b"")
+    return doc_key, page_keys, cached
+
+
+def iter_cached_page_analysis(processor, doc_hash, cache=None, workers=None, zoom=0.5, stats=None,
+                              features=None):
+    """
+    Analyze every page of a document, reusing results from the persistent cache
+
+    A document already analyzed with the same detector version is answered
+    entirely from the cache, and an interrupted analysis resumes from its
+    last checkpoint. Otherwise each page is looked up by the hash of its
+    content and only the missing pages are sent to the process pool; their
+    results are written back to the cache as they complete.
+
+    Args:
+        processor: PDFProcessor with the document open
+        doc_hash: Content hash of the whole PDF file
+        cache: AnalysisCache (None = analyze everything without caching)
+        workers: Number of processes for the pages that must be analyzed
+        zoom: Zoom factor for detection
+        stats: Optional dict filled with ``checkpoint_seconds`` and
+            ``checkpoint_writes`` once the analysis finishes
+        features: Optional FeatureStore of the document: analyzed pages
+            write their records to it, and cached pages without a record
+            get their verdict as a fixed one and their fingerprint (as in
+            BackgroundAnalysis), so the suggestions can be recomputed with
+            ``suggested_split_flags``
+
+    Yields:
+        Tuples (page_idx, has_signature, thumbnail_bytes, stage) in ascending
+        page order; ``stage`` is ``"cache"`` for pages answered by the cache
+    """
+    total_pages = processor.get_total_pages()
+    path = features.path if features is not None else None
+    if cache is None:
+        yield from iter_page_analysis(processor.pdf_path, total_pages, workers=workers, zoom=zoom,
+                                      feature_path=path)
+        return
+
+    doc_key, page_keys, cached = lookup_cached_pages(processor, doc_hash, cache, zoom)
+    missing = [page_idx for page_idx in range(total_pages) if page_keys[page_idx] not in cached]
+    checkpointer = AnalysisCheckpointer(cache, doc_key, page_keys, cached)
+
+    analyzed = iter_page_analysis(processor.pdf_path, total_pages, workers=workers,
+                                  zoom=zoom, pages=missing, feature_path=path)
+    try:
+        for page_idx in range(total_pages):
+            page_key = page_keys[page_idx]
+            if page_key in cached:
+                has_signature, thumbnail = cached[page_key]
+                if features is not None and features.array["source"][page_idx] == FEATURE_SOURCE_NONE:
+                    features.put_fixed(page_idx, has_signature,
+                                       render_page_fingerprint(processor, page_idx))
+                yield page_idx, has_signature, thumbnail, "cache"
+                continue
+
+            _, has_signature, thumbnail, stage = next(analyzed)
+            checkpointer.record(page_idx, has_signature, thumbnail)
+            yield page_idx, has_signature, thumbnail, stage
+    finally:
+        # También si el consumidor abandona el análisis a medias
+        checkpointer.finish()
+        if stats is not None:
+            stats["checkpoint_seconds"] = checkpointer.seconds
+            stats["checkpoint_writes"] = checkpointer.writes
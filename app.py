@@ -2,8 +2,22 @@ import streamlit as st
 import tempfile
 import os
 import time
+import uuid
+import numpy as np
 from pdf_processor import PDFProcessor
-from image_analyzer import detect_split_points
+from analysis_pipeline import default_worker_count, render_page_features, DEFAULT_CHUNK_SIZE
+from background_analysis import BackgroundAnalysis
+from job_scheduler import get_scheduler, estimate_analysis_cost, estimate_split_cost
+from analysis_cache import get_default_cache
+from thumbnail_store import ThumbnailStore
+from image_analyzer import (
+    suggested_split_flags,
+    pages_missing_stamp_check,
+    sensitivity_params,
+)
+from zip_export import export_zip
+from upload_ingest import ingest_upload
+import metrics
 
 # Set page configuration with increased memory limits for large files
 st.set_page_config(
@@ -12,6 +26,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Inicio de esta ejecución del script, para el panel de depuración
+run_started = time.perf_counter()
+
 # Aumentar los límites de tamaño de archivo (1GB)
 MB = 1024 * 1024
 st.session_state["file_uploader_key"] = st.session_state.get("file_uploader_key", 0)
@@ -20,6 +37,19 @@ st.session_state["file_uploader_key"] = st.session_state.get("file_uploader_key"
 os.environ["STREAMLIT_SERVER_MAX_UPLOAD_SIZE"] = "1000"  # 1GB
 os.environ["STREAMLIT_BROWSER_GATHER_USAGE_STATS"] = "false"
 
+# Objetos pesados compartidos por todas las sesiones: se crean una sola vez
+# por proceso del servidor y no se vuelven a construir en cada ejecución
+@st.cache_resource
+def shared_scheduler():
+    return get_scheduler()
+
+@st.cache_resource
+def shared_analysis_cache():
+    return get_default_cache()
+
+# Endpoint local de métricas en formato Prometheus (solo si PDF_METRICS_PORT está definido)
+metrics.start_http_server()
+
 # Initialize session state variables if they don't exist
 if 'pdf_processor' not in st.session_state:
     st.session_state.pdf_processor = None
@@ -37,10 +67,38 @@ if 'processed_thumbnails' not in st.session_state:
     st.session_state.processed_thumbnails = {}
 if 'current_page' not in st.session_state:
     st.session_state.current_page = 1
+if 'page_slider' not in st.session_state:
+    st.session_state.page_slider = st.session_state.current_page
 if 'show_split_options' not in st.session_state:
     st.session_state.show_split_options = False
 if 'original_filename' not in st.session_state:
     st.session_state.original_filename = None
+if 'pdf_hash' not in st.session_state:
+    st.session_state.pdf_hash = None
+if 'analysis_job' not in st.session_state:
+    st.session_state.analysis_job = None
+if 'detection_sensitivity' not in st.session_state:
+    st.session_state.detection_sensitivity = 5
+if 'session_id' not in st.session_state:
+    # Identificador de la sesión para el reparto equitativo del planificador
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Intervalo de refresco del progreso mientras el análisis sigue en curso (segundos)
+ANALYSIS_REFRESH_SECONDS = 1.0
+
+# Ancho máximo de las miniaturas en el visor (cuatro columnas en el diseño ancho)
+VIEWER_THUMBNAIL_WIDTH = 400
+
+# Ejecuciones recientes del script que se muestran en el panel de depuración
+LATENCY_HISTORY = 50
+
+# Texto de la espera estimada de un trabajo en el planificador
+def format_wait(seconds):
+    if seconds is None:
+        return "desconocida"
+    if seconds < 60:
+        return f"~{max(1, round(seconds))} s"
+    return f"~{round(seconds / 60)} min"
 
 # Function to toggle page selection for splitting
 def toggle_page(page_num):
@@ -49,6 +107,14 @@ def toggle_page(page_num):
     else:
         st.session_state.selected_splits.add(page_num)
 
+# Cambiar la página visible (None = la elegida en la barra de navegación)
+def go_to_page(page_num):
+    if page_num is None:
+        page_num = st.session_state.page_slider
+    page_num = max(1, min(page_num, max(1, st.session_state.total_pages)))
+    st.session_state.current_page = page_num
+    st.session_state.page_slider = page_num
+
 # Function to reset all splits
 def reset_splits():
     st.session_state.selected_splits = set()
@@ -57,13 +123,67 @@ def reset_splits():
 def use_suggested_splits():
     st.session_state.selected_splits = st.session_state.suggested_splits.copy()
 
+# Recalcular las divisiones sugeridas con la sensibilidad elegida, a partir
+# de las características guardadas de cada página (sin renderizar)
+def apply_sensitivity():
+    job = st.session_state.analysis_job
+    if job is None or job.features is None:
+        return
+    params = sensitivity_params(st.session_state.detection_sensitivity)
+    # Páginas parecidas a una primera página conocida (la primera del PDF y
+    # las que siguen a las divisiones ya seleccionadas) abren un documento nuevo
+    first_pages = [0] + sorted(st.session_state.selected_splits)
+    flags, fingerprint_only = suggested_split_flags(job.features.array, first_pages, params)
+    st.session_state.fingerprint_splits = int(np.count_nonzero(fingerprint_only))
+    st.session_state.suggested_splits = set((np.flatnonzero(flags) + 1).tolist())
+    if isinstance(st.session_state.processed_thumbnails, ThumbnailStore):
+        st.session_state.processed_thumbnails.set_flags(flags)
+
+# Buscar sellos en las páginas cuyo veredicto depende de una etapa que no se ejecutó
+def check_pending_stamps(pages):
+    job = st.session_state.analysis_job
+    processor = st.session_state.pdf_processor
+    for page_idx in pages:
+        page_idx = int(page_idx)
+        job.features.put(page_idx, render_page_features(processor, page_idx, job.zoom, check_stamps=True)[0])
+    job.features.flush()
+    apply_sensitivity()
+
 # Function to split PDF and save
 def split_pdf():
-    if not st.session_state.pdf_processor or not st.session_state.selected_splits:
+    if not st.session_state.pdf_processor:
         st.error("Por favor, suba un PDF y seleccione puntos de división primero.")
         return
     
+    # Límites de los portales de presentación electrónica: se añaden los
+    # cortes necesarios a los elegidos por el usuario (0 = sin límite)
+    limit_col1, limit_col2 = st.columns(2)
+    with limit_col1:
+        max_size_mb = st.number_input("Tamaño máximo por archivo (MB)", min_value=0.0,
+                                      value=0.0, step=1.0, key="max_size_mb")
+    with limit_col2:
+        max_pages = st.number_input("Máximo de páginas por archivo", min_value=0,
+                                    value=0, step=10, key="max_pages")
+    max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+    max_pages = int(max_pages) if max_pages else None
+    
+    if not st.session_state.selected_splits and max_bytes is None and max_pages is None:
+        st.error("Por favor, seleccione puntos de división o indique un tamaño máximo por archivo.")
+        return
+    
     splits = sorted(list(st.session_state.selected_splits))
+    if max_bytes is not None or max_pages is not None:
+        planned, estimates = st.session_state.pdf_processor.plan_size_splits(max_bytes, max_pages, splits)
+        st.caption(f"Se crearán {len(estimates)} archivos ({len(planned) - len(splits)} cortes "
+                   f"añadidos por los límites); el mayor ocupará unos "
+                   f"{max(estimates) / (1024 * 1024):.1f} MB.")
+        splits = planned
+    if not splits:
+        # Los límites no obligan a cortar y no hay puntos seleccionados
+        st.warning("Con estos límites el documento completo cabe en un solo archivo: "
+                   "no hay ningún punto de división. Seleccione puntos de división o "
+                   "reduzca el tamaño o el número de páginas por archivo.")
+        return
     
     # Usar carpeta temporal para generar archivos antes de crear el ZIP
     import tempfile
@@ -75,10 +195,73 @@ def split_pdf():
         
         st.info("Procesando división del PDF...")
         
+        # Tipo de compresión del ZIP: los PDF ya vienen comprimidos, así que
+        # "Sin compresión" es mucho más rápido y apenas cambia el tamaño
+        compression_labels = {
+            "Sin compresión (más rápido)": "stored",
+            "Comprimido (DEFLATE)": "deflated",
+        }
+        compression_label = st.radio(
+            "Compresión del ZIP",
+            list(compression_labels.keys()),
+            horizontal=True,
+            key="zip_compression",
+        )
+        
+        # Perfil de guardado de los PDF divididos: los perfiles compactos
+        # eliminan objetos sin usar, fusionan duplicados y comprimen streams
+        save_profile_labels = {
+            "Estándar": "default",
+            "Compacto": "compact",
+            "Mínimo tamaño (más lento)": "smallest",
+            "Web (vista rápida)": "web",
+        }
+        save_profile_label = st.radio(
+            "Perfil de guardado",
+            list(save_profile_labels.keys()),
+            horizontal=True,
+            key="save_profile",
+        )
+        
         # Botón para confirmar y dividir
         if st.button("Confirmar y Dividir PDF"):
-            # Dividir el PDF y guardar en la carpeta temporal
-            split_files = st.session_state.pdf_processor.split_pdf(splits, temp_dir, original_filename=original_name)
+            # Dividir el PDF en un turno del planificador compartido del
+            # servidor, mostrando la posición en la cola mientras espera
+            # (el trabajo corre en otro hilo: no debe leer st.session_state)
+            scheduler = shared_scheduler()
+            split_workers = scheduler.workers_per_job(os.cpu_count() or 1)
+            processor = st.session_state.pdf_processor
+            save_profile = save_profile_labels[save_profile_label]
+            
+            def run_split():
+                # Con PDF_PROFILE, un perfil por división (como el modo por lotes)
+                with metrics.profiled(label="division"):
+                    return processor.split_pdf(
+                        splits, temp_dir, original_filename=original_name,
+                        save_profile=save_profile, workers=split_workers,
+                    )
+            
+            split_job = scheduler.submit(
+                run_split,
+                session_id=st.session_state.session_id,
+                cost=estimate_split_cost(st.session_state.temp_pdf_path, split_workers),
+                pages=st.session_state.total_pages,
+                kind="split",
+                label=f"división {original_name}",
+            )
+            status = st.empty()
+            while not split_job.wait(timeout=0.5):
+                if split_job.status == "queued":
+                    status.info(f"En cola para dividir: posición {split_job.position()}, "
+                                f"espera estimada {format_wait(split_job.eta_seconds())}")
+                else:
+                    status.info("Dividiendo el PDF...")
+            status.empty()
+            if split_job.error:
+                st.error(f"Error al dividir el PDF: {split_job.error}")
+            split_files = split_job.result or []
+            if not split_files and not split_job.error:
+                st.warning("La división no generó ningún archivo.")
             
             # Mostrar información sobre los archivos generados
             if split_files:
@@ -108,24 +291,21 @@ def split_pdf():
                 </div>
                 """, unsafe_allow_html=True)
                 
-                # Preparar archivo ZIP con todos los PDFs para descarga conjunta
-                import zipfile
-                import io
-                
-                # Crear un archivo ZIP en memoria con todos los PDFs
-                zip_buffer = io.BytesIO()
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    for file_path in split_files:
-                        file_name = os.path.basename(file_path)
-                        with open(file_path, 'rb') as f:
-                            zip_file.writestr(file_name, f.read())
-                
-                zip_buffer.seek(0)
+                # Escribir el ZIP directamente en disco, leyendo cada PDF por bloques
+                zip_result = export_zip(
+                    split_files,
+                    os.path.join(temp_dir, "divididos.zip"),
+                    compression=compression_labels[compression_label],
+                )
                 
                 # Mostrar resumen de los archivos divididos
                 st.write("### Archivos incluidos en el ZIP:")
                 
                 # Crea una tabla con la información de los archivos
+                segment_seconds = {
+                    timing["path"]: timing["seconds"]
+                    for timing in st.session_state.pdf_processor.last_split_timings
+                }
                 file_info = []
                 for file_path in split_files:
                     file_name = os.path.basename(file_path)
@@ -140,13 +320,15 @@ def split_pdf():
                         page_info = ""
                         
                     file_size = f"{os.path.getsize(file_path)/1024:.1f} KB"
-                    file_info.append([file_name, f"Páginas {page_info}", file_size])
+                    write_time = f"{segment_seconds.get(file_path, 0):.2f} s"
+                    file_info.append([file_name, f"Páginas {page_info}", file_size, write_time])
                 
                 # Mostrar los archivos en una tabla
                 st.table({
                     "Nombre del archivo": [info[0] for info in file_info],
                     "Rango de páginas": [info[1] for info in file_info],
-                    "Tamaño": [info[2] for info in file_info]
+                    "Tamaño": [info[2] for info in file_info],
+                    "Tiempo de escritura": [info[3] for info in file_info]
                 })
                 
                 # Botón para descargar todos los PDFs como un ZIP con el nombre original y fecha
@@ -177,14 +359,15 @@ def split_pdf():
                 </style>
                 """, unsafe_allow_html=True)
                 
-                st.download_button(
-                    label="📦 DESCARGAR PDFs EN ZIP",
-                    data=zip_buffer,
-                    file_name=zip_filename,
-                    mime="application/zip",
-                    key="download_all_zip",
-                    help="Descarga todos los PDFs divididos en un archivo ZIP comprimido.",
-                )
+                with open(zip_result["path"], "rb") as zip_file:
+                    st.download_button(
+                        label="📦 DESCARGAR PDFs EN ZIP",
+                        data=zip_file,
+                        file_name=zip_filename,
+                        mime="application/zip",
+                        key="download_all_zip",
+                        help="Descarga todos los PDFs divididos en un archivo ZIP comprimido.",
+                    )
                 
                 # Mensaje adicional de éxito
                 st.success("✅ Los archivos están listos para descarga. El ZIP contiene todos los PDFs divididos.")
@@ -291,41 +474,143 @@ if uploaded_file is not None:
     if st.session_state.temp_pdf_path is None or st.session_state.pdf_processor is None:
         # Guardar el nombre original del archivo subido
         st.session_state.original_filename = uploaded_file.name
+        # El visor empieza en la primera página del nuevo documento
+        st.session_state.current_page = st.session_state.page_slider = 1
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            tmp.write(uploaded_file.getvalue())
-            st.session_state.temp_pdf_path = tmp.name
+        # Copiar el archivo a disco por bloques (sin duplicarlo en memoria) y calcular su hash
+        st.session_state.temp_pdf_path, st.session_state.pdf_hash = ingest_upload(uploaded_file)
         
         with st.spinner("Procesando archivo PDF..."):
-            # Initialize PDF processor with the uploaded file
-            st.session_state.pdf_processor = PDFProcessor(st.session_state.temp_pdf_path)
+            # Initialize PDF processor with the uploaded file, memory-mapped from disk
+            st.session_state.pdf_processor = PDFProcessor(st.session_state.temp_pdf_path, use_mmap=True)
             # Guardar el nombre original para usarlo en los archivos divididos
             st.session_state.pdf_processor.original_filename = st.session_state.original_filename
             st.session_state.total_pages = st.session_state.pdf_processor.get_total_pages()
-            st.session_state.processed_thumbnails = {}  # Reset thumbnails
+            # Miniaturas en disco con una pequeña ventana en memoria
+            # (las páginas resueltas sin renderizar se dibujan al mostrarlas)
+            st.session_state.processed_thumbnails = ThumbnailStore(
+                st.session_state.total_pages,
+                renderer=st.session_state.pdf_processor.get_page_image,
+            )
             
             # Get suggested split points based on signatures/stamps
-            progress_bar = st.progress(0)
             st.session_state.suggested_splits = set()
+            st.session_state.fingerprint_splits = 0
+            st.session_state.detection_sensitivity = 5
             
-            for i in range(st.session_state.total_pages):
-                # Create a placeholder for the current page
-                if i + 1 not in st.session_state.processed_thumbnails:
-                    image = st.session_state.pdf_processor.get_page_image(i)
-                    has_signature = detect_split_points(image)
-                    
-                    # If the page has a signature or stamp, suggest it as a split point
-                    if has_signature:
-                        st.session_state.suggested_splits.add(i + 1)
-                    
-                    # Store the processed thumbnail
-                    st.session_state.processed_thumbnails[i + 1] = (image, has_signature)
-                
-                # Update progress
-                progress_bar.progress((i + 1) / st.session_state.total_pages)
-            
-            progress_bar.empty()
-            st.success(f"¡PDF procesado con éxito! Se detectaron {len(st.session_state.suggested_splits)} posibles puntos de división.")
+            # Analizar las páginas en segundo plano (un proceso por núcleo,
+            # configurable con PDF_ANALYSIS_WORKERS) reutilizando la caché
+            # persistente de análisis; el visor se puede usar mientras tanto
+            # El trabajo espera turno en el planificador compartido del servidor,
+            # que lo admite cuando su memoria estimada cabe en el presupuesto
+            scheduler = shared_scheduler()
+            analysis_workers = scheduler.workers_per_job(default_worker_count())
+            st.session_state.analysis_job = BackgroundAnalysis(
+                st.session_state.temp_pdf_path,
+                st.session_state.pdf_hash,
+                st.session_state.total_pages,
+                cache=shared_analysis_cache(),
+                workers=analysis_workers,
+                focus_page=st.session_state.current_page - 1,
+                scheduler=scheduler,
+                session_id=st.session_state.session_id,
+                cost=estimate_analysis_cost(
+                    st.session_state.pdf_processor,
+                    workers=analysis_workers,
+                    pages_in_flight=DEFAULT_CHUNK_SIZE,
+                ),
+            ).start()
+
+    # Recoger los resultados del análisis en segundo plano y priorizar la
+    # zona que se está viendo
+    def collect_analysis_results():
+        job = st.session_state.analysis_job
+        if job is None:
+            return []
+        job.set_focus(st.session_state.current_page - 1)
+        results = job.drain()
+        for page_idx, has_signature, thumbnail, stage in results:
+            # If the page has a signature or stamp, suggest it as a split point
+            if has_signature:
+                st.session_state.suggested_splits.add(page_idx + 1)
+            # Store the processed thumbnail
+            st.session_state.processed_thumbnails[page_idx + 1] = (thumbnail, has_signature)
+        return results
+    
+    collect_analysis_results()
+    
+    # Al terminar el análisis se recalculan las sugerencias con las
+    # características de todas las páginas (incluidas las huellas de página)
+    finished_job = st.session_state.analysis_job
+    if (finished_job is not None and finished_job.done and finished_job.features is not None
+            and st.session_state.get("features_applied") is not finished_job):
+        apply_sensitivity()
+        st.session_state.features_applied = finished_job
+    
+    @st.fragment(run_every=ANALYSIS_REFRESH_SECONDS if (
+        st.session_state.analysis_job is not None and not st.session_state.analysis_job.done
+    ) else None)
+    def show_analysis_progress():
+        job = st.session_state.analysis_job
+        if job is None:
+            return
+        results = collect_analysis_results()
+        total_pages = st.session_state.total_pages
+        if job.queued:
+            st.info(f"Análisis en cola: posición {job.queue_position()}, "
+                    f"espera estimada {format_wait(job.eta_seconds())}. "
+                    "Puede revisar las páginas mientras tanto.")
+            return
+        if not job.done:
+            st.progress(job.completed / total_pages,
+                        text=f"Analizando páginas en segundo plano: {job.completed} de {total_pages} "
+                             f"(tiempo restante estimado {format_wait(job.eta_seconds())})")
+            # Redibujar el visor cuando llegan páginas de la zona visible
+            visible = range(st.session_state.current_page - 1, st.session_state.current_page + 3)
+            if any(page_idx in visible for page_idx, _, _, _ in results):
+                st.rerun()
+            return
+        if results:
+            # Último lote: redibujar toda la aplicación sin el refresco periódico
+            st.rerun()
+        if job.error:
+            st.error(f"Error en el análisis: {job.error}")
+        st.success(f"¡PDF procesado con éxito! Se detectaron {len(st.session_state.suggested_splits)} posibles puntos de división.")
+        # Páginas resueltas por cada etapa: la capa de texto evita renderizar
+        stage_counts = job.stage_counts
+        st.caption(
+            f"Páginas resueltas: {stage_counts['cache']} desde la caché, "
+            f"{stage_counts['text']} por la capa de texto (sin renderizar), "
+            f"{stage_counts['raster']} por análisis de imagen. "
+            f"Checkpoints: {job.checkpoint_seconds * 1000:.0f} ms en total."
+        )
+    
+    show_analysis_progress()
+    
+    # Reajuste de la detección: las sugerencias se recalculan a partir de las
+    # características guardadas de cada página, sin volver a analizarlas
+    analysis_job = st.session_state.analysis_job
+    if analysis_job is not None and analysis_job.done and analysis_job.features is not None:
+        if st.session_state.get("fingerprint_splits"):
+            st.caption(f"{st.session_state.fingerprint_splits} divisiones sugeridas porque la página "
+                       "siguiente se parece a una primera página.")
+        st.slider(
+            "Sensibilidad de detección",
+            1, 10,
+            key="detection_sensitivity",
+            on_change=apply_sensitivity,
+            help="5 es la sensibilidad por defecto; valores más altos sugieren más puntos de división.",
+        )
+        pending = pages_missing_stamp_check(
+            analysis_job.features.array,
+            sensitivity_params(st.session_state.detection_sensitivity),
+        )
+        if len(pending):
+            st.caption(f"{len(pending)} páginas aún no se han revisado en busca de sellos con esta sensibilidad.")
+            if st.button("Buscar sellos en esas páginas", key="stamp_check_btn"):
+                with st.spinner("Buscando sellos..."):
+                    check_pending_stamps(pending)
+                st.rerun()
     
     # Display file information
     st.write(f"Nombre del archivo: {uploaded_file.name}")
@@ -349,9 +634,22 @@ if uploaded_file is not None:
     with col4:
         if st.button("Limpiar Todo", key="clear_btn"):
             # Reset everything to initial state
+            if st.session_state.analysis_job is not None:
+                st.session_state.analysis_job.cancel()
+                if st.session_state.analysis_job.features is not None:
+                    st.session_state.analysis_job.features.close()
+            st.session_state.analysis_job = None
+            if st.session_state.pdf_processor is not None:
+                st.session_state.pdf_processor.close()
             st.session_state.pdf_processor = None
+            st.session_state.pdf_hash = None
             st.session_state.selected_splits = set()
             st.session_state.suggested_splits = set()
+            st.session_state.features_applied = None
+            st.session_state.fingerprint_splits = 0
+            if isinstance(st.session_state.processed_thumbnails, ThumbnailStore):
+                st.session_state.processed_thumbnails.close()
+            st.session_state.processed_thumbnails = {}
             if st.session_state.temp_pdf_path and os.path.exists(st.session_state.temp_pdf_path):
                 os.unlink(st.session_state.temp_pdf_path)
             st.session_state.temp_pdf_path = None
@@ -363,168 +661,207 @@ if uploaded_file is not None:
         st.write("### Opciones de División")
         split_pdf()
     
-    # Selected pages indicator
-    st.write(f"Puntos de división seleccionados: {len(st.session_state.selected_splits)}")
-    
-    # Título y visualización del documento
-    st.write("### Previsualización del documento")
+    # HTML para las miniaturas con líneas divisorias (los estilos se inyectan
+    # en la ejecución completa, fuera del fragmento del visor)
+    st.markdown("""
+    <style>
+    .page-container {
+        display: flex;
+        align-items: stretch;
+        gap: 0px;
+        margin: 20px 0;
+    }
+    .page-item {
+        flex: 1;
+        display: flex;
+        flex-direction: column;
+        align-items: center;
+    }
+    .divider-container {
+        width: 40px;
+        display: flex;
+        flex-direction: column;
+        align-items: center;
+        justify-content: center;
+        position: relative;
+    }
+    .divider-line {
+        width: 3px;
+        height: 100%;
+        background: repeating-linear-gradient(
+            to bottom,
+            #666 0px,
+            #666 10px,
+            transparent 10px,
+            transparent 20px
+        );
+        position: relative;
+    }
+    .divider-button-container {
+        position: absolute;
+        top: 50%;
+        transform: translateY(-50%);
+        z-index: 10;
+    }
+    </style>
+    """, unsafe_allow_html=True)
     
-    # Mostrar miniaturas y controles
-    if len(st.session_state.processed_thumbnails) > 0:
-        st.write("**Miniaturas de páginas:**")
-        
-        # Definir la página actual para navegación
-        current_page = st.session_state.current_page
-        start_idx = max(0, current_page - 1)
-        
-        # Crear las columnas con separadores visuales entre ellas
-        # Usaremos más columnas para intercalar las líneas divisorias
-        num_pages_to_show = min(4, st.session_state.total_pages - start_idx)
-        
-        # HTML para las miniaturas con líneas divisorias
-        st.markdown("""
-        <style>
-        .page-container {
-            display: flex;
-            align-items: stretch;
-            gap: 0px;
-            margin: 20px 0;
-        }
-        .page-item {
-            flex: 1;
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-        }
-        .divider-container {
-            width: 40px;
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            justify-content: center;
-            position: relative;
-        }
-        .divider-line {
-            width: 3px;
-            height: 100%;
-            background: repeating-linear-gradient(
-                to bottom,
-                #666 0px,
-                #666 10px,
-                transparent 10px,
-                transparent 20px
-            );
-            position: relative;
-        }
-        .divider-button-container {
-            position: absolute;
-            top: 50%;
-            transform: translateY(-50%);
-            z-index: 10;
-        }
-        </style>
-        """, unsafe_allow_html=True)
-        
-        # Crear columnas alternadas: página, divisor, página, divisor, etc.
-        total_cols = num_pages_to_show * 2 - 1  # páginas + divisores entre ellas
+    # Visor, marcas de división y navegación en un fragmento: pulsar ✓/✗ o
+    # cambiar de página solo vuelve a ejecutar esta parte del script
+    @st.fragment
+    def show_viewer():
+        viewer_started = time.perf_counter()
+        # Selected pages indicator
+        st.write(f"Puntos de división seleccionados: {len(st.session_state.selected_splits)}")
         
-        # Asegurar que total_cols sea al menos 1
-        if total_cols < 1:
-            total_cols = 1
-            cols = st.columns(1)
-        else:
-            cols = st.columns([3 if i % 2 == 0 else 0.5 for i in range(total_cols)])
+        # Título y visualización del documento
+        st.write("### Previsualización del documento")
         
-        # Mostrar miniaturas con divisores entre ellas
-        col_idx = 0
-        for i in range(num_pages_to_show):
-            page_idx = start_idx + i
+        # Mostrar miniaturas y controles (también mientras continúa el análisis)
+        if st.session_state.total_pages > 0 and st.session_state.pdf_processor is not None:
+            st.write("**Miniaturas de páginas:**")
             
-            if page_idx < st.session_state.total_pages and (page_idx + 1) in st.session_state.processed_thumbnails:
-                img, has_signature = st.session_state.processed_thumbnails[page_idx + 1]
-                
-                # Mostrar la miniatura en la columna correspondiente
-                with cols[col_idx]:
-                    # Mostrar la miniatura
-                    st.image(img, caption=f"Página {page_idx + 1}", use_container_width=True)
-                    
-                    # Mostrar si es un punto de división sugerido
-                    if has_signature:
-                        st.markdown("🔍 **División sugerida**")
-                
-                col_idx += 1
+            # Definir la página actual para navegación
+            current_page = st.session_state.current_page
+            start_idx = max(0, current_page - 1)
+            
+            # Cargar la ventana visible (la anterior y la siguiente se precargan
+            # después de dibujar el visor)
+            thumbnails = st.session_state.processed_thumbnails
+            thumbnails.set_window(start_idx + 1, max_width=VIEWER_THUMBNAIL_WIDTH)
+            
+            # Crear las columnas con separadores visuales entre ellas
+            # Usaremos más columnas para intercalar las líneas divisorias
+            num_pages_to_show = min(4, st.session_state.total_pages - start_idx)
+            
+            # Crear columnas alternadas: página, divisor, página, divisor, etc.
+            total_cols = num_pages_to_show * 2 - 1  # páginas + divisores entre ellas
+            
+            # Asegurar que total_cols sea al menos 1
+            if total_cols < 1:
+                total_cols = 1
+                cols = st.columns(1)
+            else:
+                cols = st.columns([3 if i % 2 == 0 else 0.5 for i in range(total_cols)])
+            
+            # Mostrar miniaturas con divisores entre ellas
+            col_idx = 0
+            for i in range(num_pages_to_show):
+                page_idx = start_idx + i
                 
-                # Si no es la última página, mostrar el divisor
-                if i < num_pages_to_show - 1 and col_idx < len(cols):
-                    next_page = page_idx + 2  # La siguiente página después de esta
-                    
+                if page_idx < st.session_state.total_pages:
+                    # Miniatura ya codificada en JPEG: st.image la sirve sin volver a codificarla
+                    analyzed = (page_idx + 1) in thumbnails
                     with cols[col_idx]:
-                        # Verificar si este punto está seleccionado como división
-                        is_selected = next_page in st.session_state.selected_splits
-                        is_suggested = next_page in st.session_state.suggested_splits
-                        
-                        # Línea divisoria visual que ocupa toda la altura
-                        line_color = "#4CAF50" if is_selected else ("#FFA500" if is_suggested else "#999")
-                        line_style = "solid" if is_selected else "dashed"
-                        
-                        # Contenedor principal para la línea y los botones
-                        st.markdown(f"""
-                        <div style="display: flex; flex-direction: column; align-items: center; justify-content: space-between; height: 100%; min-height: 600px; padding: 20px 0;">
-                            <div style="flex: 1; width: 3px; border-left: 3px {line_style} {line_color}; margin: 10px 0;"></div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Espacio para centrar los botones
-                        st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
-                        
-                        # Botón para activar/desactivar la división en este punto
-                        if is_selected:
-                            if st.button("✗", key=f"remove_split_{next_page}", help=f"Quitar división antes de página {next_page}"):
-                                st.session_state.selected_splits.remove(next_page)
-                                st.rerun()
-                            st.markdown(f"<p style='text-align: center; color: #4CAF50; font-size: 11px; margin: 5px 0;'>✓ Dividir aquí</p>", unsafe_allow_html=True)
-                        else:
-                            if st.button("✓", key=f"add_split_{next_page}", help=f"Dividir antes de página {next_page}"):
-                                st.session_state.selected_splits.add(next_page)
-                                st.rerun()
-                            if is_suggested:
-                                st.markdown(f"<p style='text-align: center; color: #FFA500; font-size: 11px; margin: 5px 0;'>⚠ Sugerido</p>", unsafe_allow_html=True)
+                        st.image(
+                            thumbnails.get_bytes(page_idx + 1, VIEWER_THUMBNAIL_WIDTH),
+                            caption=f"Página {page_idx + 1}" if analyzed else f"Página {page_idx + 1} (analizando...)",
+                            use_container_width=True,
+                        )
                         
-                        # Línea divisoria en la parte inferior
-                        st.markdown(f"""
-                        <div style="display: flex; flex-direction: column; align-items: center; justify-content: space-between; height: 100%; min-height: 300px; padding: 0;">
-                            <div style="flex: 1; width: 3px; border-left: 3px {line_style} {line_color}; margin: 10px 0;"></div>
-                        </div>
-                        """, unsafe_allow_html=True)
+                        # Mostrar si es un punto de división sugerido
+                        if analyzed and thumbnails.flags[page_idx]:
+                            st.markdown("🔍 **División sugerida**")
                     
                     col_idx += 1
+                    
+                    # Si no es la última página, mostrar el divisor
+                    if i < num_pages_to_show - 1 and col_idx < len(cols):
+                        next_page = page_idx + 2  # La siguiente página después de esta
+                        
+                        with cols[col_idx]:
+                            # Verificar si este punto está seleccionado como división
+                            is_selected = next_page in st.session_state.selected_splits
+                            is_suggested = next_page in st.session_state.suggested_splits
+                            
+                            # Línea divisoria visual que ocupa toda la altura
+                            line_color = "#4CAF50" if is_selected else ("#FFA500" if is_suggested else "#999")
+                            line_style = "solid" if is_selected else "dashed"
+                            
+                            # Contenedor principal para la línea y los botones
+                            st.markdown(f"""
+                            <div style="display: flex; flex-direction: column; align-items: center; justify-content: space-between; height: 100%; min-height: 600px; padding: 20px 0;">
+                                <div style="flex: 1; width: 3px; border-left: 3px {line_style} {line_color}; margin: 10px 0;"></div>
+                            </div>
+                            """, unsafe_allow_html=True)
+                            
+                            # Espacio para centrar los botones
+                            st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
+                            
+                            # Botón para activar/desactivar la división en este punto
+                            if is_selected:
+                                st.button("✗", key=f"remove_split_{next_page}", help=f"Quitar división antes de página {next_page}",
+                                          on_click=toggle_page, args=(next_page,))
+                                st.markdown(f"<p style='text-align: center; color: #4CAF50; font-size: 11px; margin: 5px 0;'>✓ Dividir aquí</p>", unsafe_allow_html=True)
+                            else:
+                                st.button("✓", key=f"add_split_{next_page}", help=f"Dividir antes de página {next_page}",
+                                          on_click=toggle_page, args=(next_page,))
+                                if is_suggested:
+                                    st.markdown(f"<p style='text-align: center; color: #FFA500; font-size: 11px; margin: 5px 0;'>⚠ Sugerido</p>", unsafe_allow_html=True)
+                            
+                            # Línea divisoria en la parte inferior
+                            st.markdown(f"""
+                            <div style="display: flex; flex-direction: column; align-items: center; justify-content: space-between; height: 100%; min-height: 300px; padding: 0;">
+                                <div style="flex: 1; width: 3px; border-left: 3px {line_style} {line_color}; margin: 10px 0;"></div>
+                            </div>
+                            """, unsafe_allow_html=True)
+                        
+                        col_idx += 1
+            
+            # Navegación entre páginas
+            st.write("**Navegación entre páginas:**")
+            
+            # Barra de progreso visual
+            progress_percent = min(100, (current_page / st.session_state.total_pages) * 100)
+            progress_html = f"""
+            <div style="width:100%; background-color:#f0f0f0; height:10px; border-radius:5px; margin:10px 0;">
+                <div style="width:{progress_percent}%; background-color:#4cc2ff; height:10px; border-radius:5px;"></div>
+            </div>
+            """
+            st.markdown(progress_html, unsafe_allow_html=True)
+            
+            # Controles de navegación
+            col1, col2, col3 = st.columns([1, 5, 1])
+            with col1:
+                st.button("◀ Anterior", key="prev_btn", on_click=go_to_page, args=(current_page - 1,),
+                          disabled=current_page <= 1)
+            with col2:
+                st.slider("Página actual", 1, max(1, st.session_state.total_pages), key="page_slider",
+                          on_change=go_to_page, args=(None,))
+            with col3:
+                # -3 porque mostramos 4 miniaturas a la vez
+                st.button("Siguiente ▶", key="next_btn", on_click=go_to_page, args=(current_page + 1,),
+                          disabled=current_page >= st.session_state.total_pages - 3)
+            
+            # Con el visor ya dibujado, dejar listas la ventana anterior y la siguiente
+            thumbnails.prefetch()
         
-        # Navegación entre páginas
-        st.write("**Navegación entre páginas:**")
-        
-        # Barra de progreso visual
-        progress_percent = min(100, (current_page / st.session_state.total_pages) * 100)
-        progress_html = f"""
-        <div style="width:100%; background-color:#f0f0f0; height:10px; border-radius:5px; margin:10px 0;">
-            <div style="width:{progress_percent}%; background-color:#4cc2ff; height:10px; border-radius:5px;"></div>
-        </div>
-        """
-        st.markdown(progress_html, unsafe_allow_html=True)
-        
-        # Controles de navegación
-        col1, col2, col3 = st.columns([1, 5, 1])
-        with col1:
-            if st.button("◀ Anterior", key="prev_btn"):
-                if current_page > 1:
-                    st.session_state.current_page = current_page - 1
-                    st.rerun()
-        with col2:
-            page_slider = st.slider("Página actual", 1, max(1, st.session_state.total_pages), current_page, key="page_slider")
-            if page_slider != current_page:
-                st.session_state.current_page = page_slider
-                st.rerun()
-        with col3:
-            if st.button("Siguiente ▶", key="next_btn"):
-                if current_page < st.session_state.total_pages - 3:  # -3 porque mostramos 4 miniaturas a la vez
-                    st.session_state.current_page = current_page + 1
-                    st.rerun()
+        # Duración del visor (en las ejecuciones del fragmento solo se ejecuta esta parte)
+        viewer_seconds = time.perf_counter() - viewer_started
+        metrics.observe("pdf_viewer_fragment_seconds", viewer_seconds)
+        viewer_latencies = st.session_state.setdefault("viewer_latencies", [])
+        viewer_latencies.append(viewer_seconds)
+        del viewer_latencies[:-LATENCY_HISTORY]
+    
+    show_viewer()
+
+# Panel de depuración: duración de las últimas ejecuciones del script
+# (sin contar las interrumpidas por st.rerun)
+run_seconds = time.perf_counter() - run_started
+metrics.observe("pdf_viewer_rerun_seconds", run_seconds)
+latencies = st.session_state.setdefault("rerun_latencies", [])
+latencies.append(run_seconds)
+del latencies[:-LATENCY_HISTORY]
+with st.sidebar.expander("Depuración: latencia del visor"):
+    recent = np.array(latencies) * 1000
+    st.write(f"Última ejecución: {recent[-1]:.0f} ms")
+    st.write(f"Mediana: {np.median(recent):.0f} ms · p95: {np.percentile(recent, 95):.0f} ms "
+             f"({len(recent)} ejecuciones)")
+    viewer_recent = np.array(st.session_state.get("viewer_latencies") or [0.0]) * 1000
+    st.write(f"Visor (fragmento, incluye cambios de página y marcas ✓/✗): "
+             f"mediana {np.median(viewer_recent):.0f} ms · p95 {np.percentile(viewer_recent, 95):.0f} ms")
+    if isinstance(st.session_state.processed_thumbnails, ThumbnailStore):
+        thumb_stats = st.session_state.processed_thumbnails.stats()
+        st.write(f"Miniaturas: {thumb_stats['hit_rate']:.0%} aciertos en memoria, "
+                 f"{thumb_stats['encodes']} codificadas, "
+                 f"{thumb_stats['entries']} en memoria ({thumb_stats['bytes'] / 1024:.0f} KB)")
@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+from collections import Counter
+
+from pdf_processor import PDFProcessor
+from feature_store import FeatureStore
+from image_analyzer import FEATURE_SOURCE_NONE
+import metrics
+from analysis_pipeline import (
+    iter_prioritized_page_analysis,
+    lookup_cached_pages,
+    render_page_fingerprint,
+    AnalysisCheckpointer,
+)
+
+
+class BackgroundAnalysis:
+    """
+    Page analysis running in a background thread owned by one session
+
+    The job answers the pages already in the persistent cache first and
+    then analyzes the rest, favouring the pages closest to the focus page
+    set by the viewer. Results are queued and collected by the script
+    thread with ``drain()``, so the session state (thumbnail store,
+    suggested splits) is only touched from Streamlit's own thread.
+
+    With a ``scheduler`` the job runs in one of the server-wide job slots
+    instead of its own thread, and may wait in the queue before starting.
+
+    With a cache, the detector features of every page are kept in
+    ``features`` (a FeatureStore next to the cache), so the suggestions
+    can be recomputed for other thresholds once the pages are analyzed.
+    """
+
+    def __init__(self, pdf_path, doc_hash, total_pages, cache=None, workers=None, zoom=0.5,
+                 focus_page=0, scheduler=None, session_id=None, cost=0):
+        """
+        Args:
+            pdf_path: Path to the PDF file on disk
+            doc_hash: Content hash of the whole PDF file
+            total_pages: Number of pages in the document
+            cache: AnalysisCache (None = analyze everything without caching)
+            workers: Number of analysis processes
+            zoom: Zoom factor for detection
+            focus_page: Page index (0-based) to analyze first
+            scheduler: JobScheduler to run in (None = a dedicated thread)
+            session_id: Session that owns the job, for fair queueing
+            cost: Estimated memory of the job in bytes (see
+                job_scheduler.estimate_analysis_cost)
+        """
+        self.pdf_path = pdf_path
+        self.doc_hash = doc_hash
+        self.total_pages = total_pages
+        self.cache = cache
+        self.workers = workers
+        self.zoom = zoom
+        self.focus_page = focus_page
+        self.completed = 0
+        self.stage_counts = Counter()
+        self.checkpoint_seconds = 0.0
+        self.features = None
+        self.error = None
+        self._results = queue.Queue()
+        self._stop = threading.Event()
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.cost = cost
+        self._job = None
+        self._thread = threading.Thread(target=self._run, name="pdf-analysis", daemon=True)
+
+    def start(self):
+        """Start the analysis thread, or queue the job in the scheduler"""
+        if self.scheduler is not None:
+            self._job = self.scheduler.submit(
+                self._run,
+                session_id=self.session_id,
+                cost=self.cost,
+                pages=self.total_pages,
+                kind="analysis",
+                label=f"análisis {self.doc_hash[:12]}",
+            )
+        else:
+            self._thread.start()
+        return self
+
+    def set_focus(self, page_idx):
+        """Analyze the pages around ``page_idx`` (0-based) next"""
+        self.focus_page = page_idx
+
+    def cancel(self):
+        """Stop scheduling new pages and wait for the pages in progress"""
+        self._stop.set()
+        if self._job is not None:
+            if not self._job.cancel():
+                self._job.wait()
+        elif self._thread.is_alive():
+            self._thread.join()
+
+    @property
+    def queued(self):
+        """True while the job waits for a scheduler slot"""
+        return self._job is not None and self._job.status == "queued"
+
+    @property
+    def running(self):
+        if self._job is not None:
+            return self._job.status == "running"
+        return self._thread.is_alive()
+
+    @property
+    def done(self):
+        """True once every page has been analyzed (or the job failed or was cancelled)"""
+        if self._job is not None:
+            return self._job.done
+        return not self._thread.is_alive() and self._thread.ident is not None
+
+    def queue_position(self):
+        """1-based position in the scheduler queue (0 when not queued)"""
+        return self._job.position() if self._job is not None else 0
+
+    def eta_seconds(self):
+        """Estimated seconds until the analysis finishes, or None without a scheduler"""
+        if self._job is None:
+            return None
+        if self.running and self.completed:
+            # En curso: extrapolar con el ritmo real de esta sesión
+            elapsed = time.time() - self._job.started_at
+            return elapsed / self.completed * (self.total_pages - self.completed)
+        return self._job.eta_seconds()
+
+    def drain(self):
+        """
+        Collect the results produced since the last call
+
+        Returns:
+            List of tuples (page_idx, has_signature, thumbnail_bytes, stage)
+        """
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def _emit(self, result):
+        self.completed += 1
+        self.stage_counts[result[3]] += 1
+        self._results.put(result)
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            # Con PDF_PROFILE, perfil de este hilo (lectura de la caché, reparto
+            # de páginas y, en documentos pequeños, el propio análisis)
+            with metrics.profiled(label="analisis"):
+                self._analyze()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Error en el análisis en segundo plano: {str(e)}")
+        elapsed = time.perf_counter() - started
+        metrics.observe("pdf_document_analysis_seconds", elapsed)
+        metrics.log_event(
+            "analysis",
+            doc_hash=self.doc_hash,
+            pages=self.total_pages,
+            completed=self.completed,
+            stages=dict(self.stage_counts),
+            seconds=elapsed,
+            checkpoint_seconds=self.checkpoint_seconds,
+            cancelled=self._stop.is_set(),
+            error=self.error,
+        )
+        metrics.flush()
+
+    def _analyze(self):
+        pages = list(range(self.total_pages))
+        checkpointer = None
+
+        # Páginas ya conocidas por la caché o por el checkpoint de un
+        # análisis interrumpido: se entregan de inmediato
+        if self.cache is not None:
+            processor = PDFProcessor(self.pdf_path, use_mmap=True)
+            try:
+                doc_key, page_keys, cached = lookup_cached_pages(processor, self.doc_hash,
+                                                                 self.cache, self.zoom)
+                checkpointer = AnalysisCheckpointer(self.cache, doc_key, page_keys, cached)
+                features = FeatureStore(self.cache.feature_path(doc_key), self.total_pages)
+                pages = []
+                for page_idx, page_key in enumerate(page_keys):
+                    if page_key in cached:
+                        has_signature, thumbnail = cached[page_key]
+                        # Páginas de la caché sin características guardadas: el
+                        # veredicto no cambia al reajustar los umbrales, y la
+                        # huella se calcula aquí para comparar los inicios de documento
+                        if features.array["source"][page_idx] == FEATURE_SOURCE_NONE:
+                            features.put_fixed(page_idx, has_signature,
+                                               render_page_fingerprint(processor, page_idx))
+                        self._emit((page_idx, has_signature, thumbnail, "cache"))
+                    else:
+                        pages.append(page_idx)
+            finally:
+                processor.close()
+            features.flush()
+            self.features = features
+
+        try:
+            for page_idx, has_signature, thumbnail, stage in iter_prioritized_page_analysis(
+                self.pdf_path,
+                pages,
+                get_focus=lambda: self.focus_page,
+                workers=self.workers,
+                zoom=self.zoom,
+                should_stop=self._stop.is_set,
+                feature_path=self.features.path if self.features is not None else None,
+            ):
+                if checkpointer is not None:
+                    checkpointer.record(page_idx, has_signature, thumbnail)
+                self._emit((page_idx, has_signature, thumbnail, stage))
+        finally:
+            # Si se cancela, el checkpoint permite continuar en la próxima sesión
+            if checkpointer is not None:
+                checkpointer.finish()
+                self.checkpoint_seconds = checkpointer.seconds
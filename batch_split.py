@@ -0,0 +1,293 @@
+"""
+Headless batch processing of whole directories of PDFs
+
+Scans a directory tree, analyzes every PDF with the same detector as the
+web application and splits it at the suggested points. Several PDFs are
+processed at once by a bounded pool of processes, throttled by an
+estimate of the memory each document needs. A PDF without split points
+is copied whole as a single part. A JSON manifest with the chosen split
+points is written next to the outputs.
+
+Usage:
+
+    python batch_split.py Descargas pdf_divididos --jobs 4 --max-memory-mb 4096
+    python batch_split.py Descargas informes --suggest-only
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from pdf_processor import PDFProcessor
+from analysis_pipeline import iter_cached_page_analysis
+from analysis_cache import get_default_cache
+from feature_store import FeatureStore
+from image_analyzer import DETECTOR_VERSION, suggested_split_flags
+from upload_ingest import hash_file
+from segment_writer import SAVE_PROFILES
+import metrics
+
+# Memoria fija estimada por documento abierto (intérprete, OpenCV, buffers)
+BASE_MEMORY_COST = 128 * 1024 * 1024
+
+# Zoom de detección (el mismo que usa la aplicación)
+ANALYSIS_ZOOM = 0.5
+
+
+def find_pdfs(input_dir):
+    """Return the paths of every PDF under input_dir, sorted"""
+    found = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def estimate_memory(pdf_path):
+    """
+    Rough memory cost of processing one PDF
+
+    The document is memory-mapped, so its size counts once, plus the
+    per-process base cost.
+    """
+    return os.path.getsize(pdf_path) + BASE_MEMORY_COST
+
+
+def process_pdf(pdf_path, input_dir, output_dir, suggest_only=False, use_cache=True,
+                save_profile=None, profile_dir=None, max_bytes=None, max_pages=None):
+    """
+    Analyze one PDF and split it at the suggested points
+
+    Args:
+        pdf_path: Path of the PDF
+        input_dir: Root of the scanned tree (to mirror relative paths)
+        output_dir: Root of the output tree
+        suggest_only: Only compute the suggested split points
+        use_cache: Reuse and fill the persistent analysis cache
+        save_profile: Save profile for the split segments (see SAVE_PROFILES)
+        profile_dir: Directory for a cProfile dump of this file (None = no profiling)
+        max_bytes: Maximum size of each split file; more split points are
+            added where needed (None = no limit)
+        max_pages: Maximum number of pages of each split file
+
+    Returns:
+        Manifest entry (dict) for this file
+    """
+    relative = os.path.relpath(pdf_path, input_dir)
+    if profile_dir:
+        profile_path = os.path.join(profile_dir, relative.replace(os.sep, "__") + ".prof")
+        with metrics.profiled(profile_path):
+            entry = _process_pdf(pdf_path, relative, output_dir, suggest_only, use_cache, save_profile,
+                                 max_bytes, max_pages)
+    else:
+        entry = _process_pdf(pdf_path, relative, output_dir, suggest_only, use_cache, save_profile,
+                             max_bytes, max_pages)
+    metrics.log_event("batch_file", **entry)
+    return entry
+
+
+def _process_in_worker(*args):
+    """Run process_pdf in a pool process and hand its metrics to the parent"""
+    entry = process_pdf(*args)
+    return entry, metrics.collect(reset=True)
+
+
+def _process_pdf(pdf_path, relative, output_dir, suggest_only, use_cache, save_profile,
+                 max_bytes=None, max_pages=None):
+    started = time.perf_counter()
+    entry = {"file": relative, "bytes": os.path.getsize(pdf_path)}
+    try:
+        processor = PDFProcessor(pdf_path, use_mmap=True)
+        work_dir = None
+        try:
+            cache = get_default_cache() if use_cache else None
+            doc_hash = hash_file(pdf_path)
+            # Registros de características, como en la aplicación: junto a la
+            # caché o, sin caché, en un directorio temporal
+            if cache is not None:
+                path = cache.feature_path(cache.document_key(doc_hash, DETECTOR_VERSION, ANALYSIS_ZOOM))
+            else:
+                work_dir = tempfile.mkdtemp(prefix="lote_")
+                path = os.path.join(work_dir, "features.npy")
+            features = FeatureStore(path, processor.get_total_pages())
+            stages = Counter()
+            stats = {}
+            try:
+                for page_idx, has_signature, _, stage in iter_cached_page_analysis(
+                    processor, doc_hash, cache=cache, workers=1, zoom=ANALYSIS_ZOOM, stats=stats,
+                    features=features,
+                ):
+                    stages[stage] += 1
+                features.flush()
+                # Las mismas sugerencias que el visor: veredicto del detector y
+                # páginas que se parecen a la primera página del PDF
+                flags, fingerprint_only = suggested_split_flags(features.array)
+            finally:
+                features.close()
+            suggested = (np.flatnonzero(flags) + 1).tolist()
+
+            entry["pages"] = processor.get_total_pages()
+            entry["suggested_splits"] = suggested
+            entry["fingerprint_splits"] = int(np.count_nonzero(fingerprint_only))
+            entry["stages"] = dict(stages)
+            entry["checkpoint_seconds"] = stats.get("checkpoint_seconds", 0.0)
+
+            # Límites de tamaño: cortes adicionales calculados sin guardar pruebas
+            split_points = suggested
+            if max_bytes is not None or max_pages is not None:
+                split_points, estimates = processor.plan_size_splits(max_bytes, max_pages, suggested)
+                entry["split_points"] = split_points
+                entry["estimated_segment_bytes"] = estimates
+
+            if not suggest_only:
+                target_dir = os.path.join(output_dir, os.path.dirname(relative))
+                os.makedirs(target_dir, exist_ok=True)
+                if split_points:
+                    outputs = processor.split_pdf(
+                        split_points, target_dir, original_filename=os.path.basename(pdf_path),
+                        workers=1, save_profile=save_profile,
+                    )
+                else:
+                    # Sin cortes, el PDF se copia entero como un único segmento
+                    # (con el nombre que le daría split_pdf) para que no falte
+                    # en la salida
+                    base, ext = os.path.splitext(os.path.basename(pdf_path))
+                    single = os.path.join(target_dir, f"{base}-1-{entry['pages']}{ext or '.pdf'}")
+                    shutil.copyfile(pdf_path, single)
+                    outputs = [single]
+                    entry["unsplit"] = True
+                entry["outputs"] = [os.path.relpath(path, output_dir) for path in outputs]
+        finally:
+            processor.close()
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        entry["error"] = None
+    except Exception as e:
+        entry["error"] = str(e)
+    entry["seconds"] = time.perf_counter() - started
+    return entry
+
+
+def run_batch(input_dir, output_dir, jobs=None, max_memory_mb=None, suggest_only=False,
+              use_cache=True, save_profile=None, profile_dir=None, max_size_mb=None, max_pages=None):
+    """
+    Process every PDF under input_dir with a bounded pool of processes
+
+    A new document is only started while the estimated memory of the
+    documents in progress stays below ``max_memory_mb`` (one document is
+    always allowed, however large).
+
+    Returns:
+        List of manifest entries, in the order of the input files
+    """
+    pdfs = find_pdfs(input_dir)
+    jobs = jobs or os.cpu_count() or 1
+    budget = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+    max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+    entries = {}
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = list(pdfs)
+        running = {}
+        in_use = 0
+        while pending or running:
+            # Admitir documentos mientras quepan en el presupuesto de memoria
+            while pending and len(running) < jobs:
+                cost = estimate_memory(pending[0])
+                if running and budget is not None and in_use + cost > budget:
+                    break
+                pdf_path = pending.pop(0)
+                future = executor.submit(_process_in_worker, pdf_path, input_dir, output_dir,
+                                         suggest_only, use_cache, save_profile, profile_dir,
+                                         max_bytes, max_pages)
+                running[future] = (pdf_path, cost)
+                in_use += cost
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_path, cost = running.pop(future)
+                in_use -= cost
+                entry, worker_metrics = future.result()
+                metrics.merge(worker_metrics)
+                entries[pdf_path] = entry
+                status = f"ERROR: {entry['error']}" if entry["error"] else (
+                    f"{entry['pages']} páginas, {len(entry['suggested_splits'])} divisiones sugeridas"
+                )
+                print(f"[{len(entries)}/{len(pdfs)}] {entry['file']}: {status}")
+
+    return [entries[pdf_path] for pdf_path in pdfs]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analiza y divide en lote todos los PDF de un directorio"
+    )
+    parser.add_argument("input_dir", help="Directorio con los PDF a procesar (se recorre recursivamente)")
+    parser.add_argument("output_dir", help="Directorio de salida para los PDF divididos y el manifiesto")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="PDF procesados a la vez (por defecto, uno por núcleo)")
+    parser.add_argument("--max-memory-mb", type=int, default=None,
+                        help="Memoria total estimada máxima de los PDF en curso")
+    parser.add_argument("--suggest-only", action="store_true",
+                        help="Solo calcular los puntos de división sugeridos, sin dividir")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="No usar la caché persistente de análisis")
+    parser.add_argument("--save-profile", choices=sorted(SAVE_PROFILES), default=None,
+                        help="Perfil de guardado de los PDF divididos (por defecto, "
+                             "PDF_SPLIT_SAVE_PROFILE o 'default')")
+    parser.add_argument("--max-size-mb", type=float, default=None,
+                        help="Tamaño máximo de cada PDF dividido; se añaden los cortes necesarios")
+    parser.add_argument("--max-pages", type=int, default=None,
+                        help="Número máximo de páginas de cada PDF dividido")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Guardar un perfil cProfile de cada PDF en este directorio")
+    parser.add_argument("--manifest", default="manifest.json",
+                        help="Nombre del manifiesto JSON dentro del directorio de salida")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.profile_dir:
+        os.makedirs(args.profile_dir, exist_ok=True)
+    started = time.perf_counter()
+    entries = run_batch(
+        args.input_dir,
+        args.output_dir,
+        jobs=args.jobs,
+        max_memory_mb=args.max_memory_mb,
+        suggest_only=args.suggest_only,
+        use_cache=not args.no_cache,
+        save_profile=args.save_profile,
+        profile_dir=args.profile_dir,
+        max_size_mb=args.max_size_mb,
+        max_pages=args.max_pages,
+    )
+    elapsed = time.perf_counter() - started
+    metrics.flush()
+
+    manifest_path = os.path.join(args.output_dir, args.manifest)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"input_dir": os.path.abspath(args.input_dir), "files": entries},
+                  f, indent=2, ensure_ascii=False)
+
+    ok = [entry for entry in entries if not entry["error"]]
+    pages = sum(entry["pages"] for entry in ok)
+    megabytes = sum(entry["bytes"] for entry in ok) / (1024 * 1024)
+    print("")
+    print(f"Archivos procesados: {len(ok)} de {len(entries)}")
+    print(f"Páginas: {pages}  |  Tiempo: {elapsed:.1f} s")
+    if elapsed > 0:
+        print(f"Rendimiento: {pages / elapsed:.1f} páginas/s, {megabytes / elapsed:.1f} MB/s")
+    print(f"Manifiesto: {manifest_path}")
+    return 0 if len(ok) == len(entries) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
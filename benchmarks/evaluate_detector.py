@@ -0,0 +1,249 @@
+"""
+Accuracy against throughput of the split detector
+
+Runs one or more detector configurations over a set of PDFs with known
+document boundaries and reports precision, recall, F1 and pages/second
+side by side, so a faster setting can be checked for missed boundaries.
+
+The ground truth is a JSON file mapping each PDF (path relative to the
+input directory) to the 1-based pages that end a document. The last page
+of each PDF is left out of the comparison: the file always ends there.
+
+A configuration is a dict of DEFAULT_DETECTOR_PARAMS overrides plus:
+
+- ``detector``: ``"exhaustive"`` (detect_split_points on the whole page),
+  ``"cascade"`` (detect_split_points_cascade), ``"features"`` (feature
+  records, as the analysis stores them) or
+  ``"pipeline"`` (analyze_page: text layer first, then features)
+- ``zoom``: detection zoom (0.5 by default)
+- ``sensitivity``: level from 1 to 10 applied with sensitivity_params
+- ``fingerprints``: also open a document on pages that look like the
+  first page, as the viewer does (``features`` and ``pipeline`` only)
+
+Usage (from the repository root):
+
+    python -m benchmarks.evaluate_detector
+    python -m benchmarks.evaluate_detector expedientes --ground-truth limites.json
+    python -m benchmarks.evaluate_detector expedientes --ground-truth limites.json \\
+        --configs configuraciones.json --output evaluacion.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from pdf_processor import PDFProcessor
+from analysis_pipeline import analyze_page, render_page_features
+from image_analyzer import (
+    detect_split_points,
+    detect_split_points_cascade,
+    empty_features,
+    fingerprint_boundaries,
+    sensitivity_params,
+    suggest_from_features,
+)
+from benchmarks.synthetic_bundle import generate_bundle
+
+DETECTORS = ("exhaustive", "cascade", "features", "pipeline")
+
+# Configuraciones comparadas si no se indica un archivo
+DEFAULT_CONFIGS = {
+    "exhaustive": {"detector": "exhaustive"},
+    "cascade": {"detector": "cascade"},
+    "features": {"detector": "features"},
+    "features_zoom_0.3": {"detector": "features", "zoom": 0.3},
+    "pipeline": {"detector": "pipeline", "fingerprints": True},
+}
+
+
+def split_config(config):
+    """
+    Separate the harness options of a configuration from the detector
+    parameters
+
+    Returns:
+        Tuple (options, params): ``options`` with ``detector``, ``zoom``
+        and ``fingerprints``, and the detector parameters (with the
+        sensitivity level applied, if any)
+    """
+    params = dict(config)
+    options = {
+        "detector": params.pop("detector", "features"),
+        "zoom": params.pop("zoom", 0.5),
+        "fingerprints": params.pop("fingerprints", False),
+    }
+    sensitivity = params.pop("sensitivity", None)
+    if options["detector"] not in DETECTORS:
+        raise ValueError(f"Detector desconocido: {options['detector']}")
+    if sensitivity is not None:
+        params = sensitivity_params(sensitivity, params)
+    return options, params
+
+
+def predict_document(pdf_path, options, params):
+    """
+    Run one configuration over every page of a PDF
+
+    Returns:
+        Tuple (flags, seconds): boolean array with one verdict per page
+        and the time spent rendering and analyzing
+    """
+    processor = PDFProcessor(pdf_path)
+    try:
+        total_pages = processor.get_total_pages()
+        features = empty_features(total_pages)
+        flags = np.zeros(total_pages, dtype=bool)
+        detector, zoom = options["detector"], options["zoom"]
+        started = time.perf_counter()
+        for page_idx in range(total_pages):
+            if detector == "pipeline":
+                flags[page_idx] = analyze_page(processor, page_idx, zoom, features=features,
+                                               params=params)[1]
+            elif detector == "features":
+                features[page_idx] = render_page_features(processor, page_idx, zoom, params)[0]
+                flags[page_idx] = suggest_from_features(features[page_idx], params)
+            else:
+                # Página completa con el zoom pedido (sin la reducción de las miniaturas)
+                pix, gray = processor.get_page_region_gray(page_idx, top=0, zoom=zoom)[:2]
+                if detector == "exhaustive":
+                    flags[page_idx] = detect_split_points(gray, params)
+                else:
+                    flags[page_idx] = detect_split_points_cascade(gray, params)["has_signature"]
+                del pix
+        if options["fingerprints"]:
+            flags |= fingerprint_boundaries(features, (0,), params)[0]
+        return flags, time.perf_counter() - started
+    finally:
+        processor.close()
+
+
+def score(flags, boundaries):
+    """
+    Compare predicted split points with the true ones (last page excluded)
+
+    Returns:
+        Dict with ``true_positives``, ``false_positives`` and
+        ``false_negatives``
+    """
+    predicted = set((np.flatnonzero(flags[:-1]) + 1).tolist())
+    expected = {page_num for page_num in boundaries if 0 < page_num < len(flags)}
+    return {
+        "true_positives": len(predicted & expected),
+        "false_positives": len(predicted - expected),
+        "false_negatives": len(expected - predicted),
+    }
+
+
+def summarize(counts, pages, seconds):
+    """Add precision, recall, F1 and pages/second to summed counts"""
+    tp, fp, fn = counts["true_positives"], counts["false_positives"], counts["false_negatives"]
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return dict(counts, precision=precision, recall=recall, f1=f1, pages=pages, seconds=seconds,
+                pages_per_second=pages / seconds if seconds else 0.0)
+
+
+def evaluate(documents, configs):
+    """
+    Evaluate every configuration on every document
+
+    Args:
+        documents: Dict {name: (pdf_path, boundaries)}
+        configs: Dict {name: configuration}
+
+    Returns:
+        Dict {config_name: summary} where each summary also has a
+        ``documents`` dict with the counts of every PDF
+    """
+    report = {}
+    for config_name, config in configs.items():
+        options, params = split_config(config)
+        totals = {"true_positives": 0, "false_positives": 0, "false_negatives": 0}
+        pages = 0
+        seconds = 0.0
+        per_document = {}
+        for name, (pdf_path, boundaries) in documents.items():
+            flags, elapsed = predict_document(pdf_path, options, params)
+            counts = score(flags, boundaries)
+            for key in totals:
+                totals[key] += counts[key]
+            pages += len(flags)
+            seconds += elapsed
+            per_document[name] = summarize(counts, len(flags), elapsed)
+        report[config_name] = summarize(totals, pages, seconds)
+        report[config_name]["config"] = config
+        report[config_name]["documents"] = per_document
+    return report
+
+
+def load_documents(input_dir, ground_truth_path):
+    """
+    Read the ground truth and resolve the PDF paths
+
+    Returns:
+        Dict {relative_path: (pdf_path, boundaries)}; PDFs listed in the
+        ground truth but missing on disk are reported and skipped
+    """
+    with open(ground_truth_path, encoding="utf-8") as f:
+        ground_truth = json.load(f)
+    documents = {}
+    for relative, boundaries in sorted(ground_truth.items()):
+        pdf_path = os.path.join(input_dir, relative)
+        if not os.path.exists(pdf_path):
+            print(f"PDF de la verdad de referencia no encontrado: {pdf_path}")
+            continue
+        documents[relative] = (pdf_path, [int(page_num) for page_num in boundaries])
+    return documents
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Evalúa la precisión y el rendimiento de configuraciones del detector"
+    )
+    parser.add_argument("input_dir", nargs="?",
+                        help="Directorio con los PDF (por defecto, un lote sintético)")
+    parser.add_argument("--ground-truth",
+                        help="JSON {pdf relativo: [páginas que cierran un documento]}")
+    parser.add_argument("--configs",
+                        help="JSON {nombre: {detector, zoom, sensitivity, fingerprints, parámetros}}")
+    parser.add_argument("--pages", type=int, default=50, help="Páginas del lote sintético")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Archivo JSON para guardar el informe")
+    args = parser.parse_args(argv)
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, encoding="utf-8") as f:
+            configs = json.load(f)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.input_dir:
+            if not args.ground_truth:
+                parser.error("--ground-truth es obligatorio con un directorio de entrada")
+            documents = load_documents(args.input_dir, args.ground_truth)
+        else:
+            pdf_path = os.path.join(work_dir, "bundle.pdf")
+            boundaries = generate_bundle(pdf_path, pages=args.pages, seed=args.seed)
+            documents = {"bundle.pdf": (pdf_path, boundaries)}
+        report = evaluate(documents, configs)
+
+    print(f"{'Configuración':<20} {'Precisión':>9} {'Exhaust.':>9} {'F1':>6} {'Págs/s':>8} "
+          f"{'VP':>5} {'FP':>5} {'FN':>5}")
+    for name, m in report.items():
+        print(f"{name:<20} {m['precision']:>9.3f} {m['recall']:>9.3f} {m['f1']:>6.3f} "
+              f"{m['pages_per_second']:>8.1f} {m['true_positives']:>5} {m['false_positives']:>5} "
+              f"{m['false_negatives']:>5}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
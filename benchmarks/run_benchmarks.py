@@ -0,0 +1,212 @@
+"""
+Performance benchmarks for the PDF splitter
+
+Generates a synthetic legal bundle, measures the hot paths and writes the
+results as JSON. With ``--baseline`` the run fails (exit code 1) when a
+metric is worse than the stored baseline by more than ``--threshold``.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks --pages 200 --output bench_results.json
+    python -m benchmarks.run_benchmarks --baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --baseline benchmarks/baseline.json --update-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from pdf_processor import PDFProcessor
+from analysis_cache import AnalysisCache
+from analysis_pipeline import AnalysisCheckpointer, analyze_page, lookup_cached_pages
+from image_analyzer import empty_features
+from zip_export import export_zip
+from benchmarks.synthetic_bundle import generate_bundle
+import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Métricas y sentido de la mejora: True si un valor mayor es mejor
+METRICS = {
+    "analysis_pages_per_second": True,
+    "split_seconds_per_gb": False,
+    "zip_export_seconds": False,
+    "checkpoint_overhead_percent": False,
+    "peak_rss_mb": False,
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its children, in MB"""
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Linux informa en KB y macOS en bytes
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def bench_analysis(processor, max_pages, zoom=0.5):
+    """
+    Pages per second of the application's per-page analysis
+
+    Runs ``analyze_page`` as the analysis workers do (text layer first,
+    then the page render, thumbnail and feature record) with the
+    detection zoom of BackgroundAnalysis and the default parameters, in
+    a single process.
+    """
+    pages = min(max_pages, processor.get_total_pages())
+    features = empty_features(pages)
+    started = time.perf_counter()
+    for page_idx in range(pages):
+        analyze_page(processor, page_idx, zoom, features=features)
+    return pages / (time.perf_counter() - started)
+
+
+def bench_checkpoint(processor, cache_dir, pages_per_second):
+    """
+    Checkpoint overhead as a percentage of the analysis time
+
+    Every page of the bundle is recorded with a real thumbnail and a
+    checkpoint is written after each page, so the result is an upper bound
+    (the analysis writes one every CACHE_WRITE_BATCH pages or
+    CHECKPOINT_SECONDS seconds).
+    """
+    cache = AnalysisCache(cache_dir)
+    doc_key, page_keys, cached = lookup_cached_pages(processor, "benchmark", cache)
+    checkpointer = AnalysisCheckpointer(cache, doc_key, page_keys, cached, interval=0)
+    thumbnail = processor.get_page_pixmap(0, zoom=0.5).tobytes("jpg", jpg_quality=80)
+    for page_idx in range(len(page_keys)):
+        checkpointer.record(page_idx, page_idx % 7 == 0, thumbnail)
+    checkpointer.finish()
+    analysis_seconds = len(page_keys) / pages_per_second
+    return 100 * checkpointer.seconds / analysis_seconds
+
+
+def bench_split(processor, split_points, output_dir):
+    """Seconds per GB of output written by split_pdf"""
+    started = time.perf_counter()
+    files = processor.split_pdf(split_points, output_dir)
+    elapsed = time.perf_counter() - started
+    written = sum(os.path.getsize(path) for path in files)
+    return elapsed / (written / (1024 ** 3)), files
+
+
+def run(args):
+    results = {
+        "pages": args.pages,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = os.path.join(work_dir, "bundle.pdf")
+        boundaries = generate_bundle(
+            pdf_path,
+            pages=args.pages,
+            scanned_ratio=args.scanned_ratio,
+            seed=args.seed,
+        )
+        results["bundle_bytes"] = os.path.getsize(pdf_path)
+
+        processor = PDFProcessor(pdf_path)
+        results["analysis_pages_per_second"] = bench_analysis(processor, args.analysis_pages)
+        results["checkpoint_overhead_percent"] = bench_checkpoint(
+            processor, os.path.join(work_dir, "cache"), results["analysis_pages_per_second"]
+        )
+
+        split_dir = os.path.join(work_dir, "split")
+        os.makedirs(split_dir)
+        # Si el lote no tiene límites, dividir cada 10 páginas
+        split_points = boundaries or list(range(10, args.pages, 10))
+        results["split_seconds_per_gb"], files = bench_split(processor, split_points, split_dir)
+
+        started = time.perf_counter()
+        export_zip(files, os.path.join(work_dir, "export.zip"), compression=args.compression)
+        results["zip_export_seconds"] = time.perf_counter() - started
+
+        processor.close()
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against a baseline
+
+    Returns:
+        List of messages describing the metrics that regressed by more than
+        ``threshold`` (a fraction, e.g. 0.15 for 15%)
+    """
+    regressions = []
+    for name, higher_is_better in METRICS.items():
+        current = results.get(name)
+        reference = baseline.get(name)
+        if current is None or not reference:
+            continue
+        change = (current - reference) / reference
+        worse = -change if higher_is_better else change
+        if worse > threshold:
+            regressions.append(
+                f"{name}: {current:.3f} frente a {reference:.3f} en la línea base ({worse:+.1%} peor)"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de rendimiento del divisor de PDF")
+    parser.add_argument("--pages", type=int, default=200, help="Páginas del lote sintético")
+    parser.add_argument("--analysis-pages", type=int, default=50,
+                        help="Páginas usadas para medir el análisis")
+    parser.add_argument("--scanned-ratio", type=float, default=0.5,
+                        help="Fracción de páginas escaneadas")
+    parser.add_argument("--compression", choices=("stored", "deflated"), default="stored")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", help="Archivo JSON con la línea base")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Regresión máxima tolerada respecto a la línea base (fracción)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Guardar estos resultados como nueva línea base")
+    parser.add_argument("--profile", help="Guardar un perfil cProfile de la ejecución en este archivo")
+    args = parser.parse_args(argv)
+
+    with metrics.profiled(args.profile):
+        results = run(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    for name in METRICS:
+        print(f"{name}: {results[name]}")
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Línea base actualizada: {args.baseline}")
+        return 0
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regresiones de rendimiento:")
+            for message in regressions:
+                print(f"  - {message}")
+            return 1
+        print("Sin regresiones respecto a la línea base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Compare the save profiles used to write split segments
+
+Splits the same PDF with every profile in SAVE_PROFILES and reports the
+bytes written and the save time of each one against the "default"
+profile (a plain ``Document.save``).
+
+Usage (from the repository root):
+
+    python -m benchmarks.save_profiles
+    python -m benchmarks.save_profiles expediente.pdf --every 20 --output perfiles.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from pdf_processor import PDFProcessor
+from segment_writer import SAVE_PROFILES
+from benchmarks.synthetic_bundle import generate_bundle
+
+
+def measure_profile(processor, split_points, output_dir, profile):
+    """
+    Split the document with one save profile
+
+    Returns:
+        Dict with ``bytes`` (total written), ``save_seconds`` (sum of the
+        ``Document.save`` calls), ``seconds`` (whole split) and ``files``
+    """
+    started = time.perf_counter()
+    files = processor.split_pdf(split_points, output_dir, workers=1, save_profile=profile)
+    elapsed = time.perf_counter() - started
+    return {
+        "bytes": sum(os.path.getsize(path) for path in files),
+        "save_seconds": sum(timing["save_seconds"] for timing in processor.last_split_timings),
+        "seconds": elapsed,
+        "files": len(files),
+    }
+
+
+def compare_profiles(pdf_path, split_points, profiles=None):
+    """
+    Measure every profile on the same document
+
+    Returns:
+        Dict {profile: measurements} with ``bytes_vs_default`` and
+        ``save_time_vs_default`` ratios added
+    """
+    profiles = profiles or list(SAVE_PROFILES)
+    report = {}
+    processor = PDFProcessor(pdf_path)
+    try:
+        for profile in profiles:
+            with tempfile.TemporaryDirectory() as output_dir:
+                report[profile] = measure_profile(processor, split_points, output_dir, profile)
+    finally:
+        processor.close()
+
+    default = report.get("default")
+    for measurements in report.values():
+        if default and default["bytes"]:
+            measurements["bytes_vs_default"] = measurements["bytes"] / default["bytes"]
+        if default and default["save_seconds"]:
+            measurements["save_time_vs_default"] = measurements["save_seconds"] / default["save_seconds"]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara los perfiles de guardado de los segmentos")
+    parser.add_argument("pdf", nargs="?", help="PDF a dividir (por defecto, un lote sintético)")
+    parser.add_argument("--pages", type=int, default=200, help="Páginas del lote sintético")
+    parser.add_argument("--every", type=int, default=10,
+                        help="Dividir cada N páginas si el PDF no tiene límites conocidos")
+    parser.add_argument("--output", help="Archivo JSON para guardar el informe")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = args.pdf
+        boundaries = []
+        if pdf_path is None:
+            pdf_path = os.path.join(work_dir, "bundle.pdf")
+            boundaries = generate_bundle(pdf_path, pages=args.pages)
+        probe = PDFProcessor(pdf_path)
+        total_pages = probe.get_total_pages()
+        probe.close()
+        split_points = boundaries or list(range(args.every, total_pages, args.every))
+        report = compare_profiles(pdf_path, split_points)
+
+    print(f"{'Perfil':<10} {'Bytes':>12} {'vs default':>11} {'Guardado (s)':>13} {'vs default':>11}")
+    for profile, m in report.items():
+        print(f"{profile:<10} {m['bytes']:>12} {m.get('bytes_vs_default', 0):>10.1%} "
+              f"{m['save_seconds']:>13.3f} {m.get('save_time_vs_default', 0):>10.1%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import io
+import random
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+# Tamaño carta en puntos
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+_PARAGRAPH = (
+    "Por medio del presente escrito me permito allegar al despacho la documentación "
+    "solicitada dentro del proceso de la referencia, con el fin de que obre como prueba "
+    "y sea tenida en cuenta en la oportunidad procesal correspondiente. "
+)
+
+
+def _scanned_background(rng, width, height):
+    """Grayscale 'scan' with paper noise and a few dark text-like bars"""
+    img = rng.normal(235, 12, (height, width)).clip(0, 255).astype(np.uint8)
+    for row in range(60, int(height * 0.55), 22):
+        length = int(rng.integers(width // 3, width - 120))
+        img[row:row + 6, 60:60 + length] = rng.integers(20, 80)
+    buffer = io.BytesIO()
+    Image.fromarray(img, mode="L").save(buffer, format="JPEG", quality=70)
+    return buffer.getvalue()
+
+
+def _draw_signature(page, rng):
+    """Handwriting-like stroke in the bottom part of the page"""
+    x = float(rng.uniform(80, PAGE_WIDTH - 260))
+    y = float(rng.uniform(PAGE_HEIGHT * 0.72, PAGE_HEIGHT * 0.85))
+    points = [fitz.Point(x, y)]
+    for _ in range(14):
+        x += float(rng.uniform(8, 16))
+        y += float(rng.uniform(-14, 14))
+        points.append(fitz.Point(x, y))
+    shape = page.new_shape()
+    shape.draw_polyline(points)
+    shape.finish(color=(0, 0, 0.4), width=2.5)
+    shape.commit()
+
+
+def _draw_stamp(page, rng):
+    """Circular stamp with a ring and a label"""
+    center = fitz.Point(float(rng.uniform(150, PAGE_WIDTH - 150)),
+                        float(rng.uniform(PAGE_HEIGHT * 0.6, PAGE_HEIGHT - 120)))
+    radius = float(rng.uniform(50, 80))
+    shape = page.new_shape()
+    shape.draw_circle(center, radius)
+    shape.draw_circle(center, radius - 8)
+    shape.finish(color=(0.6, 0, 0), width=2)
+    shape.commit()
+    page.insert_text(center + (-30, 4), "RADICADO", fontsize=9, color=(0.6, 0, 0))
+
+
+def generate_bundle(path, pages=100, scanned_ratio=0.5, signature_ratio=0.15,
+                    stamp_ratio=0.05, seed=0):
+    """
+    Generate a synthetic legal bundle for benchmarks
+
+    Pages are either born-digital text pages or 'scanned' pages made of a
+    noisy full-page image. Some pages close a document with a
+    signature-like stroke and/or a circular stamp; those are recorded as
+    the ground-truth split points.
+
+    Args:
+        path: Output PDF path
+        pages: Number of pages
+        scanned_ratio: Fraction of scanned-image pages
+        signature_ratio: Fraction of pages ending with a signature
+        stamp_ratio: Fraction of pages ending with a stamp
+        seed: Random seed (the same seed produces the same bundle)
+
+    Returns:
+        Sorted list of 1-based page numbers that end a document
+    """
+    rng = np.random.default_rng(seed)
+    chooser = random.Random(seed)
+    doc = fitz.open()
+    # Unas pocas imágenes de escaneo reutilizadas, como en un lote real
+    scans = [_scanned_background(rng, 850, 1100) for _ in range(4)]
+    boundaries = []
+
+    for page_num in range(1, pages + 1):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        if chooser.random() < scanned_ratio:
+            page.insert_image(page.rect, stream=chooser.choice(scans))
+        else:
+            box = fitz.Rect(72, 72, PAGE_WIDTH - 72, PAGE_HEIGHT * 0.6)
+            page.insert_textbox(box, _PARAGRAPH * 6, fontsize=11)
+
+        signed = chooser.random() < signature_ratio
+        stamped = chooser.random() < stamp_ratio
+        if signed:
+            _draw_signature(page, rng)
+        if stamped:
+            _draw_stamp(page, rng)
+        if signed or stamped:
+            boundaries.append(page_num)
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return boundaries
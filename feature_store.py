@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+
+# feature_path vive en analysis_cache: la caché borra el archivo al desalojar el documento
+from analysis_cache import feature_path
+from image_analyzer import FEATURE_DTYPE, FEATURE_SOURCE_FIXED, empty_features
+
+
+def open_features(path, mode="r+"):
+    """Memory-map an existing feature file (used by the analysis workers)"""
+    return np.load(path, mmap_mode=mode)
+
+
+class FeatureStore:
+    """
+    Per-page detector features of one document, memory-mapped from a .npy file
+
+    One FEATURE_DTYPE record per page (a few hundred bytes), written by the
+    analysis processes as pages complete. The split suggestions can be
+    recomputed from the whole array with ``suggest_from_features`` when
+    the detector thresholds change, without rendering any page again.
+    """
+
+    def __init__(self, path, total_pages):
+        """
+        Open the file if it holds records for ``total_pages`` pages, or
+        create it with empty records
+
+        Args:
+            path: Path of the .npy file
+            total_pages: Number of pages in the document
+        """
+        self.path = path
+        self.total_pages = total_pages
+        self._array = None
+        if os.path.exists(path):
+            try:
+                existing = open_features(path)
+                if existing.dtype == FEATURE_DTYPE and existing.shape == (total_pages,):
+                    self._array = existing
+            except (OSError, ValueError) as e:
+                print(f"No se pudieron leer las características de {path}: {str(e)}")
+        if self._array is None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._array = np.lib.format.open_memmap(
+                path, mode="w+", dtype=FEATURE_DTYPE, shape=(total_pages,)
+            )
+
+    @property
+    def array(self):
+        """Structured array of records, one per page"""
+        return self._array
+
+    def put(self, page_idx, record):
+        self._array[page_idx] = record
+
+    def put_fixed(self, page_idx, verdict, fingerprint=None):
+        """
+        Record a page whose verdict does not depend on the image thresholds
+
+        Args:
+            page_idx: Page index (0-based)
+            verdict: Fixed split verdict of the page
+            fingerprint: Page fingerprint, when known (see
+                ``analysis_pipeline.render_page_fingerprint``)
+        """
+        record = empty_features()
+        record["source"] = FEATURE_SOURCE_FIXED
+        record["fixed_verdict"] = bool(verdict)
+        if fingerprint is not None:
+            record["fingerprint"] = fingerprint
+            record["has_fingerprint"] = True
+        self._array[page_idx] = record
+
+    def flush(self):
+        self._array.flush()
+
+    def close(self):
+        if self._array is not None:
+            self._array.flush()
+            self._array = None
@@ -1,69 +1,172 @@
+import time
+import unicodedata
+
 import cv2
 import numpy as np
 from PIL import Image
 
-def detect_split_points(pil_image):
+import metrics
+
+# Versión del detector: incrementar cada vez que cambie su lógica o sus umbrales
+# para invalidar los resultados guardados en la caché de análisis
+DETECTOR_VERSION = "8"
+
+# Parámetros del detector (los valores por defecto son los determinados experimentalmente)
+DEFAULT_DETECTOR_PARAMS = {
+    # Preprocesado
+    "clahe_clip_limit": 2.0,
+    "clahe_tile_grid": 8,
+    "ink_threshold": 150,
+    # Firmas: contornos medianos/grandes, más anchos que altos, en la mitad inferior
+    "signature_min_area": 1000,
+    "signature_min_aspect": 1,
+    "signature_max_aspect": 8,
+    "signature_region": 0.5,
+    # Densidad de tinta en la franja inferior de la página
+    "density_region": 0.7,
+    "density_threshold": 0.03,
+    # Sellos circulares (HoughCircles), buscados desde esta fracción de la
+    # altura hacia abajo, donde se sellan los documentos
+    "stamp_region": 0.5,
+    "hough_dp": 1,
+    "hough_min_dist": 20,
+    "hough_param1": 50,
+    "hough_param2": 30,
+    "hough_min_radius": 20,
+    "hough_max_radius": 100,
+    # Huellas de página (dHash de 64 bits): inicio de documento si la página se
+    # parece a una primera página conocida y no a la página anterior
+    "fingerprint_first_distance": 10,
+    "fingerprint_change_distance": 20,
+}
+
+# Etapas de la cascada, de la más barata a la más costosa
+CASCADE_STAGES = ("density", "signature", "stamp")
+
+
+def _detector_params(params):
+    """Merge user parameters over the defaults"""
+    merged = dict(DEFAULT_DETECTOR_PARAMS)
+    if params:
+        merged.update(params)
+    return merged
+
+
+def _to_gray(pil_image):
+    # Convert PIL image to OpenCV format (numpy array); arrays are not copied
+    img_np = np.asarray(pil_image)
+    
+    # Convert to grayscale if the image is in color
+    if len(img_np.shape) == 3:
+        return cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
+    # Solo se lee: CLAHE y el umbral generan imágenes nuevas
+    return img_np
+
+
+def _clahe_padding(height, width, tiles):
+    """Rows and columns OpenCV adds to an image before splitting it into CLAHE tiles"""
+    if height % tiles == 0 and width % tiles == 0:
+        return 0, 0
+    return tiles - height % tiles, tiles - width % tiles
+
+
+def _enhance(gray, p, offset=0, page_height=None):
+    # Preprocessing: enhance contrast
+    tile = int(p["clahe_tile_grid"])
+    clahe = cv2.createCLAHE(clipLimit=p["clahe_clip_limit"], tileGridSize=(tile, tile))
+    if not offset:
+        return clahe.apply(gray)
+    # Parte inferior de una página (ver analysis_clip_row): se coloca en un
+    # lienzo del tamaño de la página para que CLAHE use las mismas teselas y
+    # los mismos coeficientes de interpolación que con la página completa
+    rows = min(gray.shape[0], page_height - offset)
+    canvas = np.zeros((page_height, gray.shape[1]), dtype=np.uint8)
+    canvas[offset:offset + rows] = gray[:rows]
+    return clahe.apply(canvas)[offset:offset + rows]
+
+
+def _is_signature(contour, p, y_offset, height):
+    """Size and shape attributes typical of signatures"""
+    area = cv2.contourArea(contour)
+    if area < 100:  # Skip very small noise
+        return False
+    
+    x, y, w, h = cv2.boundingRect(contour)
+    aspect_ratio = w / h if h > 0 else 0
+    
+    # Typical signatures have these attributes:
+    # - Medium to large area
+    # - Width greater than height (aspect ratio > 1)
+    # - Located in the bottom half of the page
+    return (area > p["signature_min_area"]
+            and p["signature_min_aspect"] < aspect_ratio < p["signature_max_aspect"]
+            and y + y_offset > height * p["signature_region"])
+
+
+def _find_circles(enhanced, p, offset=0, height=None):
+    """
+    Look for stamp-like circles in the stamp region of the page
+    
+    ``enhanced`` holds the enhanced page rows from ``offset`` down, of a
+    page ``height`` rows high (None = the image height); only the rows
+    from ``stamp_region`` down are searched.
+    """
+    top = int((height or enhanced.shape[0]) * p["stamp_region"]) - offset
+    return cv2.HoughCircles(
+        enhanced[max(0, top):], 
+        cv2.HOUGH_GRADIENT, 
+        dp=p["hough_dp"], 
+        minDist=p["hough_min_dist"], 
+        param1=p["hough_param1"], 
+        param2=p["hough_param2"], 
+        # OpenCV exige radios enteros (sensitivity_params los escala)
+        minRadius=int(round(p["hough_min_radius"])), 
+        maxRadius=int(round(p["hough_max_radius"]))
+    )
+
+
+def detect_split_points(pil_image, params=None):
     """
     Analyze a page image to detect signatures, stamps, or other markers 
     that indicate a potential document boundary
     
+    Runs every check on the whole page; ``detect_split_points_cascade``
+    gives the same verdict with an early exit.
+    
     Args:
-        pil_image: PIL Image object of the PDF page
+        pil_image: PIL Image object of the PDF page, or a NumPy array
+            (a 2D grayscale array is used as is, without copying)
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS
         
     Returns:
         Boolean indicating if this page might be a good split point
     """
-    # Convert PIL image to OpenCV format (numpy array)
-    img_np = np.array(pil_image)
-    
-    # Convert to grayscale if the image is in color
-    if len(img_np.shape) == 3:
-        gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = img_np.copy()
-    
-    # Preprocessing: enhance contrast
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    enhanced = clahe.apply(gray)
+    p = _detector_params(params)
+    started = time.perf_counter()
+    gray = _to_gray(pil_image)
+    enhanced = _enhance(gray, p)
     
     # Apply threshold to segment ink from background
-    _, thresh = cv2.threshold(enhanced, 150, 255, cv2.THRESH_BINARY_INV)
+    _, thresh = cv2.threshold(enhanced, p["ink_threshold"], 255, cv2.THRESH_BINARY_INV)
+    metrics.observe("pdf_detector_stage_seconds", time.perf_counter() - started,
+                    detector="exhaustive", stage="preprocess")
     
     # Signature and stamp detection strategies:
     has_signature = False
     
     # 1. Look for handwritten signature patterns
     # - Detect connected components that might be signatures
+    started = time.perf_counter()
     contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     # Filter contours by size and shape attributes typical of signatures
-    signature_candidates = []
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area < 100:  # Skip very small noise
-            continue
-            
-        x, y, w, h = cv2.boundingRect(contour)
-        aspect_ratio = w / h if h > 0 else 0
-        
-        # Typical signatures have these attributes:
-        # - Medium to large area
-        # - Width greater than height (aspect ratio > 1)
-        # - Located in the bottom half of the page
-        if area > 1000 and 1 < aspect_ratio < 8 and y > gray.shape[0] * 0.5:
-            signature_candidates.append(contour)
-    
-    # 2. Check for stamp-like circular patterns
-    circles = cv2.HoughCircles(
-        enhanced, 
-        cv2.HOUGH_GRADIENT, 
-        dp=1, 
-        minDist=20, 
-        param1=50, 
-        param2=30, 
-        minRadius=20, 
-        maxRadius=100
-    )
+    signature_candidates = [c for c in contours if _is_signature(c, p, 0, gray.shape[0])]
+    metrics.observe("pdf_detector_stage_seconds", time.perf_counter() - started,
+                    detector="exhaustive", stage="signature")
+    
+    # 2. Check for stamp-like circular patterns in the lower part of the page
+    with metrics.timed("pdf_detector_stage_seconds", detector="exhaustive", stage="stamp"):
+        circles = _find_circles(enhanced, p)
     
     # Decision rules for suggesting a split
     if len(signature_candidates) >= 1:
@@ -75,11 +178,534 @@ def detect_split_points(pil_image):
         has_signature = True
     
     # Look for textual indicators in the bottom portion of the page
-    bottom_region = thresh[int(thresh.shape[0] * 0.7):, :]
+    started = time.perf_counter()
+    bottom_region = thresh[int(thresh.shape[0] * p["density_region"]):, :]
     text_density = np.sum(bottom_region) / (bottom_region.shape[0] * bottom_region.shape[1])
+    metrics.observe("pdf_detector_stage_seconds", time.perf_counter() - started,
+                    detector="exhaustive", stage="density")
     
     # High text density in bottom portion can indicate signature blocks, dates, etc.
-    if text_density > 0.03:  # Threshold determined experimentally
+    if text_density > p["density_threshold"]:
         has_signature = True
     
     return has_signature
+
+
+def detect_split_points_cascade(pil_image, params=None, stages=CASCADE_STAGES):
+    """
+    Staged version of ``detect_split_points`` that stops at the first
+    stage that finds a split marker
+    
+    Stages run in the given order (cheapest first by default) and each one
+    only looks at its region of the page:
+    
+    - ``density``: ink density in the bottom strip
+    - ``signature``: signature-like contours, searched in the bottom half
+    - ``stamp``: circular stamps (Hough transform), searched in the stamp
+      region
+    
+    Contrast enhancement is always computed on the whole page so that the
+    thresholded pixels are the same as in ``detect_split_points``.
+    
+    Args:
+        pil_image: PIL Image or NumPy array of the page
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS
+        stages: Names of the stages to run, in order
+        
+    Returns:
+        Dict with ``has_signature`` (bool), ``stage`` (name of the stage
+        that fired, or None) and ``timings`` ({stage: seconds}, including
+        ``"preprocess"``)
+    """
+    p = _detector_params(params)
+    timings = {}
+    
+    started = time.perf_counter()
+    gray = _to_gray(pil_image)
+    height = gray.shape[0]
+    enhanced = _enhance(gray, p)
+    
+    # Umbral solo desde una fila por encima de la región más alta que se usa,
+    # para saber si un contorno cortado continúa hacia arriba
+    top = min(int(height * p["signature_region"]), int(height * p["density_region"]))
+    top = max(0, top - 1)
+    _, thresh = cv2.threshold(enhanced[top:], p["ink_threshold"], 255, cv2.THRESH_BINARY_INV)
+    timings["preprocess"] = time.perf_counter() - started
+    
+    for stage in stages:
+        started = time.perf_counter()
+        if stage == "density":
+            bottom_region = thresh[int(height * p["density_region"]) - top:, :]
+            text_density = np.sum(bottom_region) / (bottom_region.shape[0] * bottom_region.shape[1])
+            fired = text_density > p["density_threshold"]
+        elif stage == "signature":
+            fired = _has_signature_contour(thresh, top, height, p)
+        elif stage == "stamp":
+            circles = _find_circles(enhanced, p)
+            fired = circles is not None and len(circles) > 0
+        else:
+            raise ValueError(f"Etapa desconocida: {stage}")
+        timings[stage] = time.perf_counter() - started
+        if fired:
+            _record_cascade(timings, stage)
+            return {"has_signature": True, "stage": stage, "timings": timings}
+    
+    _record_cascade(timings, None)
+    return {"has_signature": False, "stage": None, "timings": timings}
+
+
+def _record_cascade(timings, exit_stage):
+    """Publish the stage timings and the exit stage of one cascade run"""
+    for stage, seconds in timings.items():
+        metrics.observe("pdf_detector_stage_seconds", seconds, detector="cascade", stage=stage)
+    metrics.inc("pdf_detector_exits_total", stage=exit_stage or "none")
+
+
+def _has_signature_contour(thresh, top, height, p):
+    """
+    Look for signature contours in the bottom region of the page
+    
+    ``thresh`` holds the thresholded rows from ``top`` down; its first row
+    is only used to tell whether a contour touching the region's upper edge
+    continues above it, in which case it starts in the upper part of the
+    page and does not count.
+    """
+    region_top = int(height * p["signature_region"])
+    offset = region_top - top
+    region = thresh[offset:]
+    contours, _ = cv2.findContours(region, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if y == 0 and offset > 0 and thresh[offset - 1, max(0, x - 1):x + w + 1].any():
+            continue
+        if _is_signature(contour, p, region_top, height):
+            return True
+    return False
+
+
+# Registro de características por página (ver extract_page_features).
+# Franjas horizontales para la densidad de tinta por región
+FEATURE_DENSITY_BANDS = 20
+# Contornos candidatos a firma guardados por página (los de mayor área)
+FEATURE_MAX_CONTOURS = 24
+# Solo se guardan contornos cuyo borde superior está por debajo de esta fracción
+FEATURE_MIN_REGION = 0.3
+# Márgenes de proporción ancho/alto de los contornos guardados
+FEATURE_ASPECT_RANGE = (0.5, 16)
+# Círculos candidatos a sello guardados por página
+FEATURE_MAX_CIRCLES = 8
+
+# Origen del registro: sin datos, veredicto fijo (capa de texto o caché) o imagen
+FEATURE_SOURCE_NONE = 0
+FEATURE_SOURCE_FIXED = 1
+FEATURE_SOURCE_RASTER = 2
+
+FEATURE_DTYPE = np.dtype([
+    ("source", "u1"),
+    ("fixed_verdict", "?"),
+    ("height", "u2"),
+    ("width", "u2"),
+    # Valor medio del umbral (escala 0-255, como en detect_split_points) por franja
+    ("band_ink", "f4", (FEATURE_DENSITY_BANDS,)),
+    # Área en píxeles (0 = hueco libre), proporción ancho/alto y borde superior
+    # como fracción de la altura de la página
+    ("contour_area", "f4", (FEATURE_MAX_CONTOURS,)),
+    ("contour_aspect", "f4", (FEATURE_MAX_CONTOURS,)),
+    ("contour_top", "f4", (FEATURE_MAX_CONTOURS,)),
+    # La etapa de sellos solo se ejecuta si las etapas baratas no deciden
+    ("stamp_checked", "?"),
+    ("circle_radius", "f4", (FEATURE_MAX_CIRCLES,)),
+    # Huella perceptual de la página (ver page_fingerprint); la calcula el
+    # análisis para todas las páginas, también las resueltas sin imagen
+    ("fingerprint", "u8"),
+    ("has_fingerprint", "?"),
+])
+
+
+def empty_features(count=None):
+    """Zeroed feature record (or array of ``count`` records)"""
+    if count is None:
+        return np.zeros((), dtype=FEATURE_DTYPE)
+    return np.zeros(count, dtype=FEATURE_DTYPE)
+
+
+def analysis_region_top(params=None):
+    """
+    Upper edge, as a fraction of the page height, of the region the
+    detector reads (the highest of the signature, density and stamp
+    regions)
+    """
+    p = _detector_params(params)
+    return min(p["signature_region"], p["density_region"], p["stamp_region"])
+
+
+def analysis_clip_row(height, width, params=None):
+    """
+    First page row to render when only the lower part of a page is analyzed
+    
+    The row is the upper edge of a row of CLAHE tiles far enough above
+    ``analysis_region_top`` (and the row above it, used to tell whether a
+    contour continues upwards) that every row the detector reads gets the
+    same contrast enhancement as in the whole page, so the region and the
+    whole page give the same feature record.
+    
+    Args:
+        height: Page height in rows at the detection zoom
+        width: Page width in columns at the detection zoom
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS
+        
+    Returns:
+        Page row (0 = the whole page is needed)
+    """
+    p = _detector_params(params)
+    tiles = int(p["clahe_tile_grid"])
+    tile_height = (height + _clahe_padding(height, width, tiles)[0]) // tiles
+    needed = int(height * analysis_region_top(p)) - 1
+    # CLAHE interpola cada fila entre su fila de teselas y la vecina: la
+    # primera fila necesaria debe quedar en la mitad inferior de una tesela
+    return max(0, int(needed / tile_height - 0.5)) * tile_height
+
+
+def extract_page_features(pil_image, params=None, check_stamps=False, offset=0, page_height=None):
+    """
+    Measure the features the detector decides on, so the decision can be
+    repeated later with other thresholds without rendering the page again
+    
+    The record holds the ink density of each horizontal band, the largest
+    contours in the lower part of the page and the circles found by the
+    stamp stage. As in the cascade, the (expensive) stamp stage only runs
+    when the density and signature checks do not fire with ``params``,
+    unless ``check_stamps`` is True.
+    
+    The image may be the whole page or only its lower part, starting at
+    row ``offset`` (see ``analysis_clip_row``) of a page ``page_height``
+    rows high; every stage reads only rows inside that part, so the record
+    is the same as for the whole page. Bands above the region are left
+    empty. The fingerprint is not measured here (see
+    ``analysis_pipeline.render_page_fingerprint``).
+    
+    Args:
+        pil_image: PIL Image or NumPy array of the page or of its lower part
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS (the
+            preprocessing and Hough parameters are fixed in the record)
+        check_stamps: Always run the stamp stage
+        offset: Page row of the first row of the image
+        page_height: Height of the whole page in rows (None = the image height)
+        
+    Returns:
+        NumPy record of dtype FEATURE_DTYPE
+    """
+    p = _detector_params(params)
+    record = empty_features()
+    record["source"] = FEATURE_SOURCE_RASTER
+    
+    started = time.perf_counter()
+    gray = _to_gray(pil_image)
+    width = gray.shape[1]
+    height = page_height or gray.shape[0]
+    record["height"] = height
+    record["width"] = width
+    enhanced = _enhance(gray, p, offset, height)
+    _, thresh = cv2.threshold(enhanced, p["ink_threshold"], 255, cv2.THRESH_BINARY_INV)
+    metrics.observe("pdf_detector_stage_seconds", time.perf_counter() - started,
+                    detector="features", stage="preprocess")
+    
+    with metrics.timed("pdf_detector_stage_seconds", detector="features", stage="density"):
+        edges = _band_edges(height) - offset
+        row_ink = thresh.mean(axis=1, dtype=np.float64)
+        for band in range(FEATURE_DENSITY_BANDS):
+            rows = row_ink[max(0, edges[band]):max(0, edges[band + 1])]
+            record["band_ink"][band] = rows.mean() if len(rows) else 0.0
+    
+    with metrics.timed("pdf_detector_stage_seconds", detector="features", stage="signature"):
+        # Con una región, los contornos se buscan desde analysis_region_top;
+        # la fila anterior dice si un contorno que toca ese borde continúa
+        # por encima (y entonces no se cuenta, como en la cascada)
+        first = int(height * analysis_region_top(p)) - offset if offset else 0
+        contours, _ = cv2.findContours(thresh[first:], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        candidates = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area < 100:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            if y == 0 and first > 0 and thresh[first - 1, max(0, x - 1):x + w + 1].any():
+                continue
+            aspect = w / h if h > 0 else 0
+            top = (y + first + offset) / height
+            if top > FEATURE_MIN_REGION and FEATURE_ASPECT_RANGE[0] < aspect < FEATURE_ASPECT_RANGE[1]:
+                candidates.append((area, aspect, top))
+        candidates.sort(reverse=True)
+        for i, (area, aspect, top) in enumerate(candidates[:FEATURE_MAX_CONTOURS]):
+            record["contour_area"][i] = area
+            record["contour_aspect"][i] = aspect
+            record["contour_top"][i] = top
+    
+    if check_stamps or not suggest_from_features(record, p):
+        with metrics.timed("pdf_detector_stage_seconds", detector="features", stage="stamp"):
+            circles = _find_circles(enhanced, p, offset, height)
+        record["stamp_checked"] = True
+        if circles is not None:
+            radii = circles[0][:FEATURE_MAX_CIRCLES, 2]
+            record["circle_radius"][:len(radii)] = radii
+    return record
+
+
+def _band_edges(height):
+    """First row of each density band (and the end of the last one)"""
+    return (np.arange(FEATURE_DENSITY_BANDS + 1) * height) // FEATURE_DENSITY_BANDS
+
+
+def _evaluate_features(features, p):
+    """
+    Per-stage verdicts for an array of feature records
+
+    Returns:
+        Tuple (density, signature, stamp) of boolean arrays
+    """
+    features = np.atleast_1d(features)
+    
+    # Densidad: media ponderada de las franjas desde la región inferior
+    heights = features["height"].astype(np.int64)
+    edges = (np.arange(FEATURE_DENSITY_BANDS + 1)[None, :] * heights[:, None]) // FEATURE_DENSITY_BANDS
+    rows_per_band = np.diff(edges, axis=1)
+    first_band = min(FEATURE_DENSITY_BANDS - 1, int(round(p["density_region"] * FEATURE_DENSITY_BANDS)))
+    rows = rows_per_band[:, first_band:]
+    ink = (features["band_ink"][:, first_band:] * rows).sum(axis=1)
+    density = ink / np.maximum(rows.sum(axis=1), 1) > p["density_threshold"]
+    
+    area = features["contour_area"]
+    aspect = features["contour_aspect"]
+    signature = (
+        (area > p["signature_min_area"])
+        & (aspect > p["signature_min_aspect"])
+        & (aspect < p["signature_max_aspect"])
+        & (features["contour_top"] > p["signature_region"])
+    ).any(axis=1)
+    
+    radius = features["circle_radius"]
+    stamp = (
+        (radius > 0)
+        & (radius >= p["hough_min_radius"])
+        & (radius <= p["hough_max_radius"])
+    ).any(axis=1)
+    return density, signature, stamp
+
+
+def suggest_from_features(features, params=None):
+    """
+    Recompute split suggestions from stored feature records
+    
+    Pages whose verdict was fixed (text layer or an older cache entry)
+    keep it. Pages without a record are not suggested.
+    
+    Args:
+        features: One record or an array of FEATURE_DTYPE records
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS
+        
+    Returns:
+        bool for a single record, boolean array for an array
+    """
+    p = _detector_params(params)
+    density, signature, stamp = _evaluate_features(features, p)
+    records = np.atleast_1d(features)
+    raster = records["source"] == FEATURE_SOURCE_RASTER
+    verdict = np.where(raster, density | signature | stamp, records["fixed_verdict"])
+    verdict &= records["source"] != FEATURE_SOURCE_NONE
+    if np.ndim(features) == 0:
+        return bool(verdict[0])
+    return verdict
+
+
+def pages_missing_stamp_check(features, params=None):
+    """
+    Pages whose verdict with ``params`` depends on a stamp stage that was
+    never run (the cheap stages fired with the thresholds used during the
+    analysis but not with these)
+    
+    Returns:
+        Array of page indices
+    """
+    p = _detector_params(params)
+    density, signature, _ = _evaluate_features(features, p)
+    records = np.atleast_1d(features)
+    return np.flatnonzero(
+        (records["source"] == FEATURE_SOURCE_RASTER)
+        & ~records["stamp_checked"]
+        & ~(density | signature)
+    )
+
+
+def sensitivity_params(level, params=None):
+    """
+    Detector thresholds for a sensitivity level from 1 (strict) to 10
+    
+    Level 5 gives DEFAULT_DETECTOR_PARAMS (or ``params``); each step
+    scales the ink-density threshold by 10^0.6 and the minimum signature
+    area by sqrt(2). Below level 5 each step also raises the minimum stamp
+    radius by 2^0.25 (smaller circles than the default minimum are not
+    stored in the feature records, so it is never lowered).
+    
+    Returns:
+        Dict of detector parameters
+    """
+    p = _detector_params(params)
+    steps = 5 - level
+    p["density_threshold"] = p["density_threshold"] * 10 ** (0.6 * steps)
+    p["signature_min_area"] = p["signature_min_area"] * 2 ** (steps / 2)
+    p["hough_min_radius"] = p["hough_min_radius"] * 2 ** (max(0, steps) / 4)
+    return p
+
+
+def page_fingerprint(gray):
+    """
+    64-bit difference hash (dHash) of a grayscale page
+
+    The page is reduced to 9x8 pixels and each bit tells whether a pixel
+    is brighter than its right neighbour, so pages with the same layout
+    (e.g. the letterhead of a first page) have close fingerprints.
+
+    Returns:
+        NumPy uint64
+    """
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return np.packbits(bits.ravel()).view(">u8")[0].astype(np.uint64)
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between uint64 fingerprints (broadcast like a ^ b)"""
+    diff = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    return np.unpackbits(diff[..., None].view(np.uint8), axis=-1).sum(axis=-1)
+
+
+def fingerprint_boundaries(features, first_pages=(0,), params=None):
+    """
+    Score every page transition with the page fingerprints in one pass
+    
+    A page is taken as the start of a new document when its fingerprint is
+    close to one of the known first pages and far from the previous page.
+    Pages without a fingerprint (not analyzed yet) are not compared.
+    
+    Args:
+        features: Array of FEATURE_DTYPE records, one per page
+        first_pages: Indices (0-based) of pages known to start a document
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS
+        
+    Returns:
+        Tuple (flags, scores) aligned with the split flags: ``flags[i]`` is
+        True when page ``i + 1`` looks like a first page (so the document
+        ends at page ``i``) and ``scores[i]`` is the distance to the
+        previous page minus the distance to the nearest first page, in
+        bits (0 where it cannot be computed)
+    """
+    p = _detector_params(params)
+    count = len(features)
+    flags = np.zeros(count, dtype=bool)
+    scores = np.zeros(count, dtype=np.float32)
+    if count < 2:
+        return flags, scores
+    
+    fingerprints = features["fingerprint"]
+    valid = features["has_fingerprint"]
+    first_pages = np.asarray([i for i in first_pages if 0 <= i < count and valid[i]], dtype=np.int64)
+    if not len(first_pages):
+        return flags, scores
+    
+    to_previous = hamming_distance(fingerprints[1:], fingerprints[:-1])
+    to_first = hamming_distance(fingerprints[1:, None], fingerprints[first_pages][None, :])
+    # Una primera página conocida no cuenta como referencia de sí misma
+    to_first[first_pages[first_pages > 0] - 1, np.flatnonzero(first_pages > 0)] = 64
+    nearest_first = to_first.min(axis=1)
+    
+    comparable = valid[1:] & valid[:-1]
+    scores[:-1] = np.where(comparable, to_previous.astype(np.float32) - nearest_first, 0)
+    flags[:-1] = (
+        comparable
+        & (nearest_first <= p["fingerprint_first_distance"])
+        & (to_previous >= p["fingerprint_change_distance"])
+    )
+    return flags, scores
+
+
+
+def suggested_split_flags(features, first_pages=(0,), params=None):
+    """
+    Split suggestions of a whole document from its feature records
+    
+    The detector verdict of each page (``suggest_from_features``) plus the
+    document starts found by the page fingerprints
+    (``fingerprint_boundaries``). The viewer and the batch mode both use
+    it, so they suggest the same pages.
+    
+    Args:
+        features: Array of FEATURE_DTYPE records, one per page
+        first_pages: Indices (0-based) of pages known to start a document
+        params: Optional dict overriding DEFAULT_DETECTOR_PARAMS
+        
+    Returns:
+        Tuple (flags, fingerprint_only) of boolean arrays: ``flags[i]`` is
+        True when page ``i + 1`` (1-based) is a suggested split point, and
+        ``fingerprint_only`` marks the ones added only by the fingerprints
+    """
+    flags = suggest_from_features(features, params)
+    starts, _ = fingerprint_boundaries(features, first_pages, params)
+    return flags | starts, starts & ~flags
+
+# Fórmulas de cierre habituales al final de un documento legal (sin tildes)
+CLOSING_KEYWORDS = (
+    "firma", "firmado", "notifiquese", "cumplase", "publiquese", "comuniquese",
+    "archivese", "atentamente", "cordialmente", "notario", "notaria",
+)
+
+# Elementos del registro de dibujo de PyMuPDF que dejan tinta visible
+_VISIBLE_TEXT = ("fill-text", "stroke-text")
+_NON_TEXT_INK = ("fill-path", "stroke-path", "fill-image", "fill-imgmask", "fill-shade")
+
+
+def _normalize_word(word):
+    """Lowercase a word and strip accents and punctuation"""
+    word = unicodedata.normalize("NFKD", word.lower())
+    return "".join(c for c in word if c.isalnum() and not unicodedata.combining(c))
+
+
+def classify_text_layer(layout):
+    """
+    Decide from the text layer whether a page is a split point, when possible
+
+    Cheap first stage run before rasterizing the page:
+
+    - A closing formula ("Notifíquese", "Atentamente", "Firma"...) in the
+      bottom 40% of the page marks it as a split point.
+    - Visible text in the bottom 30% also does: the raster density check
+      always fires on ink in that region.
+    - A page made only of text, with nothing in its bottom 30%, is not a
+      split point. This is a decision, not a shortcut: the density and
+      signature checks cannot fire on such a page, but the stamp stage
+      often finds circles in lines of text, so the image detector may
+      flag the same page (see ``analyze_page`` with ``text_first=False``).
+
+    Everything else (scans, images, vector drawings) is left undecided.
+
+    Args:
+        layout: Dict returned by ``PDFProcessor.get_page_layout``
+
+    Returns:
+        True or False when the text layer is conclusive, None when the
+        page must be rasterized
+    """
+    height = layout["height"]
+    if layout["rotation"] or height <= 0:
+        return None
+
+    for x0, y0, x1, y1, word in layout["words"]:
+        if y0 > height * 0.6 and _normalize_word(word) in CLOSING_KEYWORDS:
+            return True
+
+    if any(kind in _NON_TEXT_INK for kind, _ in layout["boxes"]):
+        return None
+
+    bottom = height * 0.7
+    if any(kind in _VISIBLE_TEXT and rect[3] > bottom for kind, rect in layout["boxes"]):
+        return True
+    return False
@@ -0,0 +1,384 @@
+"""
+Process-wide scheduler for the heavy jobs of every Streamlit session
+
+Analysis and split jobs from all sessions go through one scheduler with a
+fixed number of slots. A job only starts when its estimated memory cost
+fits in the memory budget next to the jobs already running (a job is
+always admitted when nothing else runs, however large). Sessions are
+served round-robin, so one session queueing several jobs cannot starve
+the others. Queued jobs report their position and an estimated wait.
+
+Split jobs also have slots of their own that never run an analysis, so a
+short split does not wait behind analyses that hold every shared slot
+for their whole run.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import metrics
+
+# Memoria fija estimada por proceso que abre un documento (intérprete, OpenCV, buffers)
+BASE_PROCESS_COST = 128 * 1024 * 1024
+
+# Segundos por página estimados antes de haber terminado ningún trabajo
+DEFAULT_SECONDS_PER_PAGE = {"analysis": 0.5, "split": 0.01}
+
+# Peso de la última duración observada en la media móvil de segundos por página
+RATE_SMOOTHING = 0.3
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    configured = os.environ.get(name)
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            print(f"Valor inválido en {name}: {configured}")
+    return default
+
+
+def default_memory_budget():
+    """
+    Memory budget for the running jobs, in bytes
+
+    Reads PDF_SCHEDULER_MEMORY_MB and falls back to half of the physical
+    memory (4 GB when it cannot be determined).
+    """
+    configured = os.environ.get("PDF_SCHEDULER_MEMORY_MB")
+    if configured:
+        try:
+            return max(1, int(configured)) * 1024 * 1024
+        except ValueError:
+            print(f"Valor inválido en PDF_SCHEDULER_MEMORY_MB: {configured}")
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (AttributeError, ValueError, OSError):
+        return 4096 * 1024 * 1024
+
+
+def get_scheduler():
+    """
+    Return the process-wide scheduler, creating it on first use
+
+    The number of slots is read from PDF_SCHEDULER_SLOTS (default 2), the
+    slots reserved for splits from PDF_SCHEDULER_SPLIT_SLOTS (default 1)
+    and the memory budget from PDF_SCHEDULER_MEMORY_MB.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler(
+                slots=_env_int("PDF_SCHEDULER_SLOTS", 2),
+                memory_budget=default_memory_budget(),
+                split_slots=_env_int("PDF_SCHEDULER_SPLIT_SLOTS", 1),
+            )
+        return _scheduler
+
+
+def render_bytes(page_rect, zoom):
+    """Decoded size of one page rendered at ``zoom`` (RGB plus its grayscale copy)"""
+    return int(page_rect.width * zoom) * int(page_rect.height * zoom) * 4
+
+
+def estimate_analysis_cost(processor, zoom=0.5, workers=1, pages_in_flight=8):
+    """
+    Estimated memory of analyzing a document
+
+    Each analysis process holds ``pages_in_flight`` rendered pages at a
+    time (the thumbnail render and, for large documents, the region read
+    by the detector at the detection zoom), so the cost is the number of
+    pages held at once times the render size of a page, plus the fixed
+    cost of each process.
+
+    Args:
+        processor: PDFProcessor with the document open
+        zoom: Detection zoom
+        workers: Number of analysis processes
+        pages_in_flight: Pages held by each process (the chunk size)
+
+    Returns:
+        Estimated bytes
+    """
+    total_pages = processor.get_total_pages()
+    if not total_pages:
+        return BASE_PROCESS_COST
+    rect = processor.doc[0].rect
+    page_bytes = render_bytes(rect, processor.get_render_zoom(zoom))
+    if processor.get_render_zoom(zoom) != zoom:
+        # Región en escala de grises (como mucho, la página completa)
+        page_bytes += int(rect.width * zoom) * int(rect.height * zoom)
+    pages_held = min(total_pages, workers * pages_in_flight)
+    return workers * BASE_PROCESS_COST + pages_held * page_bytes
+
+
+def estimate_split_cost(pdf_path, workers=1):
+    """
+    Estimated memory of splitting a document
+
+    Every writer process opens the source document; its content is
+    counted once because the file is shared through the page cache.
+    """
+    return os.path.getsize(pdf_path) + workers * BASE_PROCESS_COST
+
+
+class Job:
+    """A unit of work queued in the scheduler"""
+
+    def __init__(self, scheduler, fn, session_id, cost, pages, kind, label):
+        self.scheduler = scheduler
+        self.fn = fn
+        self.session_id = session_id
+        self.cost = cost
+        self.pages = pages
+        self.kind = kind
+        self.label = label
+        self.status = "queued"
+        self.lane = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        """True once the job finished, failed or was cancelled"""
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job is done; returns False on timeout"""
+        return self._finished.wait(timeout)
+
+    def cancel(self):
+        """Remove the job from the queue; returns False if it already started"""
+        return self.scheduler.cancel(self)
+
+    def position(self):
+        """1-based position in the queue, or 0 if the job is not queued"""
+        return self.scheduler.position(self)
+
+    def eta_seconds(self):
+        """Estimated seconds until the job finishes (see JobScheduler.eta)"""
+        return self.scheduler.eta(self)
+
+
+class JobScheduler:
+    """
+    Bounded pool of job slots with memory-aware admission and fair queueing
+
+    Each slot is a thread; the jobs themselves may start processes (the
+    analysis and split pools), so the number of processes per job should
+    be divided among the slots (see ``workers_per_job``).
+
+    The shared slots run any job in queue order. The split slots only run
+    split jobs: they take the first queued split in session turn order,
+    and admit it when it fits in the memory budget or when no other split
+    slot is busy, whatever the analyses running in the shared slots.
+    """
+
+    def __init__(self, slots=2, memory_budget=4096 * 1024 * 1024, split_slots=0):
+        """
+        Args:
+            slots: Maximum number of jobs running at once in the shared slots
+            memory_budget: Maximum total estimated memory of the running jobs
+            split_slots: Additional slots that only run split jobs
+        """
+        self.slots = slots
+        self.split_slots = split_slots
+        self.memory_budget = memory_budget
+        self.memory_in_use = 0
+        self._queues = OrderedDict()  # sesión -> deque de trabajos; el orden es el turno
+        self._running = set()
+        self._seconds_per_page = dict(DEFAULT_SECONDS_PER_PAGE)
+        self._cond = threading.Condition()
+        for slot in range(slots):
+            threading.Thread(target=self._worker, name=f"job-slot-{slot}", daemon=True).start()
+        for slot in range(split_slots):
+            threading.Thread(target=self._worker, args=("split",), name=f"split-slot-{slot}",
+                             daemon=True).start()
+
+    def workers_per_job(self, total_workers):
+        """Share ``total_workers`` processes among the slots (at least one each)"""
+        return max(1, total_workers // self.slots)
+
+    def submit(self, fn, session_id, cost, pages=1, kind="analysis", label=""):
+        """
+        Queue a job
+
+        Args:
+            fn: Callable run without arguments in a scheduler thread
+            session_id: Identifier of the session that owns the job
+            cost: Estimated memory of the job in bytes
+            pages: Amount of work, in pages, used for the wait estimate
+            kind: ``"analysis"`` or ``"split"`` (each has its own speed estimate)
+            label: Description for logs
+
+        Returns:
+            Job
+        """
+        job = Job(self, fn, session_id, cost, pages, kind, label)
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(job)
+            metrics.set_gauge("pdf_scheduler_queued_jobs", self._queued_count())
+            self._cond.notify_all()
+        return job
+
+    def cancel(self, job):
+        with self._cond:
+            queue = self._queues.get(job.session_id)
+            if job.status != "queued" or queue is None or job not in queue:
+                return False
+            queue.remove(job)
+            if not queue:
+                del self._queues[job.session_id]
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job._finished.set()
+            metrics.set_gauge("pdf_scheduler_queued_jobs", self._queued_count())
+            self._cond.notify_all()
+        return True
+
+    def _queued_count(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _dispatch_order(self):
+        """Queued jobs in the order they will be started (one per session per turn)"""
+        order = []
+        queues = [list(queue) for queue in self._queues.values()]
+        turn = 0
+        while any(turn < len(queue) for queue in queues):
+            order.extend(queue[turn] for queue in queues if turn < len(queue))
+            turn += 1
+        return order
+
+    def _ahead(self, job):
+        """
+        Queued jobs that will start before ``job`` (the caller holds the lock)
+
+        With split slots, a split only waits for the splits ahead of it.
+        """
+        order = self._dispatch_order()
+        ahead = order[:order.index(job)]
+        if job.kind == "split" and self.split_slots:
+            ahead = [queued for queued in ahead if queued.kind == "split"]
+        return ahead
+
+    def position(self, job):
+        with self._cond:
+            if job.status != "queued":
+                return 0
+            return len(self._ahead(job)) + 1
+
+    def _expected_seconds(self, job):
+        return job.pages * self._seconds_per_page.get(job.kind, 0.5)
+
+    def eta(self, job):
+        """
+        Estimated seconds until ``job`` finishes
+
+        The remaining work of the running jobs and of the jobs ahead in the
+        queue is spread over the slots, using the average seconds per page
+        observed for each kind of job. With split slots, a split only counts
+        the splits, spread over the shared and the split slots.
+        """
+        with self._cond:
+            now = time.time()
+            if job.done:
+                return 0.0
+            if job.status == "running":
+                return max(0.0, self._expected_seconds(job) - (now - job.started_at))
+            running = self._running
+            slots = self.slots
+            if job.kind == "split" and self.split_slots:
+                running = [other for other in running if other.kind == "split"]
+                slots += self.split_slots
+            pending = sum(
+                max(0.0, self._expected_seconds(other) - (now - other.started_at))
+                for other in running
+            )
+            pending += sum(self._expected_seconds(queued) for queued in self._ahead(job))
+            return pending / slots + self._expected_seconds(job)
+
+    def _next_job(self, lane=None):
+        """
+        Take the next admissible job (the caller holds the lock), or None
+
+        Args:
+            lane: None for a shared slot, ``"split"`` for a split slot
+        """
+        capacity = self.slots if lane is None else self.split_slots
+        in_lane = [running for running in self._running if running.lane == lane]
+        if not self._queues or len(in_lane) >= capacity:
+            return None
+        if lane is None:
+            session_id, queue = next(iter(self._queues.items()))
+            job = queue[0]
+            # Siempre se admite un trabajo si no hay otro en curso, aunque no quepa
+            if self._running and self.memory_in_use + job.cost > self.memory_budget:
+                return None
+        else:
+            # Primera división según el turno de las sesiones; los análisis
+            # que ocupan los turnos compartidos no la bloquean
+            session_id, queue, job = next(
+                ((session_id, queue, queued) for session_id, queue in self._queues.items()
+                 for queued in queue if queued.kind == lane),
+                (None, None, None),
+            )
+            if job is None:
+                return None
+            if in_lane and self.memory_in_use + job.cost > self.memory_budget:
+                return None
+        queue.remove(job)
+        job.lane = lane
+        # La sesión pasa al final del turno
+        del self._queues[session_id]
+        if queue:
+            self._queues[session_id] = queue
+        return job
+
+    def _worker(self, lane=None):
+        while True:
+            with self._cond:
+                job = self._next_job(lane)
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job(lane)
+                job.status = "running"
+                job.started_at = time.time()
+                self._running.add(job)
+                self.memory_in_use += job.cost
+                metrics.set_gauge("pdf_scheduler_running_jobs", len(self._running))
+                metrics.set_gauge("pdf_scheduler_memory_in_use_bytes", self.memory_in_use)
+                metrics.set_gauge("pdf_scheduler_queued_jobs", self._queued_count())
+                metrics.observe("pdf_scheduler_wait_seconds", job.started_at - job.submitted_at,
+                                kind=job.kind)
+
+            try:
+                job.result = job.fn()
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+                print(f"Error en el trabajo {job.label}: {str(e)}")
+
+            with self._cond:
+                job.finished_at = time.time()
+                self._running.discard(job)
+                self.memory_in_use -= job.cost
+                # Media móvil de segundos por página para las estimaciones de espera
+                if job.status == "done" and job.pages:
+                    observed = (job.finished_at - job.started_at) / job.pages
+                    previous = self._seconds_per_page.get(job.kind, observed)
+                    self._seconds_per_page[job.kind] = (
+                        RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * previous
+                    )
+                metrics.set_gauge("pdf_scheduler_running_jobs", len(self._running))
+                metrics.set_gauge("pdf_scheduler_memory_in_use_bytes", self.memory_in_use)
+                self._cond.notify_all()
+            job._finished.set()
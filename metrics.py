@@ -0,0 +1,286 @@
+"""
+Process-wide metrics for the hot paths of the PDF splitter
+
+Counters, timing summaries and gauges are kept in memory and exported in
+the Prometheus text format, to a file (PDF_METRICS_FILE) and/or a local
+HTTP endpoint (PDF_METRICS_PORT). Coarse events (analysis finished,
+segments written, ZIP exported) are appended as JSON lines to
+PDF_METRICS_LOG. Worker processes send their metrics back to the parent
+with ``collect(reset=True)`` and ``merge``.
+
+Profiling is opt-in: ``profiled(path)`` dumps cProfile data for the code
+it wraps (PDF_PROFILE when no path is given).
+"""
+import cProfile
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_lock = threading.Lock()
+_counters = {}   # (nombre, etiquetas) -> valor
+_summaries = {}  # (nombre, etiquetas) -> [número, suma, máximo]
+_gauges = {}     # (nombre, etiquetas) -> valor
+_server = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Add ``amount`` to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Record one observation (e.g. a duration in seconds) in a summary"""
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.get(key)
+        if summary is None:
+            _summaries[key] = [1, value, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the wall time of the wrapped block in seconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def record_peak_memory():
+    """Update the peak resident memory gauges of this process and its finished children"""
+    if resource is None:
+        return
+    # Linux informa en KB y macOS en bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    set_gauge("process_peak_rss_bytes", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale)
+    set_gauge("process_children_peak_rss_bytes",
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def collect(reset=False):
+    """
+    Snapshot of every metric, as plain (picklable) data
+
+    Args:
+        reset: Clear the counters and summaries after taking the snapshot
+            (used by worker processes that report to their parent)
+
+    Returns:
+        Dict with ``counters``, ``summaries`` and ``gauges`` lists
+    """
+    with _lock:
+        snapshot = {
+            "counters": list(_counters.items()),
+            "summaries": [(key, list(value)) for key, value in _summaries.items()],
+            "gauges": list(_gauges.items()),
+        }
+        if reset:
+            _counters.clear()
+            _summaries.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    """Add a snapshot taken in another process to this process's metrics"""
+    with _lock:
+        for key, value in snapshot["counters"]:
+            _counters[key] = _counters.get(key, 0) + value
+        for key, (count, total, maximum) in snapshot["summaries"]:
+            summary = _summaries.get(key)
+            if summary is None:
+                _summaries[key] = [count, total, maximum]
+            else:
+                summary[0] += count
+                summary[1] += total
+                summary[2] = max(summary[2], maximum)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def render_prometheus():
+    """Every metric in the Prometheus text exposition format"""
+    record_peak_memory()
+    snapshot = collect()
+    lines = []
+    typed = set()
+    for (name, labels), value in sorted(snapshot["counters"]):
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    summaries = sorted(snapshot["summaries"])
+    for (name, labels), (count, total, _) in summaries:
+        if name not in typed:
+            lines.append(f"# TYPE {name} summary")
+            typed.add(name)
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+    # El máximo de cada resumen se publica como una familia gauge aparte
+    gauges = [((f"{name}_max", labels), maximum) for (name, labels), (_, _, maximum) in summaries]
+    for (name, labels), value in gauges + sorted(snapshot["gauges"]):
+        if name not in typed:
+            lines.append(f"# TYPE {name} gauge")
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=None):
+    """
+    Write the metrics to a text file (PDF_METRICS_FILE when path is None)
+
+    The file is replaced atomically, so it can be read by the node
+    exporter's textfile collector at any time.
+    """
+    path = path or os.environ.get("PDF_METRICS_FILE")
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def log_event(event, **fields):
+    """Append a structured event as one JSON line to PDF_METRICS_LOG"""
+    path = os.environ.get("PDF_METRICS_LOG")
+    if not path:
+        return
+    record = {"ts": time.time(), "event": event, "pid": os.getpid()}
+    record.update(fields)
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def flush():
+    """
+    Rewrite the metrics file, if configured
+
+    Worker processes do nothing: their metrics reach the file through the
+    parent (``collect``/``merge``).
+    """
+    if multiprocessing.parent_process() is not None:
+        return
+    try:
+        write_prometheus()
+    except OSError as e:
+        print(f"No se pudieron escribir las métricas: {str(e)}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=None, host="127.0.0.1"):
+    """
+    Serve /metrics on a local port (PDF_METRICS_PORT when port is None)
+
+    Only one server is started per process; later calls return it.
+
+    Returns:
+        The HTTP server, or None when no port is configured
+    """
+    global _server
+    with _lock:
+        if _server is not None:
+            return _server
+        if port is None:
+            configured = os.environ.get("PDF_METRICS_PORT")
+            if not configured:
+                return None
+            try:
+                port = int(configured)
+            except ValueError:
+                print(f"Valor inválido en PDF_METRICS_PORT: {configured}")
+                return None
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"No se pudo abrir el puerto de métricas {port}: {str(e)}")
+            return None
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
+
+
+@contextmanager
+def profiled(path=None, label=None):
+    """
+    Profile the wrapped block with cProfile and dump the stats to ``path``
+
+    Does nothing when neither ``path`` nor PDF_PROFILE is set. The dump can
+    be read with ``python -m pstats`` or snakeviz. Only the calling thread
+    is profiled.
+
+    Args:
+        path: Output file (None = PDF_PROFILE)
+        label: Added to the file name with the current time (e.g.
+            ``perfil-analisis-20240101-120000.prof``), so the jobs the
+            application runs one after another or at the same time do not
+            overwrite each other's profile
+    """
+    path = path or os.environ.get("PDF_PROFILE")
+    if not path:
+        yield
+        return
+    if label:
+        root, ext = os.path.splitext(path)
+        path = f"{root}-{label}-{time.strftime('%Y%m%d-%H%M%S')}{ext or '.prof'}"
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Otro perfilador activo en este proceso (Python 3.12+ admite uno solo)
+        print(f"No se pudo perfilar {label or path}: {str(e)}")
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Perfil de ejecución guardado en {path}")
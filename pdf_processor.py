@@ -1,31 +1,105 @@
 import fitz  # PyMuPDF
-import io
+import hashlib
+import mmap
 import os
+import re
+import threading
+import time
 import numpy as np
 from PIL import Image
 
+from segment_writer import write_segments, save_options
+from size_planner import PageObjectIndex, plan_size_splits
+from render_cache import RenderCache, default_render_cache_bytes
+import metrics
+
+# Referencias indirectas ("12 0 R"): se ignoran al calcular el hash de una página
+# porque los números de objeto cambian de un archivo a otro
+_INDIRECT_REF = re.compile(r"\b\d+ \d+ R\b")
+
+def pixmap_as_array(pix):
+    """
+    NumPy view of the samples of a pixmap, without copying them
+    
+    The view points into memory owned by the pixmap, so the pixmap must
+    outlive the array.
+    
+    Args:
+        pix: fitz.Pixmap
+        
+    Returns:
+        uint8 array of shape (height, width) for single-channel pixmaps or
+        (height, width, channels) otherwise
+    """
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    samples = samples[:, :pix.width * pix.n]
+    if pix.n == 1:
+        return samples
+    return samples.reshape(pix.height, pix.width, pix.n)
+
+
 class PDFProcessor:
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, use_mmap=False, cache_bytes=None):
         """
         Initialize the PDF processor with a PDF file path
         
         Args:
             pdf_path: Path to the PDF file (can be a temporary file)
+            use_mmap: Open the document from a memory-mapped view of the file
+                instead of reading it, so its content is never copied into
+                the Python heap
+            cache_bytes: Byte budget of the page render cache (None =
+                PDF_RENDER_CACHE_MB or 64 MB)
         """
         self.pdf_path = pdf_path
+        # El documento se comparte entre el hilo de la interfaz y los hilos de
+        # los trabajos (p. ej. la división), y PyMuPDF no admite accesos simultáneos
+        self._lock = threading.RLock()
+        self._file = None
+        self._mmap = None
+        self._buffer = None
         # Abrir el documento con opciones para archivos grandes
-        self.doc = fitz.open(pdf_path)
+        if use_mmap and os.path.getsize(pdf_path) > 0:
+            self._file = open(pdf_path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buffer = memoryview(self._mmap)
+            self.doc = fitz.open(stream=self._buffer, filetype="pdf")
+        else:
+            self.doc = fitz.open(pdf_path)
         self.total_pages = len(self.doc)
         self.original_filename = None
+        self.last_split_timings = []
+        self.last_size_plan = []
+        self._object_index = None
+        
+        # Caché LRU de miniaturas con presupuesto en bytes, para evitar procesamiento repetido
+        if cache_bytes is None:
+            cache_bytes = default_render_cache_bytes()
+        self.page_cache = RenderCache(cache_bytes)
         
         # Configuración de memoria para archivos grandes
-        self.page_cache = {}  # Caché para miniaturas, para evitar procesamiento repetido
         self.memory_optimized = self.total_pages > 100  # Si hay muchas páginas, optimizar memoria
     
     def get_total_pages(self):
         """Return the total number of pages in the PDF"""
         return self.total_pages
     
+    def get_render_zoom(self, zoom):
+        """
+        Zoom actually used to render a thumbnail requested at ``zoom``
+        
+        Args:
+            zoom: Requested zoom factor
+            
+        Returns:
+            Zoom factor used by get_page_image
+        """
+        # Para archivos grandes, reducimos aún más el zoom para mejorar rendimiento
+        if self.memory_optimized and zoom > 0.3:
+            # Usar un zoom más bajo para documentos grandes
+            return 0.3
+        return zoom
+    
     def get_page_image(self, page_idx, zoom=0.5):
         """
         Get a page as a PIL Image with reduced resolution for thumbnails
@@ -38,39 +112,30 @@ class PDFProcessor:
         Returns:
             PIL Image object
         """
-        # Verificar si la imagen ya está en caché
-        cache_key = f"{page_idx}_{zoom}"
-        if cache_key in self.page_cache:
-            return self.page_cache[cache_key]
-            
-        # Para archivos grandes, reducimos aún más el zoom para mejorar rendimiento
-        if self.memory_optimized and zoom > 0.3:
-            # Usar un zoom más bajo para documentos grandes
-            actual_zoom = 0.3
-        else:
-            actual_zoom = zoom
+        actual_zoom = self.get_render_zoom(zoom)
             
         try:
-            # Cargar la página específica
-            page = self.doc[page_idx]
-            
-            # Get the page as an image with reduced resolution
-            pix = page.get_pixmap(matrix=fitz.Matrix(actual_zoom, actual_zoom))
-            
-            # Convert pixmap to PIL Image
-            img_data = pix.tobytes("ppm")
-            img = Image.open(io.BytesIO(img_data))
-            
-            # Guardar en caché si el documento es grande
-            if self.memory_optimized:
-                self.page_cache[cache_key] = img
+            with self._lock:
+                # Cargar la página específica
+                page = self.doc[page_idx]
+                matrix = fitz.Matrix(actual_zoom, actual_zoom)
+                
+                # Verificar si la imagen ya está en caché (o si se puede reducir
+                # una versión en caché de mayor resolución)
+                target = (page.rect * matrix).irect
+                img = self.page_cache.get(page_idx, actual_zoom, size=(target.width, target.height))
+                if img is not None:
+                    return img
                 
-                # Limitar el tamaño del caché para no consumir demasiada memoria
-                if len(self.page_cache) > 50:  # Mantener como máximo 50 miniaturas en memoria
-                    oldest_key = next(iter(self.page_cache))
-                    del self.page_cache[oldest_key]
+                # Get the page as an image with reduced resolution
+                with metrics.timed("pdf_page_render_seconds", kind="thumbnail"):
+                    pix = page.get_pixmap(matrix=matrix, alpha=False)
                     
-            return img
+                    # Convert pixmap to PIL Image (copia directa de las muestras, sin codificar a PPM)
+                    img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                
+                self.page_cache.put(page_idx, actual_zoom, img)
+                return img
         except Exception as e:
             # En caso de error con páginas específicas, retornar una imagen en blanco
             print(f"Error al procesar página {page_idx}: {str(e)}")
@@ -86,48 +151,154 @@ class PDFProcessor:
         Returns:
             numpy array representation of the page
         """
-        page = self.doc[page_idx]
-        
         # Get the page as an image at a reasonable resolution
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+        with self._lock, metrics.timed("pdf_page_render_seconds", kind="array"):
+            pix = self.doc[page_idx].get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)
+        
+        # Copiar las muestras: el array devuelto no depende del pixmap
+        return pixmap_as_array(pix).copy()
+    
+    def get_page_pixmap(self, page_idx, zoom=0.5):
+        """
+        Render a page as an RGB pixmap at the thumbnail zoom
+        
+        Args:
+            page_idx: Page index (0-based)
+            zoom: Requested zoom factor (see get_render_zoom)
+            
+        Returns:
+            fitz.Pixmap without alpha channel
+        """
+        actual_zoom = self.get_render_zoom(zoom)
+        with self._lock, metrics.timed("pdf_page_render_seconds", kind="pixmap"):
+            return self.doc[page_idx].get_pixmap(matrix=fitz.Matrix(actual_zoom, actual_zoom), alpha=False)
+    
+    def get_page_gray(self, page_idx, zoom=0.5):
+        """
+        Render a page for analysis as a single-channel pixmap
+        
+        The returned array is a view of the pixmap samples, not a copy: the
+        pixmap must be kept alive for as long as the array is used.
+        
+        Args:
+            page_idx: Page index (0-based)
+            zoom: Requested zoom factor (see get_render_zoom)
+            
+        Returns:
+            Tuple (pixmap, array) with the grayscale pixmap and a 2D uint8
+            NumPy view of its samples
+        """
+        actual_zoom = self.get_render_zoom(zoom)
+        with self._lock, metrics.timed("pdf_page_render_seconds", kind="gray"):
+            pix = self.doc[page_idx].get_pixmap(matrix=fitz.Matrix(actual_zoom, actual_zoom),
+                                  colorspace=fitz.csGRAY, alpha=False)
+        return pix, pixmap_as_array(pix)
+    
+    def get_page_pixel_size(self, page_idx, zoom=0.5):
+        """
+        Size in pixels of a page rendered at ``zoom`` (used as given)
+        
+        Args:
+            page_idx: Page index (0-based)
+            zoom: Zoom factor
+            
+        Returns:
+            Tuple (width, height)
+        """
+        with self._lock:
+            irect = (self.doc[page_idx].rect * fitz.Matrix(zoom, zoom)).irect
+        return irect.width, irect.height
+    
+    def get_page_region_gray(self, page_idx, top=0.5, zoom=0.5):
+        """
+        Render only the lower part of a page, in grayscale, for analysis
+        
+        Unlike the thumbnails, ``zoom`` is used as given (it is not lowered
+        for large documents), so detection quality does not depend on the
+        size of the document. Only the clip from ``top`` down is rasterized.
         
-        # Convert pixmap to PIL Image
-        img_data = pix.tobytes("ppm")
-        img = Image.open(io.BytesIO(img_data))
+        Args:
+            page_idx: Page index (0-based)
+            top: Upper edge of the region as a fraction of the page height
+            zoom: Zoom factor for detection
+            
+        Returns:
+            Tuple (pixmap, array, offset, page_height): the grayscale pixmap,
+            a 2D uint8 view of its samples, the page row where the region
+            starts and the height of the whole page in rows, at ``zoom``
+        """
+        matrix = fitz.Matrix(zoom, zoom)
+        with self._lock, metrics.timed("pdf_page_render_seconds", kind="region"):
+            page = self.doc[page_idx]
+            rect = page.rect
+            clip = fitz.Rect(rect.x0, rect.y0 + rect.height * top, rect.x1, rect.y1)
+            pix = page.get_pixmap(matrix=matrix, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+        page_height = (rect * matrix).irect.height
+        return pix, pixmap_as_array(pix), max(0, page_height - pix.height), page_height
+    
+    def plan_size_splits(self, max_bytes=None, max_pages=None, split_points=None):
+        """
+        Split points that keep each output file under a size (and page) limit
         
-        # Convert PIL Image to numpy array
-        return np.array(img)
+        The size of each segment is estimated from the objects its pages
+        reference, counting shared fonts and images once per file, in a
+        single pass and without saving any temporary document (see
+        size_planner). The estimate uses the objects as stored in the
+        source, so it is an upper bound for the compacting save profiles.
+        
+        Args:
+            max_bytes: Maximum size of each file in bytes (None = no limit)
+            max_pages: Maximum number of pages of each file (None = no limit)
+            split_points: Split points (1-based) chosen by the user; they
+                are always kept
+            
+        Returns:
+            Tuple (split_points, estimates) with the sorted split points and
+            the estimated bytes of each segment
+        """
+        with self._lock:
+            if self._object_index is None:
+                self._object_index = PageObjectIndex(self.doc)
+            return plan_size_splits(self._object_index, self.total_pages, max_bytes=max_bytes,
+                                    max_pages=max_pages, split_points=split_points)
     
-    def split_pdf(self, split_points, output_dir, mid_page_splits=None, original_filename=None):
+    def split_pdf(self, split_points, output_dir, mid_page_splits=None, original_filename=None,
+                  workers=None, save_profile=None, max_bytes=None, max_pages=None):
         """
         Split the PDF at the specified page numbers and save to output_dir
-        Optimizado para archivos grandes mediante procesamiento por lotes
+        Cada segmento se copia como un único rango de páginas y los segmentos
+        independientes se escriben en paralelo
         
         Args:
             split_points: List of page numbers (1-based) where to split
             output_dir: Directory to save the split PDFs
-            mid_page_splits: Dictionary {page_num: y_coord} for pages to split at specific points
+            mid_page_splits: Dictionary {page_num: y_coord} for pages to split at specific points.
+                page_num is 1-based and y_coord is measured in points from the top
+                of the page: the part above y_coord ends one document and the part
+                below starts the next. Each part keeps the page's vector content,
+                clipped to its area (the hidden part is still in the file)
             original_filename: Original name of the uploaded file to use as base for split files
+            workers: Number of processes used to write segments (None = all cores)
+            save_profile: Name of a profile in segment_writer.SAVE_PROFILES
+                ("default", "compact", "smallest", "web") or a dict of
+                Document.save options (None = PDF_SPLIT_SAVE_PROFILE)
+            max_bytes: Maximum size of each file in bytes; more split points
+                are added where needed (see plan_size_splits)
+            max_pages: Maximum number of pages of each file
             
         Returns:
             List of paths to the split PDF files
         """
-        if not split_points:
+        mid_page_splits = self._valid_mid_page_splits(mid_page_splits)
+        if max_bytes is not None or max_pages is not None:
+            split_points, self.last_size_plan = self.plan_size_splits(max_bytes, max_pages, split_points)
+        if not split_points and not mid_page_splits:
             return []
         
-        import sys
-        import gc
-        
-        # Configurar límites de memoria más altos para archivos grandes
-        is_large_file = os.path.getsize(self.pdf_path) > 100 * 1024 * 1024  # > 100MB
-        
-        # Ensure the split points are in ascending order
-        split_points = sorted(split_points)
-        
-        # Add the last page + 1 to handle the final segment
-        all_split_points = [0] + split_points + [self.total_pages]
-        
-        output_files = []
+        # Cortes ordenados: (página 1-based, y); y = None corta después de la página completa
+        cuts = [(page_num, None) for page_num in split_points]
+        cuts += [(page_num, y) for page_num, y in mid_page_splits.items()]
+        cuts.sort(key=lambda cut: (cut[0], float("inf") if cut[1] is None else cut[1]))
         
         # Usar el nombre original proporcionado directamente como parámetro
         if original_filename:
@@ -148,83 +319,132 @@ class PDFProcessor:
             if ext:
                 file_extension = ext
         
-        # Create each split PDF
-        for i in range(len(all_split_points) - 1):
-            start_page = all_split_points[i]
-            end_page = all_split_points[i + 1]
+        # Preparar los segmentos a escribir (0-based, end_page exclusivo). Un segmento
+        # puede empezar en la parte inferior de una página (head_clip) o terminar en
+        # su parte superior (tail_clip)
+        segments = []
+        options = save_options(save_profile)
+        start_page, head_clip = 0, None
+        for page_num, y in cuts + [(self.total_pages, None)]:
+            end_page, tail_clip = page_num, y
             
             # Skip empty segments
-            if end_page <= start_page:
-                continue
-            
-            try:
-                # Para archivos grandes, trabajar con menos páginas a la vez
-                if is_large_file and (end_page - start_page) > 50:
-                    # Dividir en bloques de 30 páginas para evitar problemas de memoria
-                    final_output_path = os.path.join(
-                        output_dir, 
-                        f"{filename_base}-{start_page+1}-{end_page}{file_extension}"
-                    )
-                    
-                    # Crear un documento temporal vacío
-                    temp_doc = fitz.open()
-                    
-                    # Procesar en bloques de máximo 30 páginas
-                    batch_size = 30
-                    for batch_start in range(start_page, end_page, batch_size):
-                        batch_end = min(batch_start + batch_size, end_page)
-                        
-                        # Liberar memoria explícitamente
-                        gc.collect()
-                        
-                        # Añadir este lote de páginas
-                        temp_doc.insert_pdf(
-                            self.doc, 
-                            from_page=batch_start, 
-                            to_page=batch_end-1
-                        )
-                    
-                    # Guardar el archivo final
-                    temp_doc.save(final_output_path)
-                    temp_doc.close()
-                    
-                    output_files.append(final_output_path)
-                    
-                    # Liberar memoria
-                    gc.collect()
-                else:
-                    # Proceso normal para archivos pequeños o segmentos pequeños
-                    new_doc = fitz.open()
-                    
-                    # Add pages from the original document
-                    for page_num in range(start_page, end_page):
-                        new_doc.insert_pdf(self.doc, from_page=page_num, to_page=page_num)
-                    
-                    # Save the new document with page range in the filename
-                    start_page_num = all_split_points[i] + 1  # Convert to 1-based for display
-                    end_page_num = all_split_points[i+1]
-                    
-                    # Usar exactamente el nombre original con guiones y números de página
-                    output_path = os.path.join(
-                        output_dir, 
-                        f"{filename_base}-{start_page_num}-{end_page_num}{file_extension}"
-                    )
-                    
-                    new_doc.save(output_path)
-                    new_doc.close()
-                    
-                    output_files.append(output_path)
+            if end_page > start_page:
+                # Usar exactamente el nombre original con guiones y números de página
+                output_path = os.path.join(
+                    output_dir, 
+                    f"{filename_base}-{start_page+1}-{end_page}{file_extension}"
+                )
+                segments.append({
+                    "start_page": start_page,
+                    "end_page": end_page,
+                    "head_clip": head_clip,
+                    "tail_clip": tail_clip,
+                    "path": output_path,
+                    "save_options": options,
+                })
             
-            except Exception as e:
-                print(f"Error al procesar segmento de páginas {start_page+1}-{end_page}: {str(e)}")
+            if y is None:
+                start_page, head_clip = page_num, None
+            else:
+                # El siguiente documento empieza en la parte inferior de esta misma página
+                start_page, head_clip = page_num - 1, y
+        
+        started = time.perf_counter()
+        with self._lock:
+            results = write_segments(self.doc, self.pdf_path, segments, workers=workers)
+        elapsed = time.perf_counter() - started
+        
+        # Tiempos por segmento para diagnóstico
+        self.last_split_timings = results
+        metrics.observe("pdf_split_seconds", elapsed)
+        metrics.log_event(
+            "split",
+            file=filename_base,
+            segments=len(results),
+            errors=sum(1 for result in results if result["error"]),
+            bytes=sum(result["bytes"] for result in results),
+            seconds=elapsed,
+        )
+        metrics.flush()
+        
+        output_files = []
+        for result in results:
+            if result["error"]:
+                print(f"Error al procesar segmento de páginas {result['start_page']+1}-{result['end_page']}: {result['error']}")
                 # Continuar con el siguiente segmento en caso de error
                 continue
-        
-        # Liberar memoria antes de finalizar
-        gc.collect()
+            output_files.append(result["path"])
         
         return output_files
         
+    def get_page_layout(self, page_idx):
+        """
+        Text and drawing layout of a page, read without rasterizing it
+        
+        Args:
+            page_idx: Page index (0-based)
+            
+        Returns:
+            Dict with ``words`` (list of (x0, y0, x1, y1, text)), ``boxes``
+            (list of (kind, rect) from the page's drawing log), ``height``
+            and ``rotation``
+        """
+        with self._lock:
+            page = self.doc[page_idx]
+            words = [word[:5] for word in page.get_text("words")]
+            boxes = [(kind, tuple(rect)) for kind, rect in page.get_bboxlog()]
+            return {
+                "words": words,
+                "boxes": boxes,
+                "height": page.rect.height,
+                "rotation": page.rotation,
+            }
+    
+    def get_page_content_hash(self, page_idx):
+        """
+        Hash of everything that determines how a page renders
+        
+        Covers the page geometry, its content streams, its resource
+        definitions and the raw streams of its images and form XObjects.
+        Object numbers are left out, so the same page copied into another
+        PDF produces the same hash.
+        
+        Args:
+            page_idx: Page index (0-based)
+            
+        Returns:
+            Hex digest string
+        """
+        with self._lock:
+            page = self.doc[page_idx]
+            digest = hashlib.blake2b(digest_size=20)
+            digest.update(f"{tuple(page.mediabox)}|{page.rotation}|".encode())
+            digest.update(page.read_contents())
+        
+            resources = self.doc.xref_get_key(page.xref, "Resources")[1]
+            digest.update(_INDIRECT_REF.sub("R", resources).encode())
+        
+            # Imágenes y formularios: definición del objeto y flujo sin decodificar
+            xrefs = [img[0] for img in page.get_images(full=True)]
+            xrefs += [xobj[0] for xobj in page.get_xobjects()]
+            for font in page.get_fonts(full=True):
+                digest.update(_INDIRECT_REF.sub("R", self.doc.xref_object(font[0], compressed=True)).encode())
+            for xref in xrefs:
+                digest.update(_INDIRECT_REF.sub("R", self.doc.xref_object(xref, compressed=True)).encode())
+                digest.update(self.doc.xref_stream_raw(xref) or b"")
+            return digest.hexdigest()
+        
+    def _valid_mid_page_splits(self, mid_page_splits):
+        """Keep the mid-page splits that fall strictly inside their page"""
+        valid = {}
+        for page_num, y in (mid_page_splits or {}).items():
+            if 1 <= page_num <= self.total_pages and 0 < y < self.get_page_dimensions(page_num - 1)[1]:
+                valid[page_num] = y
+            else:
+                print(f"División a mitad de página ignorada (página {page_num}, y={y}): fuera de la página")
+        return valid
+        
     def get_page_dimensions(self, page_idx):
         """
         Obtiene las dimensiones de una página
@@ -235,6 +455,20 @@ class PDFProcessor:
         Returns:
             Tuple (width, height) con las dimensiones de la página
         """
-        page = self.doc[page_idx]
-        rect = page.rect
+        with self._lock:
+            rect = self.doc[page_idx].rect
         return (rect.width, rect.height)
+    
+    def close(self):
+        """
+        Close the document and release the memory-mapped file, if any
+        """
+        with self._lock:
+            self.doc.close()
+            self.doc = None
+        self.page_cache.clear()
+        if self._buffer is not None:
+            self._buffer.release()
+            self._mmap.close()
+            self._file.close()
+            self._buffer = self._mmap = self._file = None
@@ -0,0 +1,140 @@
+import os
+from collections import OrderedDict
+
+from PIL import Image
+
+import metrics
+
+# Presupuesto por defecto de la caché de renderizado (64 MB)
+DEFAULT_RENDER_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def default_render_cache_bytes():
+    """Render cache budget from PDF_RENDER_CACHE_MB, or the default"""
+    configured = os.environ.get("PDF_RENDER_CACHE_MB")
+    if configured:
+        try:
+            return max(0, int(configured)) * 1024 * 1024
+        except ValueError:
+            print(f"Valor inválido en PDF_RENDER_CACHE_MB: {configured}")
+    return DEFAULT_RENDER_CACHE_BYTES
+
+
+def image_bytes(image):
+    """Decoded size of a PIL image in memory"""
+    return image.width * image.height * len(image.getbands())
+
+
+class RenderCache:
+    """
+    Least-recently-used cache of rendered pages with a byte budget
+
+    Entries are keyed by (page_idx, zoom) and accounted by their decoded
+    size. A request for a zoom that is not cached can be served by
+    downscaling a cached render of the same page at a higher zoom.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_RENDER_CACHE_BYTES):
+        """
+        Args:
+            budget_bytes: Maximum total decoded size of the cached images
+        """
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._zooms = {}  # página -> zooms en caché
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.downscaled = 0
+        self.evictions = 0
+
+    def get(self, page_idx, zoom, size=None):
+        """
+        Look up a render
+
+        Args:
+            page_idx: Page index (0-based)
+            zoom: Zoom factor of the render
+            size: (width, height) of a render at ``zoom``; when given, a
+                cached render at a higher zoom is downscaled to this size
+
+        Returns:
+            PIL Image, or None on a miss
+        """
+        key = (page_idx, zoom)
+        image = self._entries.get(key)
+        if image is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.inc("pdf_render_cache_lookups_total", result="hit")
+            return image
+
+        if size is not None:
+            # La menor resolución mayor que la pedida da el mejor reescalado
+            larger = [z for z in self._zooms.get(page_idx, ()) if z > zoom]
+            if larger:
+                source = self._entries[(page_idx, min(larger))]
+                self._entries.move_to_end((page_idx, min(larger)))
+                image = source.resize(size, Image.Resampling.LANCZOS)
+                self.downscaled += 1
+                metrics.inc("pdf_render_cache_lookups_total", result="downscaled")
+                self.put(page_idx, zoom, image)
+                return image
+
+        self.misses += 1
+        metrics.inc("pdf_render_cache_lookups_total", result="miss")
+        return None
+
+    def put(self, page_idx, zoom, image):
+        """Store a render, evicting least recently used entries to fit the budget"""
+        size = image_bytes(image)
+        if size > self.budget_bytes:
+            return
+        key = (page_idx, zoom)
+        if key in self._entries:
+            self._discard(key)
+        self._entries[key] = image
+        self._zooms.setdefault(page_idx, set()).add(zoom)
+        self.current_bytes += size
+        while self.current_bytes > self.budget_bytes:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+            metrics.inc("pdf_render_cache_evictions_total")
+
+    def _discard(self, key):
+        image = self._entries.pop(key)
+        self.current_bytes -= image_bytes(image)
+        zooms = self._zooms.get(key[0])
+        if zooms is not None:
+            zooms.discard(key[1])
+            if not zooms:
+                del self._zooms[key[0]]
+
+    def clear(self):
+        """Remove every entry (the counters are kept)"""
+        self._entries.clear()
+        self._zooms.clear()
+        self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Cache counters
+
+        Returns:
+            Dict with hits, downscaled hits, misses, evictions, hit rate,
+            number of entries and bytes in use
+        """
+        lookups = self.hits + self.downscaled + self.misses
+        return {
+            "hits": self.hits,
+            "downscaled": self.downscaled,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.downscaled) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "budget_bytes": self.budget_bytes,
+        }
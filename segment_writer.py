@@ -0,0 +1,216 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+import metrics
+
+# Los procesos del pool no se crean con fork: la división se lanza desde
+# hilos (planificador) y el proceso hijo heredaría cerrojos tomados por
+# otros hilos en el momento de la copia
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# Documento fuente abierto por cada proceso del pool
+_worker_doc = None
+
+# Perfiles de guardado de los segmentos (opciones de Document.save).
+# garbage=3 elimina los objetos sin usar y fusiona los duplicados;
+# garbage=4 además compara el contenido de los streams
+SAVE_PROFILES = {
+    "default": {},
+    "compact": {"garbage": 3, "deflate": True},
+    "smallest": {"garbage": 4, "deflate": True, "deflate_images": True, "deflate_fonts": True,
+                 "use_objstms": 1},
+    "web": {"garbage": 3, "deflate": True, "linear": True},
+}
+
+# Resultado de comprobar si esta versión de PyMuPDF puede linealizar
+_linear_supported = None
+
+
+def default_save_profile():
+    """Save profile named by PDF_SPLIT_SAVE_PROFILE ("default" when unset)"""
+    configured = os.environ.get("PDF_SPLIT_SAVE_PROFILE", "default")
+    if configured not in SAVE_PROFILES:
+        print(f"Valor inválido en PDF_SPLIT_SAVE_PROFILE: {configured}")
+        return "default"
+    return configured
+
+
+def linear_save_supported():
+    """True if this PyMuPDF version can write linearized PDFs (removed in 1.24)"""
+    global _linear_supported
+    if _linear_supported is None:
+        probe = fitz.open()
+        probe.new_page()
+        try:
+            probe.tobytes(linear=True)
+            _linear_supported = True
+        except Exception:
+            _linear_supported = False
+        probe.close()
+    return _linear_supported
+
+
+def save_options(profile=None):
+    """
+    Resolve a save profile into keyword arguments for ``Document.save``
+
+    Args:
+        profile: Name of a profile in SAVE_PROFILES, a dict of save options,
+            or None for PDF_SPLIT_SAVE_PROFILE
+
+    Returns:
+        Dict of save options; linearization is dropped (with a warning)
+        when PyMuPDF does not support it
+    """
+    if profile is None:
+        profile = default_save_profile()
+    options = dict(SAVE_PROFILES[profile] if isinstance(profile, str) else profile)
+    if options.get("linear") and not linear_save_supported():
+        print("Esta versión de PyMuPDF no admite la linealización; se guarda sin ella")
+        options.pop("linear")
+    return options
+
+
+def default_split_workers():
+    """
+    Number of processes used to write segments when none is configured
+
+    Reads the PDF_SPLIT_WORKERS environment variable and falls back to the
+    number of available CPU cores.
+    """
+    configured = os.environ.get("PDF_SPLIT_WORKERS")
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            print(f"Valor inválido en PDF_SPLIT_WORKERS: {configured}")
+    return os.cpu_count() or 1
+
+
+def write_segment(source_doc, segment):
+    """
+    Copy one page range of the source document into a new PDF file
+
+    The whole range is inserted with a single ``insert_pdf`` call so shared
+    resources (fonts, images) are copied once per segment instead of once
+    per page.
+
+    Pages cut by a mid-page split (``head_clip``/``tail_clip``) are placed
+    on their own page with ``show_pdf_page`` clipped to the kept part, so
+    their vector content is reused instead of rasterized.
+
+    Args:
+        source_doc: Open fitz document to copy from
+        segment: Dict with ``start_page`` (0-based, inclusive),
+            ``end_page`` (0-based, exclusive) and ``path``; optionally
+            ``head_clip`` (the first page starts at this y) and
+            ``tail_clip`` (the last page ends at this y) and
+            ``save_options`` (keyword arguments for ``Document.save``, see
+            ``save_options``)
+
+    Returns:
+        Dict with the segment data plus ``seconds`` (total),
+        ``save_seconds`` and ``bytes`` written, or with ``error`` set if the
+        segment could not be written
+    """
+    result = dict(segment)
+    started = time.perf_counter()
+    try:
+        new_doc = fitz.open()
+        first = segment["start_page"]
+        last = segment["end_page"] - 1
+        head_clip = segment.get("head_clip")
+        tail_clip = segment.get("tail_clip")
+
+        if first == last and (head_clip is not None or tail_clip is not None):
+            _insert_clipped_page(new_doc, source_doc, first, head_clip, tail_clip)
+        else:
+            if head_clip is not None:
+                _insert_clipped_page(new_doc, source_doc, first, head_clip, None)
+                first += 1
+            if tail_clip is not None:
+                last -= 1
+            if first <= last:
+                new_doc.insert_pdf(source_doc, from_page=first, to_page=last)
+            if tail_clip is not None:
+                _insert_clipped_page(new_doc, source_doc, last + 1, None, tail_clip)
+        save_started = time.perf_counter()
+        new_doc.save(segment["path"], **segment.get("save_options", {}))
+        result["save_seconds"] = time.perf_counter() - save_started
+        new_doc.close()
+        result["bytes"] = os.path.getsize(segment["path"])
+        result["error"] = None
+    except Exception as e:
+        result["bytes"] = 0
+        result.setdefault("save_seconds", 0.0)
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _insert_clipped_page(new_doc, source_doc, page_idx, top, bottom):
+    """
+    Append the horizontal band [top, bottom] of a source page as a new page
+
+    Args:
+        new_doc: Document being written
+        source_doc: Source document
+        page_idx: Source page index (0-based)
+        top: Upper edge of the band in points (None = top of the page)
+        bottom: Lower edge of the band in points (None = bottom of the page)
+    """
+    rect = source_doc[page_idx].rect
+    clip = fitz.Rect(rect.x0, rect.y0 if top is None else top,
+                     rect.x1, rect.y1 if bottom is None else bottom)
+    page = new_doc.new_page(width=clip.width, height=clip.height)
+    page.show_pdf_page(page.rect, source_doc, page_idx, clip=clip)
+
+
+def _init_worker(pdf_path):
+    """Open a private copy of the source document in each worker process"""
+    global _worker_doc
+    _worker_doc = fitz.open(pdf_path)
+
+
+def _write_in_worker(segment):
+    return write_segment(_worker_doc, segment)
+
+
+def write_segments(source_doc, pdf_path, segments, workers=None):
+    """
+    Write several independent segments, in parallel when possible
+
+    Args:
+        source_doc: Open fitz document, used when writing sequentially
+        pdf_path: Path of the source PDF, opened again by each worker
+        segments: List of segment dicts (see ``write_segment``)
+        workers: Number of processes (None = PDF_SPLIT_WORKERS or all cores)
+
+    Returns:
+        List of result dicts in the same order as ``segments``
+    """
+    if workers is None:
+        workers = default_split_workers()
+    workers = max(1, min(workers, len(segments)))
+
+    if workers == 1:
+        results = [write_segment(source_doc, segment) for segment in segments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT,
+                                 initializer=_init_worker, initargs=(pdf_path,)) as executor:
+            results = list(executor.map(_write_in_worker, segments))
+
+    # Métricas en el proceso principal (los procesos del pool no las conservan)
+    for result in results:
+        metrics.observe("pdf_segment_write_seconds", result["seconds"])
+        metrics.observe("pdf_segment_save_seconds", result["save_seconds"])
+        metrics.inc("pdf_segment_bytes_total", result["bytes"])
+        metrics.inc("pdf_segment_pages_total", result["end_page"] - result["start_page"])
+        metrics.inc("pdf_segments_written_total", status="error" if result["error"] else "ok")
+    return results
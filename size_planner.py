@@ -0,0 +1,154 @@
+import re
+
+# Referencias indirectas ("12 0 R") dentro de la definición de un objeto
+_INDIRECT_REF = re.compile(rb"\b(\d+) (\d+) R\b")
+
+# La referencia al nodo padre llevaría al árbol de páginas (y de ahí a todas
+# las páginas); insert_pdf no la copia, así que se quita antes de buscar
+_PARENT_REF = re.compile(rb"/Parent\s+\d+\s+\d+\s+R")
+
+# Bytes de cada objeto fuera de su definición: "N 0 obj", "endobj",
+# "stream"/"endstream" y su entrada en la tabla xref
+OBJECT_OVERHEAD = 48
+
+# Bytes fijos de cada archivo: cabecera, catálogo, árbol de páginas y trailer
+FILE_OVERHEAD = 512
+
+# Bytes por página en el árbol de páginas del archivo nuevo (/Kids)
+PAGE_OVERHEAD = 24
+
+
+class PageObjectIndex:
+    """
+    Objects each page of a document pulls into a file, and their sizes
+
+    A page needs its own dictionary, its content streams and everything
+    reachable from them (fonts, images, form XObjects, annotations), but
+    not the page tree or other pages. Sizes are read from the object
+    definitions and the stored ``/Length`` of the streams, so no stream is
+    decoded and no document is saved. Objects shared by several pages are
+    visited once and counted once per output file by ``plan_size_splits``.
+    """
+
+    def __init__(self, doc):
+        """
+        Args:
+            doc: Open fitz document
+        """
+        self.doc = doc
+        self.sizes = {}
+        self._children = {}
+        self._page_xrefs = {doc[page_idx].xref for page_idx in range(len(doc))}
+
+    def _object_size(self, xref, definition):
+        size = len(definition) + OBJECT_OVERHEAD
+        if self.doc.xref_is_stream(xref):
+            kind, value = self.doc.xref_get_key(xref, "Length")
+            if kind == "int":
+                size += int(value)
+            elif kind == "xref":
+                # Longitud en un objeto aparte (p. ej. "15 0 R")
+                try:
+                    size += int(self.doc.xref_object(int(value.split()[0])).strip())
+                except ValueError:
+                    size += len(self.doc.xref_stream_raw(xref) or b"")
+            else:
+                size += len(self.doc.xref_stream_raw(xref) or b"")
+        return size
+
+    def _visit(self, xref):
+        """Size and direct references of one object (memoized)"""
+        children = self._children.get(xref)
+        if children is None:
+            try:
+                definition = self.doc.xref_object(xref, compressed=True).encode("latin-1", "replace")
+            except Exception:
+                definition = b""
+            self.sizes[xref] = self._object_size(xref, definition) if definition else 0
+            definition = _PARENT_REF.sub(b"", definition)
+            children = {int(match.group(1)) for match in _INDIRECT_REF.finditer(definition)}
+            children.discard(xref)
+            self._children[xref] = children
+        return children
+
+    def page_objects(self, page_idx):
+        """
+        Objects (xref numbers) copied with one page
+
+        Args:
+            page_idx: Page index (0-based)
+
+        Returns:
+            Set of xref numbers, the page dictionary included
+        """
+        page_xref = self.doc[page_idx].xref
+        reached = {page_xref}
+        pending = [page_xref]
+        while pending:
+            for child in self._visit(pending.pop()):
+                # Otras páginas (destinos de enlaces, /P de anotaciones) no se copian
+                if child not in reached and child not in self._page_xrefs:
+                    reached.add(child)
+                    pending.append(child)
+        return reached
+
+
+def plan_size_splits(index, total_pages, max_bytes=None, max_pages=None, split_points=None):
+    """
+    Split points that keep every output file under a size and page limit
+
+    The pages are walked once. Each segment keeps the set of objects it
+    already contains, so a font or image shared by its pages counts only
+    once, and a page is moved to a new segment when its new objects would
+    take the segment over ``max_bytes`` (or it would exceed ``max_pages``).
+    The user's split points always end a segment and are kept.
+
+    Args:
+        index: PageObjectIndex of the document
+        total_pages: Number of pages in the document
+        max_bytes: Maximum estimated size of each file (None = no limit)
+        max_pages: Maximum number of pages of each file (None = no limit)
+        split_points: Split points (1-based) chosen by the user
+
+    Returns:
+        Tuple (split_points, estimates): the sorted split points, the
+        user's and the added ones, and the estimated bytes of each
+        resulting segment, in order
+    """
+    user_splits = {page_num for page_num in (split_points or []) if 0 < page_num < total_pages}
+    splits = set(user_splits)
+    estimates = []
+    seen = set()
+    current_bytes = FILE_OVERHEAD
+    current_pages = 0
+
+    for page_idx in range(total_pages):
+        objects = index.page_objects(page_idx)
+        added = PAGE_OVERHEAD + sum(index.sizes[xref] for xref in objects - seen)
+        too_big = max_bytes is not None and current_bytes + added > max_bytes
+        too_long = max_pages is not None and current_pages >= max_pages
+        if current_pages and (too_big or too_long):
+            # Cortar antes de esta página: empieza un segmento nuevo
+            splits.add(page_idx)
+            estimates.append(current_bytes)
+            seen = set()
+            current_bytes = FILE_OVERHEAD
+            current_pages = 0
+            added = PAGE_OVERHEAD + sum(index.sizes[xref] for xref in objects)
+
+        seen |= objects
+        current_bytes += added
+        current_pages += 1
+        if max_bytes is not None and current_pages == 1 and current_bytes > max_bytes:
+            print(f"La página {page_idx + 1} supera por sí sola el tamaño máximo "
+                  f"({current_bytes} bytes estimados)")
+
+        if page_idx + 1 in user_splits:
+            estimates.append(current_bytes)
+            seen = set()
+            current_bytes = FILE_OVERHEAD
+            current_pages = 0
+
+    if current_pages:
+        estimates.append(current_bytes)
+    return sorted(splits), estimates
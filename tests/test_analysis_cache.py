@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+from analysis_cache import AnalysisCache
+from feature_store import FeatureStore
+
+
+def test_feature_files_count_against_budget_and_are_evicted(tmp_path):
+    cache = AnalysisCache(str(tmp_path), budget_bytes=128 * 1024)
+    old_pages = [f"p{page_idx}" for page_idx in range(4)]
+    cache.put_pages([(page_key, False, b"x" * 2048) for page_key in old_pages])
+    cache.put_document("old", old_pages)
+    old_features = FeatureStore(cache.feature_path("old"), 200)
+    old_features.close()
+    assert cache.total_bytes() == 4 * 2048 + os.path.getsize(cache.feature_path("old"))
+
+    # Páginas nuevas hasta superar el presupuesto: el documento antiguo y
+    # su archivo de características se desalojan
+    new_pages = [f"q{page_idx}" for page_idx in range(40)]
+    cache.put_pages([(page_key, True, b"y" * 2048) for page_key in new_pages])
+    assert cache.get_document("old") is None
+    assert not os.path.exists(cache.feature_path("old"))
+    assert cache.total_bytes() <= cache.budget_bytes
+    # Las páginas más recientes se conservan
+    assert set(cache.get_pages(new_pages[-5:])) == set(new_pages[-5:])
+
+
+def test_feature_files_alone_over_budget_keep_the_document_being_analyzed(tmp_path):
+    cache = AnalysisCache(str(tmp_path), budget_bytes=16 * 1024)
+    cache.put_checkpoint("big", ["a"], np.array([True]), np.array([False]))
+    cache.put_checkpoint("old", ["b"], np.array([True]), np.array([True]))
+    FeatureStore(cache.feature_path("old"), 200).close()
+    # El análisis en curso tiene su archivo abierto como memmap
+    cache.hold_document("big")
+    features = FeatureStore(cache.feature_path("big"), 200)
+
+    cache.put_pages([("a", False, b"x" * 100)])
+    # Todo lo demás se desaloja, pero el documento en análisis se conserva
+    assert cache.get_checkpoint("old") is None
+    assert not os.path.exists(cache.feature_path("old"))
+    assert cache.get_checkpoint("big") is not None
+    assert os.path.exists(cache.feature_path("big"))
+    assert cache.total_bytes() == os.path.getsize(cache.feature_path("big"))
+
+    # Al terminar el análisis vuelve a poder desalojarse
+    features.close()
+    cache.release_document("big")
+    cache.put_pages([("a", False, b"x" * 100)])
+    assert cache.get_checkpoint("big") is None
+    assert cache.total_bytes() == 0
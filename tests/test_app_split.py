@@ -0,0 +1,53 @@
+import os
+
+import fitz
+import pytest
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+@pytest.fixture
+def small_pdf():
+    doc = fitz.open()
+    for page_num in range(3):
+        doc.new_page().insert_text((72, 72), f"Página {page_num + 1}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, small_pdf):
+    monkeypatch.setenv("PDF_ANALYSIS_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("PDF_SPLITTER_SPILL_DIR", str(tmp_path))
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    at.file_uploader[0].upload("expediente.pdf", small_pdf, "application/pdf").run()
+    at.button(key="split_btn").click().run()
+    return at
+
+
+def test_limits_without_cuts_show_a_warning(app):
+    app.number_input(key="max_pages").set_value(10).run()
+    assert not app.exception
+    assert any("cabe en un solo archivo" in warning.value for warning in app.warning)
+    assert not [button for button in app.button if button.label == "Confirmar y Dividir PDF"]
+
+
+def test_limits_with_cuts_offer_the_split(app):
+    app.number_input(key="max_pages").set_value(2).run()
+    assert not app.exception
+    assert not any("cabe en un solo archivo" in warning.value for warning in app.warning)
+    assert [button for button in app.button if button.label == "Confirmar y Dividir PDF"]
+
+
+def test_clear_all_resets_the_suggestion_state(app):
+    # Estado que deja un análisis terminado
+    app.session_state["fingerprint_splits"] = 2
+    app.session_state["features_applied"] = "análisis anterior"
+    app.button(key="clear_btn").click().run()
+    assert not app.exception
+    assert app.session_state["fingerprint_splits"] == 0
+    assert app.session_state["features_applied"] is None
+    assert app.session_state["suggested_splits"] == set()
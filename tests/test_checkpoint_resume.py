@@ -0,0 +1,75 @@
+import fitz
+import numpy as np
+import pytest
+
+import analysis_pipeline
+from analysis_cache import AnalysisCache
+from analysis_pipeline import iter_cached_page_analysis
+from image_analyzer import DETECTOR_VERSION
+from pdf_processor import PDFProcessor
+
+PAGES = 8
+CANCEL_AFTER = 3
+
+
+@pytest.fixture
+def distinct_pdf(tmp_path):
+    """Text pages with different content, so no page is answered by another's cache entry"""
+    path = str(tmp_path / "escritos.pdf")
+    doc = fitz.open()
+    for page_num in range(PAGES):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 100), f"Escrito número {page_num + 1}")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def analyzed_pages(monkeypatch):
+    """Record the pages sent to the analysis in each run"""
+    runs = []
+    original = analysis_pipeline.iter_page_analysis
+
+    def recording(pdf_path, total_pages, pages=None, **kwargs):
+        runs.append(list(range(total_pages)) if pages is None else list(pages))
+        return original(pdf_path, total_pages, pages=pages, **kwargs)
+
+    monkeypatch.setattr(analysis_pipeline, "iter_page_analysis", recording)
+    return runs
+
+
+def test_cancelled_analysis_resumes_with_the_missing_pages(distinct_pdf, tmp_path, analyzed_pages):
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    processor = PDFProcessor(distinct_pdf)
+    try:
+        # Primera sesión: se abandona el análisis tras unas pocas páginas
+        results = iter_cached_page_analysis(processor, "escritos", cache, workers=1)
+        first = [next(results) for _ in range(CANCEL_AFTER)]
+        results.close()
+        assert [result[0] for result in first] == list(range(CANCEL_AFTER))
+
+        doc_key = cache.document_key("escritos", DETECTOR_VERSION, 0.5)
+        assert cache.get_document(doc_key) is None
+        checkpoint = cache.get_checkpoint(doc_key)
+        expected = [True] * CANCEL_AFTER + [False] * (PAGES - CANCEL_AFTER)
+        assert checkpoint["completed"].tolist() == expected
+        np.testing.assert_array_equal(checkpoint["verdicts"][:CANCEL_AFTER],
+                                      [result[1] for result in first])
+
+        # Segunda sesión: solo se analizan las páginas que faltaban
+        second = list(iter_cached_page_analysis(processor, "escritos", cache, workers=1))
+        assert analyzed_pages[-1] == list(range(CANCEL_AFTER, PAGES))
+        assert [result[0] for result in second] == list(range(PAGES))
+        assert [result[3] for result in second[:CANCEL_AFTER]] == ["cache"] * CANCEL_AFTER
+        assert "cache" not in [result[3] for result in second[CANCEL_AFTER:]]
+        assert [result[1] for result in second[:CANCEL_AFTER]] == [result[1] for result in first]
+
+        # Completo: el documento queda registrado y el checkpoint se borra
+        assert cache.get_checkpoint(doc_key) is None
+        assert cache.get_document(doc_key) is not None
+        third = list(iter_cached_page_analysis(processor, "escritos", cache, workers=1))
+        assert analyzed_pages[-1] == []
+        assert [result[3] for result in third] == ["cache"] * PAGES
+    finally:
+        processor.close()
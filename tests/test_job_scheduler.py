@@ -0,0 +1,118 @@
+import threading
+import time
+
+from job_scheduler import JobScheduler
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "tiempo de espera agotado"
+        time.sleep(0.01)
+
+
+class Blocking:
+    """Job body that runs until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def __call__(self):
+        assert self.release.wait(5)
+        return "ok"
+
+
+def test_jobs_wait_until_their_memory_fits():
+    scheduler = JobScheduler(slots=2, memory_budget=100)
+    first = Blocking()
+    running = scheduler.submit(first, session_id="a", cost=80)
+    wait_until(lambda: running.status == "running")
+
+    # Hay un turno libre, pero 80 + 50 supera el presupuesto
+    too_big = scheduler.submit(Blocking(), session_id="b", cost=50)
+    small = scheduler.submit(lambda: "ok", session_id="c", cost=10)
+    time.sleep(0.1)
+    assert too_big.status == "queued" and small.status == "queued"
+    # El orden de la cola se respeta: el pequeño no adelanta al grande
+    assert too_big.position() == 1 and small.position() == 2
+    assert scheduler.memory_in_use == 80
+
+    first.release.set()
+    wait_until(lambda: too_big.status == "running")
+    # 50 + 10 cabe: el pequeño ya no espera
+    assert small.wait(5) and small.result == "ok"
+    too_big.fn.release.set()
+    assert too_big.wait(5)
+    wait_until(lambda: scheduler.memory_in_use == 0)
+
+
+def test_job_larger_than_the_budget_runs_alone():
+    scheduler = JobScheduler(slots=2, memory_budget=100)
+    huge = scheduler.submit(lambda: "ok", session_id="a", cost=500)
+    assert huge.wait(5) and huge.status == "done" and huge.result == "ok"
+
+
+def test_sessions_are_served_round_robin():
+    scheduler = JobScheduler(slots=1, memory_budget=100)
+    blocker = Blocking()
+    first = scheduler.submit(blocker, session_id="z", cost=1)
+    wait_until(lambda: first.status == "running")
+
+    started = []
+    jobs = {}
+    # La sesión "a" encola tres trabajos antes de que "b" encole los suyos
+    for label in ["a1", "a2", "a3", "b1", "b2"]:
+        jobs[label] = scheduler.submit(lambda label=label: started.append(label),
+                                       session_id=label[0], cost=1, label=label)
+    expected = ["a1", "b1", "a2", "b2", "a3"]
+    assert [jobs[label].position() for label in expected] == [1, 2, 3, 4, 5]
+    # Al cancelar un trabajo, el siguiente de su sesión ocupa su turno
+    assert jobs["a2"].cancel() and jobs["a2"].status == "cancelled"
+    assert jobs["a3"].position() == 3 and jobs["b2"].position() == 4
+
+    blocker.release.set()
+    for job in jobs.values():
+        assert job.wait(5)
+    assert started == ["a1", "b1", "a3", "b2"]
+
+
+def test_split_is_not_blocked_by_long_analyses():
+    scheduler = JobScheduler(slots=2, memory_budget=100, split_slots=1)
+    analyses = [Blocking(), Blocking(), Blocking()]
+    jobs = [scheduler.submit(body, session_id=f"s{index}", cost=40, kind="analysis")
+            for index, body in enumerate(analyses)]
+    wait_until(lambda: [job.status for job in jobs].count("running") == 2)
+
+    # Los turnos compartidos están ocupados y el presupuesto casi lleno:
+    # la división entra en su turno propio sin esperar a los análisis
+    split = scheduler.submit(lambda: "dividido", session_id="s9", cost=30, kind="split")
+    assert split.wait(5) and split.result == "dividido"
+    assert jobs[2].status == "queued" and jobs[2].position() == 1
+
+    # Un turno de división nunca ejecuta un análisis
+    for body in analyses:
+        body.release.set()
+    for job in jobs:
+        assert job.wait(5) and job.lane is None
+    assert split.lane == "split"
+
+
+def test_split_slot_admits_by_memory_only_among_splits():
+    scheduler = JobScheduler(slots=1, memory_budget=100, split_slots=2)
+    analysis = Blocking()
+    running = scheduler.submit(analysis, session_id="a", cost=90, kind="analysis")
+    wait_until(lambda: running.status == "running")
+
+    # La primera división entra aunque no quepa; la segunda espera a que
+    # haya memoria, y su posición solo cuenta las divisiones
+    first = Blocking()
+    first_split = scheduler.submit(first, session_id="b", cost=50, kind="split")
+    wait_until(lambda: first_split.status == "running")
+    second_split = scheduler.submit(lambda: "ok", session_id="c", cost=50, kind="split")
+    time.sleep(0.1)
+    assert second_split.status == "queued" and second_split.position() == 1
+
+    analysis.release.set()
+    first.release.set()
+    assert second_split.wait(5) and second_split.result == "ok"
+    wait_until(lambda: scheduler.memory_in_use == 0)
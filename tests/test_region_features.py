@@ -0,0 +1,109 @@
+import glob
+import os
+
+import fitz
+import numpy as np
+import pytest
+
+from analysis_pipeline import analyze_page, render_page_features
+from benchmarks.synthetic_bundle import generate_bundle
+from image_analyzer import (
+    DEFAULT_DETECTOR_PARAMS,
+    _evaluate_features,
+    detect_split_points,
+    extract_page_features,
+    suggest_from_features,
+)
+from pdf_processor import PDFProcessor
+
+PAGES = 6
+
+# Escaneos reales incluidos en el repositorio
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REAL_SCANS = sorted(glob.glob(os.path.join(REPO_DIR, "Descargas", "*.pdf"))
+                    + glob.glob(os.path.join(REPO_DIR, "pdf_divididos", "*.pdf")))
+
+
+@pytest.fixture(scope="module")
+def bundle(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("bundle") / "bundle.pdf")
+    # Muchas páginas con firma o sello, también en la mitad superior
+    generate_bundle(path, pages=PAGES, signature_ratio=0.4, stamp_ratio=0.4, seed=3)
+    return path
+
+
+@pytest.fixture(scope="module")
+def real_bundle(tmp_path_factory):
+    """Every distinct page of the repository's scans in one document"""
+    path = str(tmp_path_factory.mktemp("real") / "real.pdf")
+    bundle = fitz.open()
+    for scan in REAL_SCANS:
+        with fitz.open(scan) as source:
+            bundle.insert_pdf(source)
+    bundle.save(path)
+    bundle.close()
+    processor = PDFProcessor(path)
+    seen, pages = set(), []
+    for page_idx in range(processor.get_total_pages()):
+        page_hash = processor.get_page_content_hash(page_idx)
+        if page_hash not in seen:
+            seen.add(page_hash)
+            pages.append(page_idx)
+    processor.close()
+    return path, pages
+
+
+@pytest.fixture
+def processor(bundle):
+    processor = PDFProcessor(bundle)
+    yield processor
+    processor.close()
+
+
+def whole_page_features(processor, page_idx):
+    pix, gray = processor.get_page_region_gray(page_idx, top=0, zoom=0.5)[:2]
+    return extract_page_features(gray, check_stamps=True), detect_split_points(gray)
+
+
+def test_region_features_match_whole_page(processor):
+    # Miniaturas a 0,3: la región se renderiza aparte con el zoom de detección
+    processor.memory_optimized = True
+    for page_idx in range(PAGES):
+        whole, verdict = whole_page_features(processor, page_idx)
+        region, thumbnail = render_page_features(processor, page_idx, 0.5, check_stamps=True)
+        stages = [stage.tolist() for stage in _evaluate_features(whole, DEFAULT_DETECTOR_PARAMS)]
+        assert [stage.tolist() for stage in _evaluate_features(region, DEFAULT_DETECTOR_PARAMS)] == stages
+        assert bool(suggest_from_features(region)) == verdict
+        np.testing.assert_allclose(region["band_ink"][10:], whole["band_ink"][10:])
+        assert thumbnail[:2] == b"\xff\xd8"
+
+
+def test_region_features_match_whole_page_on_real_scans(real_bundle):
+    path, pages = real_bundle
+    processor = PDFProcessor(path)
+    processor.memory_optimized = True
+    try:
+        for page_idx in pages:
+            whole, verdict = whole_page_features(processor, page_idx)
+            region, _ = render_page_features(processor, page_idx, 0.5, check_stamps=True)
+            # Todo lo que lee el detector coincide, también los sellos
+            np.testing.assert_array_equal(region["circle_radius"], whole["circle_radius"])
+            # La página completa guarda además contornos más altos que la región
+            lower = whole["contour_top"] > 0.5
+            np.testing.assert_array_equal(region["contour_area"][:lower.sum()], whole["contour_area"][lower])
+            np.testing.assert_array_equal(region["band_ink"][10:], whole["band_ink"][10:])
+            assert bool(suggest_from_features(region)) == verdict, page_idx
+    finally:
+        processor.close()
+
+
+def test_whole_page_features_match_detector(processor):
+    for page_idx in range(PAGES):
+        record, _ = render_page_features(processor, page_idx, 0.5)
+        assert bool(suggest_from_features(record)) == whole_page_features(processor, page_idx)[1]
+
+
+def test_raster_pages_get_a_thumbnail(processor):
+    for page_idx in range(PAGES):
+        thumbnail, _, stage = analyze_page(processor, page_idx)
+        assert (thumbnail is None) == (stage == "text")
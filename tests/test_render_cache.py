@@ -0,0 +1,102 @@
+import fitz
+import numpy as np
+import pytest
+from PIL import Image
+
+from pdf_processor import PDFProcessor
+from render_cache import RenderCache, image_bytes
+
+
+def solid(width, height, color=(255, 255, 255)):
+    return Image.new("RGB", (width, height), color=color)
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    # Cada imagen de 10x10 RGB ocupa 300 bytes: caben tres
+    cache = RenderCache(budget_bytes=900)
+    for page_idx in range(3):
+        cache.put(page_idx, 0.5, solid(10, 10))
+    # Consultar la página 0 la convierte en la más reciente
+    assert cache.get(0, 0.5) is not None
+
+    cache.put(3, 0.5, solid(10, 10))
+    assert cache.get(1, 0.5) is None
+    assert [cache.get(page_idx, 0.5) is not None for page_idx in (0, 2, 3)] == [True, True, True]
+
+    cache.put(4, 0.5, solid(10, 10))
+    # Tras las consultas anteriores la menos usada es la página 0
+    assert cache.get(0, 0.5) is None
+    assert cache.stats()["evictions"] == 2
+    assert len(cache) == 3
+
+
+def test_bytes_follow_puts_replacements_and_evictions():
+    cache = RenderCache(budget_bytes=10_000)
+    cache.put(0, 0.5, solid(20, 10))
+    cache.put(1, 0.5, Image.new("L", (20, 10)))
+    assert cache.current_bytes == 600 + 200
+
+    # Reemplazar una entrada descuenta la anterior
+    cache.put(0, 0.5, solid(10, 10))
+    assert cache.current_bytes == 300 + 200
+
+    # Una imagen mayor que el presupuesto no se guarda ni desaloja nada
+    cache.put(2, 0.5, solid(100, 100))
+    assert cache.current_bytes == 500 and len(cache) == 2
+
+    # Desalojar para hacer sitio deja el total dentro del presupuesto
+    cache.put(3, 1.0, solid(50, 60))
+    assert cache.current_bytes == sum(image_bytes(image) for image in cache._entries.values())
+    assert cache.current_bytes <= cache.budget_bytes
+    assert cache.stats()["bytes"] == cache.current_bytes
+
+    cache.clear()
+    assert cache.current_bytes == 0 and len(cache) == 0 and cache._zooms == {}
+
+
+def test_downscaled_entry_matches_lanczos_resize_of_larger_render():
+    rng = np.random.default_rng(0)
+    large = Image.fromarray(rng.integers(0, 256, (80, 60, 3), dtype=np.uint8))
+    cache = RenderCache()
+    cache.put(0, 0.5, large)
+    cache.put(0, 1.0, large.resize((120, 160)))
+    # Sin tamaño no se puede reducir otra resolución
+    assert cache.get(0, 0.25) is None
+
+    small = cache.get(0, 0.25, size=(30, 40))
+    # Se reduce la menor resolución mayor que la pedida (0.5, no 1.0)
+    expected = large.resize((30, 40), Image.Resampling.LANCZOS)
+    assert small.size == (30, 40)
+    assert np.array_equal(np.asarray(small), np.asarray(expected))
+    # La versión reducida queda en caché como entrada propia
+    assert cache.get(0, 0.25) is small
+    assert cache.stats()["downscaled"] == 1
+
+
+@pytest.fixture
+def text_pdf(tmp_path):
+    path = str(tmp_path / "texto.pdf")
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((72, 100), "Contrato de arrendamiento", fontsize=24)
+    page.draw_rect(fitz.Rect(72, 300, 540, 500), color=(0, 0, 0), fill=(0.2, 0.2, 0.2))
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_downscaled_page_is_close_to_a_direct_render(text_pdf):
+    processor = PDFProcessor(text_pdf)
+    try:
+        processor.get_page_image(0, zoom=1.0)
+        downscaled = processor.get_page_image(0, zoom=0.5)
+        assert processor.page_cache.stats()["downscaled"] == 1
+
+        processor.page_cache.clear()
+        direct = processor.get_page_image(0, zoom=0.5)
+    finally:
+        processor.close()
+    assert downscaled.size == direct.size
+    difference = np.abs(np.asarray(downscaled, dtype=np.int16) - np.asarray(direct, dtype=np.int16))
+    # Solo difieren los bordes suavizados del texto y del rectángulo
+    assert difference.mean() < 1
@@ -0,0 +1,64 @@
+import os
+
+import fitz
+import pytest
+
+from benchmarks.synthetic_bundle import generate_bundle
+from pdf_processor import PDFProcessor
+from size_planner import PageObjectIndex, plan_size_splits
+
+PAGES = 24
+MAX_BYTES = 250_000
+MAX_PAGES = 5
+USER_SPLITS = [3, 11]
+
+
+@pytest.fixture(scope="module")
+def bundle(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("bundle") / "expediente.pdf")
+    # Las páginas escaneadas reutilizan 4 imágenes de unos 180 KB
+    generate_bundle(path, pages=PAGES, seed=7)
+    return path
+
+
+def test_planned_segments_stay_under_the_limits(bundle, tmp_path):
+    processor = PDFProcessor(bundle)
+    try:
+        splits, estimates = processor.plan_size_splits(MAX_BYTES, MAX_PAGES, USER_SPLITS)
+        files = processor.split_pdf(USER_SPLITS, str(tmp_path), max_bytes=MAX_BYTES,
+                                    max_pages=MAX_PAGES, workers=1)
+    finally:
+        processor.close()
+
+    # Las divisiones del usuario se conservan y se añaden las necesarias
+    assert set(USER_SPLITS) < set(splits)
+    assert len(files) == len(estimates) == len(splits) + 1
+
+    page_counts = []
+    for path, estimate in zip(files, estimates):
+        size = os.path.getsize(path)
+        assert size <= MAX_BYTES
+        # La estimación es una cota superior del archivo escrito
+        assert size <= estimate
+        with fitz.open(path) as segment:
+            assert segment.page_count <= MAX_PAGES
+            page_counts.append(segment.page_count)
+    assert sum(page_counts) == PAGES
+    ends = [sum(page_counts[:i + 1]) for i in range(len(page_counts) - 1)]
+    assert ends == splits
+
+
+def test_shared_objects_are_counted_once(bundle):
+    doc = fitz.open(bundle)
+    try:
+        index = PageObjectIndex(doc)
+        splits, estimates = plan_size_splits(index, PAGES)
+        per_page = sum(sum(index.sizes[xref] for xref in index.page_objects(page_idx))
+                       for page_idx in range(PAGES))
+    finally:
+        doc.close()
+    assert splits == [] and len(estimates) == 1
+    # Las 4 imágenes se repiten en muchas páginas pero cuentan una sola vez:
+    # la estimación queda cerca del archivo original y muy por debajo de la
+    # suma página a página
+    assert os.path.getsize(bundle) <= estimates[0] < per_page / 2
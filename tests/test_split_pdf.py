@@ -0,0 +1,109 @@
+import os
+
+import fitz
+import pytest
+
+from benchmarks.synthetic_bundle import generate_bundle
+from pdf_processor import PDFProcessor
+
+PAGES = 9
+SPLITS = [2, 5]
+
+
+@pytest.fixture(scope="module")
+def bundle(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("bundle") / "expediente.pdf")
+    # Páginas de texto y escaneadas, con firmas y sellos
+    generate_bundle(path, pages=PAGES, signature_ratio=0.3, stamp_ratio=0.3, seed=5)
+    return path
+
+
+def per_page_copy(source, start_page, end_page):
+    """The previous implementation: one insert_pdf call per page"""
+    doc = fitz.open()
+    for page_num in range(start_page, end_page):
+        doc.insert_pdf(source, from_page=page_num, to_page=page_num)
+    return doc
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_segments_match_per_page_copy(bundle, tmp_path, workers):
+    processor = PDFProcessor(bundle)
+    try:
+        files = processor.split_pdf(SPLITS, str(tmp_path), original_filename="expediente.pdf",
+                                    workers=workers)
+    finally:
+        processor.close()
+    assert [os.path.basename(path) for path in files] == [
+        "expediente-1-2.pdf", "expediente-3-5.pdf", "expediente-6-9.pdf",
+    ]
+
+    source = fitz.open(bundle)
+    for path, (start_page, end_page) in zip(files, [(0, 2), (2, 5), (5, PAGES)]):
+        expected = per_page_copy(source, start_page, end_page)
+        with fitz.open(path) as segment:
+            assert segment.page_count == expected.page_count == end_page - start_page
+            for page, old_page in zip(segment, expected):
+                assert page.get_text() == old_page.get_text()
+                assert page.rect == old_page.rect
+                assert len(page.get_images()) == len(old_page.get_images())
+        expected.close()
+    source.close()
+
+
+@pytest.fixture
+def two_part_pdf(tmp_path):
+    """Three pages; the second holds the end of one document and the start of the next"""
+    path = str(tmp_path / "mitad.pdf")
+    doc = fitz.open()
+    for page_num in range(3):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 100), f"Inicio {page_num + 1}")
+        page.insert_text((72, 600), f"Final {page_num + 1}")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def words(page):
+    return [(round(word[0]), round(word[1]), word[4]) for word in page.get_text("words")]
+
+
+def test_mid_page_split_clips_both_halves(two_part_pdf, tmp_path):
+    processor = PDFProcessor(two_part_pdf)
+    try:
+        files = processor.split_pdf([], str(tmp_path), mid_page_splits={2: 300},
+                                    original_filename="mitad.pdf", workers=1)
+    finally:
+        processor.close()
+    assert [os.path.basename(path) for path in files] == ["mitad-1-2.pdf", "mitad-2-3.pdf"]
+
+    source = fitz.open(two_part_pdf)
+    with fitz.open(files[0]) as first, fitz.open(files[1]) as second:
+        assert first.page_count == second.page_count == 2
+        # Parte superior de la página 2: de y=0 a y=300
+        assert first[1].rect == fitz.Rect(0, 0, 612, 300)
+        assert words(first[0]) == words(source[0])
+        assert [word[2] for word in words(first[1])] == ["Inicio", "2"]
+        # Parte inferior: de y=300 al final, con el contenido desplazado
+        assert second[0].rect == fitz.Rect(0, 0, 612, 492)
+        assert [word[2] for word in words(second[0])] == ["Final", "2"]
+        expected = [(x, y - 300, text) for x, y, text in words(source[1]) if y > 300]
+        assert words(second[0]) == expected
+        assert words(second[1]) == words(source[2])
+        # Cada parte conserva el contenido vectorial, no una imagen
+        assert not first[1].get_images() and not second[0].get_images()
+    source.close()
+
+
+def test_invalid_mid_page_splits_are_rejected(two_part_pdf, tmp_path):
+    processor = PDFProcessor(two_part_pdf)
+    try:
+        invalid = {0: 100, 4: 100, 1: 0, 2: 792, 3: -10}
+        assert processor._valid_mid_page_splits(invalid) == {}
+        assert processor._valid_mid_page_splits({1: 0, 2: 300}) == {2: 300}
+        # Sin cortes válidos no se escribe nada
+        assert processor.split_pdf([], str(tmp_path), mid_page_splits=invalid, workers=1) == []
+        assert os.listdir(tmp_path) == ["mitad.pdf"]
+    finally:
+        processor.close()
@@ -0,0 +1,92 @@
+import fitz
+import numpy as np
+
+from analysis_cache import AnalysisCache
+from analysis_pipeline import iter_cached_page_analysis, iter_page_analysis
+from batch_split import process_pdf, run_batch
+from benchmarks.synthetic_bundle import generate_bundle
+from feature_store import FeatureStore
+from image_analyzer import FEATURE_SOURCE_RASTER, empty_features, suggested_split_flags
+from pdf_processor import PDFProcessor
+
+
+def test_fingerprints_add_document_starts():
+    features = empty_features(4)
+    features["source"] = FEATURE_SOURCE_RASTER
+    features["height"] = 100
+    # Las páginas 1 y 3 se parecen (membrete); la 2 y la 4, no
+    features["fingerprint"] = [0, 2 ** 64 - 1, 1, 2 ** 64 - 1]
+    features["has_fingerprint"] = True
+    flags, fingerprint_only = suggested_split_flags(features)
+    assert flags.tolist() == [False, True, False, False]
+    assert fingerprint_only.tolist() == flags.tolist()
+
+
+def test_batch_suggests_the_same_pages_as_the_viewer(tmp_path):
+    pdf_path = str(tmp_path / "expediente.pdf")
+    generate_bundle(pdf_path, pages=5, seed=4)
+    entry = process_pdf(pdf_path, str(tmp_path), str(tmp_path / "salida"), suggest_only=True,
+                        use_cache=False, save_profile="default")
+    assert entry["error"] is None
+
+    # Lo que el visor calcula con los registros del análisis en segundo plano
+    features = FeatureStore(str(tmp_path / "features.npy"), 5)
+    for _ in iter_page_analysis(pdf_path, 5, workers=1, feature_path=features.path):
+        pass
+    flags, fingerprint_only = suggested_split_flags(features.array)
+    features.close()
+    assert entry["suggested_splits"] == (np.flatnonzero(flags) + 1).tolist()
+    assert entry["fingerprint_splits"] == int(np.count_nonzero(fingerprint_only))
+
+
+def test_text_and_cached_pages_get_fingerprints(tmp_path):
+    # Solo páginas de texto: la capa de texto las resuelve sin renderizarlas
+    pdf_path = str(tmp_path / "digital.pdf")
+    generate_bundle(pdf_path, pages=4, scanned_ratio=0, seed=2)
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    processor = PDFProcessor(pdf_path)
+    try:
+        first = FeatureStore(str(tmp_path / "first.npy"), 4)
+        stages = [result[3] for result in iter_cached_page_analysis(processor, "digital", cache,
+                                                                     workers=1, features=first)]
+        assert stages == ["text"] * 4
+        assert first.array["has_fingerprint"].all()
+
+        # Segunda subida: todas las páginas salen de la caché con la misma huella
+        second = FeatureStore(str(tmp_path / "second.npy"), 4)
+        stages = [result[3] for result in iter_cached_page_analysis(processor, "digital", cache,
+                                                                     workers=1, features=second)]
+        assert stages == ["cache"] * 4
+        assert second.array["has_fingerprint"].all()
+        np.testing.assert_array_equal(second.array["fingerprint"], first.array["fingerprint"])
+        first.close()
+        second.close()
+    finally:
+        processor.close()
+
+
+def test_batch_copies_pdfs_without_splits_as_one_part(tmp_path):
+    input_dir = tmp_path / "entrada"
+    input_dir.mkdir()
+    # Un escrito de tres páginas iguales, sin firmas ni sellos
+    doc = fitz.open()
+    for _ in range(3):
+        doc.new_page(width=612, height=792).insert_text((72, 100), "Escrito de alegaciones")
+    doc.save(str(input_dir / "escrito.pdf"))
+    doc.close()
+    generate_bundle(str(input_dir / "expediente.pdf"), pages=6, signature_ratio=0.5, seed=4)
+
+    output_dir = tmp_path / "salida"
+    entries = run_batch(str(input_dir), str(output_dir), jobs=1, use_cache=False)
+    assert [entry["file"] for entry in entries] == ["escrito.pdf", "expediente.pdf"]
+    assert all(entry["error"] is None for entry in entries)
+
+    unsplit, split = entries
+    assert unsplit["suggested_splits"] == [] and unsplit["unsplit"]
+    assert unsplit["outputs"] == ["escrito-1-3.pdf"]
+    with fitz.open(str(output_dir / "escrito-1-3.pdf")) as copy:
+        assert copy.page_count == 3
+    assert split["suggested_splits"] and "unsplit" not in split
+    # Una sugerencia en la última página no abre otra parte
+    inner = [page_num for page_num in split["suggested_splits"] if page_num < split["pages"]]
+    assert len(split["outputs"]) == len(inner) + 1
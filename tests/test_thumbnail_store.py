@@ -0,0 +1,57 @@
+import threading
+
+from PIL import Image
+
+from thumbnail_store import ThumbnailStore
+
+
+class SlowRenderer:
+    """Renderer that records the calling thread of every page"""
+
+    def __init__(self):
+        self.threads = {}
+        self.release = threading.Event()
+
+    def __call__(self, page_idx):
+        self.threads[page_idx] = threading.current_thread()
+        if threading.current_thread() is not threading.main_thread():
+            self.release.wait(5)
+        return Image.new("RGB", (40, 60), color="white")
+
+
+def test_prefetch_renders_missing_pages_in_background(tmp_path):
+    renderer = SlowRenderer()
+    store = ThumbnailStore(20, spill_dir=str(tmp_path), window=4, renderer=renderer)
+    try:
+        store.set_window(5)
+        visible = set(renderer.threads)
+        assert visible == {4, 5, 6, 7}
+
+        # Sin bloquear: las páginas vecinas quedan pendientes del hilo de precarga
+        store.prefetch()
+        renderer.release.set()
+        thread = store._renderer_thread
+        if thread is not None:
+            thread.join(5)
+        background = set(renderer.threads) - visible
+        assert background == {0, 1, 2, 3, 8, 9, 10, 11}
+        assert all(renderer.threads[page_idx] is not threading.main_thread() for page_idx in background)
+        assert store.on_disk[[0, 1, 2, 3, 8, 9, 10, 11]].all()
+    finally:
+        store.close()
+
+
+def test_prefetch_loads_stored_thumbnails(tmp_path):
+    store = ThumbnailStore(12, spill_dir=str(tmp_path), window=4)
+    try:
+        for page_num in range(1, 13):
+            store[page_num] = (Image.new("RGB", (40, 60), color="white"), False)
+        store.set_window(5)
+        store.prefetch()
+        misses = store.misses
+        for page_num in range(1, 13):
+            store.get_bytes(page_num)
+        assert store.misses == misses
+        assert store._renderer_thread is None
+    finally:
+        store.close()
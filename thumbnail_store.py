@@ -0,0 +1,318 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Páginas visibles a la vez en el visor
+DEFAULT_WINDOW = 4
+
+# Calidad JPEG de las miniaturas comprimidas
+THUMBNAIL_QUALITY = 80
+
+
+def encode_thumbnail(image, quality=THUMBNAIL_QUALITY):
+    """
+    Compress a thumbnail to JPEG bytes
+
+    Args:
+        image: PIL Image
+        quality: JPEG quality
+
+    Returns:
+        bytes with the encoded image
+    """
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class ThumbnailStore:
+    """
+    Disk-backed thumbnail store with a small in-memory working set
+
+    Thumbnails are compressed to JPEG files in a private spill directory
+    and only the thumbnails around the visible window (previous, current
+    and next window) are kept in memory, as encoded JPEG bytes keyed by
+    page and maximum width. The viewer passes those bytes straight to
+    ``st.image``, which serves JPEG bytes as they are instead of encoding
+    a PIL image again on every rerun. The per-page split flags are kept in
+    a NumPy boolean array, independent of the images.
+
+    The store behaves like the old ``{page_num: (image, has_signature)}``
+    dict: page numbers are 1-based. Pages without a stored thumbnail
+    (resolved by their text layer, or not analyzed yet) are rendered and
+    encoded once through ``renderer``: on first access, or ahead of time
+    in a background thread when they are next to the visible window (see
+    ``prefetch``).
+    """
+
+    def __init__(self, total_pages, spill_dir=None, window=DEFAULT_WINDOW, quality=THUMBNAIL_QUALITY,
+                 renderer=None):
+        """
+        Args:
+            total_pages: Number of pages in the document
+            spill_dir: Directory for the compressed thumbnails (a new
+                temporary directory is created when None)
+            window: Number of pages shown at once in the viewer
+            quality: JPEG quality for the spilled thumbnails
+            renderer: Callable ``renderer(page_idx)`` returning a PIL Image,
+                used for pages stored without a thumbnail
+        """
+        self.total_pages = total_pages
+        self.window = window
+        self.quality = quality
+        self.renderer = renderer
+
+        # Marcas compactas: una posición por página
+        self.flags = np.zeros(total_pages, dtype=np.bool_)
+        self.present = np.zeros(total_pages, dtype=np.bool_)
+        self.on_disk = np.zeros(total_pages, dtype=np.bool_)
+
+        if spill_dir is None:
+            spill_dir = tempfile.mkdtemp(
+                prefix="miniaturas_", dir=os.environ.get("PDF_SPLITTER_SPILL_DIR")
+            )
+        else:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = spill_dir
+
+        # Conjunto de trabajo: ventana anterior, actual y siguiente, como
+        # bytes JPEG por (página, ancho máximo)
+        self.capacity = window * 3
+        self._working = OrderedDict()
+        self._window_start = 1
+        self._max_width = None
+        self.hits = 0
+        self.misses = 0
+        self.encodes = 0
+
+        # Miniaturas que faltan en las ventanas vecinas, generadas en segundo plano
+        self._render_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = []
+        self._renderer_thread = None
+        self._closed = False
+
+        # Borrar el área de volcado cuando la sesión libere el objeto
+        self._finalizer = weakref.finalize(self, shutil.rmtree, spill_dir, True)
+
+    def _path(self, page_num):
+        return os.path.join(self.spill_dir, f"{page_num}.jpg")
+
+    def _remember(self, key, data):
+        self._working[key] = data
+        self._working.move_to_end(key)
+        while len(self._working) > self.capacity:
+            self._working.popitem(last=False)
+
+    def _write(self, page_num, data):
+        # Se escribe aparte y se renombra: el otro hilo nunca lee un archivo a medias
+        path = self._path(page_num)
+        partial = f"{path}.{threading.get_ident()}.tmp"
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, path)
+        self.on_disk[page_num - 1] = True
+
+    def _load(self, page_num):
+        """Encoded thumbnail of a page, rendering and spilling it the first time"""
+        if not self.on_disk[page_num - 1]:
+            if self.renderer is None:
+                raise KeyError(page_num)
+            # Página sin miniatura guardada: generarla y codificarla una sola
+            # vez (si el hilo de precarga ya la está generando, se espera)
+            with self._render_lock:
+                if not self.on_disk[page_num - 1]:
+                    data = encode_thumbnail(self.renderer(page_num - 1), self.quality)
+                    self.encodes += 1
+                    self._write(page_num, data)
+                    return data
+        with open(self._path(page_num), "rb") as f:
+            return f.read()
+
+    def _forget(self, page_num):
+        for key in [key for key in self._working if key[0] == page_num]:
+            del self._working[key]
+
+    def __setitem__(self, page_num, value):
+        """
+        Store a thumbnail given as a PIL Image, as already encoded JPEG
+        bytes, or as None (empty bytes) when the page was not rendered
+        """
+        image, has_signature = value
+        self.flags[page_num - 1] = bool(has_signature)
+        self.present[page_num - 1] = True
+
+        if image is None or image == b"":
+            return
+        if isinstance(image, bytes):
+            data = image
+        else:
+            data = encode_thumbnail(image, self.quality)
+            self.encodes += 1
+        self._write(page_num, data)
+        # La versión en memoria, si la había, se vuelve a leer del disco
+        self._forget(page_num)
+
+    def get_bytes(self, page_num, max_width=None):
+        """
+        Encoded JPEG thumbnail of a page, ready for ``st.image``
+
+        Works for any page of the document, analyzed or not. Thumbnails
+        wider than ``max_width`` are reduced once and kept at that size.
+
+        Args:
+            page_num: Page number (1-based)
+            max_width: Maximum width in pixels (None = stored size)
+
+        Returns:
+            bytes
+        """
+        if not 1 <= page_num <= self.total_pages:
+            raise KeyError(page_num)
+        key = (page_num, max_width)
+        data = self._working.get(key)
+        if data is not None:
+            self.hits += 1
+            self._working.move_to_end(key)
+            return data
+        self.misses += 1
+        return self._fetch(key)
+
+    def _fetch(self, key):
+        """Load a thumbnail into the working set at the given size"""
+        page_num, max_width = key
+        data = self._load(page_num)
+        if max_width is not None:
+            # Solo se lee la cabecera; la imagen se decodifica si hay que reducirla
+            image = Image.open(io.BytesIO(data))
+            if image.width > max_width:
+                image.thumbnail((max_width, image.height))
+                data = encode_thumbnail(image, self.quality)
+                self.encodes += 1
+        self._remember(key, data)
+        return data
+
+    def __getitem__(self, page_num):
+        if not self.__contains__(page_num):
+            raise KeyError(page_num)
+        return _decode(self.get_bytes(page_num)), bool(self.flags[page_num - 1])
+
+    def __contains__(self, page_num):
+        return 1 <= page_num <= self.total_pages and bool(self.present[page_num - 1])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.present))
+
+    def set_window(self, start_page, max_width=None):
+        """
+        Move the visible window and load its thumbnails
+
+        The neighbouring windows are loaded later by ``prefetch``, so the
+        visible pages can be shown first.
+
+        Args:
+            start_page: First visible page (1-based)
+            max_width: Width at which the viewer shows the thumbnails
+        """
+        self._window_start = start_page
+        self._max_width = max_width
+        last = min(self.total_pages, start_page + self.window - 1)
+        for page_num in range(start_page, last + 1):
+            self.get_bytes(page_num, max_width)
+
+    def prefetch(self):
+        """
+        Load the previous and next windows into the working set
+
+        Called after the visible window has been drawn, so navigating one
+        step in either direction does not read from disk. Only thumbnails
+        already stored are loaded here; the missing ones are rendered to
+        disk by a background thread, nearest pages first, so the viewer
+        never waits for a page it is not showing.
+        """
+        first = max(1, self._window_start - self.window)
+        last = min(self.total_pages, self._window_start + 2 * self.window - 1)
+        visible = range(self._window_start, self._window_start + self.window)
+        missing = []
+        # Se recorren de forma que la ventana visible siga siendo la más reciente del LRU
+        for page_num in range(first, last + 1):
+            if page_num in visible or (page_num, self._max_width) in self._working:
+                continue
+            if self.on_disk[page_num - 1]:
+                self._fetch((page_num, self._max_width))
+            elif self.renderer is not None:
+                missing.append(page_num)
+        for page_num in visible:
+            if (page_num, self._max_width) in self._working:
+                self._working.move_to_end((page_num, self._max_width))
+        missing.sort(key=lambda page_num: abs(page_num - self._window_start))
+        self._render_in_background(missing)
+
+    def _render_in_background(self, pages):
+        """Replace the pages waiting to be rendered and start the thread if needed"""
+        with self._pending_lock:
+            # Las páginas pedidas por una ventana anterior ya no interesan
+            self._pending = list(pages)
+            if self._pending and self._renderer_thread is None and not self._closed:
+                self._renderer_thread = threading.Thread(
+                    target=self._render_pending, name="miniaturas", daemon=True
+                )
+                self._renderer_thread.start()
+
+    def _render_pending(self):
+        while True:
+            with self._pending_lock:
+                if not self._pending or self._closed:
+                    self._renderer_thread = None
+                    return
+                page_num = self._pending.pop(0)
+            try:
+                self._load(page_num)
+            except Exception as e:
+                print(f"Error al generar la miniatura de la página {page_num}: {str(e)}")
+
+    def stats(self):
+        """Hits and misses of the viewer's lookups, thumbnails encoded and working set size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "encodes": self.encodes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._working),
+            "bytes": sum(len(data) for data in self._working.values()),
+        }
+
+    def set_flags(self, flags):
+        """Replace the split flags of every page (e.g. after retuning the detector)"""
+        self.flags[:] = flags
+
+    def suggested_pages(self):
+        """Return the set of pages (1-based) flagged as split points"""
+        return set((np.flatnonzero(self.flags) + 1).tolist())
+
+    def close(self):
+        """Stop the background rendering, release the working set and delete the spill directory"""
+        with self._pending_lock:
+            self._closed = True
+            self._pending = []
+            thread = self._renderer_thread
+        if thread is not None:
+            thread.join()
+        self._working.clear()
+        self._finalizer()
+
+
+def _decode(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
@@ -0,0 +1,66 @@
+import hashlib
+import tempfile
+import time
+
+import metrics
+
+# Tamaño de cada bloque copiado a disco (8 MB)
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def ingest_upload(uploaded_file, dest_dir=None, chunk_size=CHUNK_SIZE):
+    """
+    Copy an uploaded file to disk in fixed-size chunks while hashing it
+
+    Unlike ``uploaded_file.getvalue()``, only one chunk at a time is copied
+    into the Python heap, so a large upload is never duplicated in memory.
+
+    Args:
+        uploaded_file: File-like object returned by ``st.file_uploader``
+        dest_dir: Directory for the copy (system temp directory when None)
+        chunk_size: Number of bytes copied per read
+
+    Returns:
+        Tuple (path, sha256_hex) with the path of the copy on disk and the
+        SHA-256 digest of its content
+    """
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    started = time.perf_counter()
+    size = 0
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', dir=dest_dir) as tmp:
+        while True:
+            chunk = uploaded_file.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            tmp.write(chunk)
+            size += len(chunk)
+        path = tmp.name
+
+    uploaded_file.seek(0)
+    metrics.observe("pdf_upload_ingest_seconds", time.perf_counter() - started)
+    metrics.inc("pdf_upload_bytes_total", size)
+    return path, digest.hexdigest()
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """
+    SHA-256 digest of a file on disk, read in fixed-size chunks
+
+    Args:
+        path: Path of the file
+        chunk_size: Number of bytes read at a time
+
+    Returns:
+        Hex digest string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,49 @@
+import os
+import time
+import zipfile
+
+import metrics
+
+# Métodos de compresión disponibles para el archivo ZIP
+COMPRESSION_METHODS = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+}
+
+
+def export_zip(file_paths, archive_path, compression="stored"):
+    """
+    Write the split PDFs into a ZIP archive on disk
+
+    Each file is streamed from disk into the archive in chunks, so memory
+    use does not depend on the size of the files. PDF content streams are
+    usually compressed already, so ``"stored"`` is the fastest choice and
+    produces archives of almost the same size.
+
+    Args:
+        file_paths: List of paths of the files to include
+        archive_path: Path of the ZIP file to create
+        compression: ``"stored"`` or ``"deflated"``
+
+    Returns:
+        Dict with ``path``, ``bytes`` (archive size) and ``seconds``
+    """
+    if compression not in COMPRESSION_METHODS:
+        raise ValueError(f"Compresión no soportada: {compression}")
+
+    started = time.perf_counter()
+    with zipfile.ZipFile(archive_path, "w", COMPRESSION_METHODS[compression]) as zip_file:
+        for file_path in file_paths:
+            zip_file.write(file_path, arcname=os.path.basename(file_path))
+
+    result = {
+        "path": archive_path,
+        "bytes": os.path.getsize(archive_path),
+        "seconds": time.perf_counter() - started,
+    }
+    metrics.observe("pdf_zip_export_seconds", result["seconds"], compression=compression)
+    metrics.inc("pdf_zip_bytes_total", result["bytes"], compression=compression)
+    metrics.log_event("zip_export", files=len(file_paths), compression=compression,
+                      bytes=result["bytes"], seconds=result["seconds"])
+    metrics.flush()
+    return result